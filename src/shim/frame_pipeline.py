@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import time
+
+import cv2
+import numpy as np
+
+# The processing path works on 16-bit luma end to end. 8-bit captures are
+# widened with x257 so that 0xFF maps to 0xFFFF exactly.
+LUT_SIZE = 65536
+LUMA8_TO_16 = 257
+
+
+def build_display_lut(contrast=1.0, brightness=0.0, gamma=1.0, black=0, white=65535):
+    """
+    Build the 65536-entry uint16 -> uint8 display LUT.
+
+    black/white select the input window, contrast scales around mid-grey,
+    brightness is an offset in normalised units (-1..1) and gamma is applied
+    last, so the only 8-bit quantisation in the pipeline happens here.
+    """
+    x = np.arange(LUT_SIZE, dtype=np.float32)
+    x -= black
+    x *= 1.0 / max(white - black, 1)
+    x -= 0.5
+    x *= contrast
+    x += 0.5 + brightness
+    np.clip(x, 0.0, 1.0, out=x)
+    if gamma != 1.0:
+        np.power(x, 1.0 / gamma, out=x)
+    x *= 255.0
+    x += 0.5
+    return x.astype(np.uint8)
+
+
+def to_luma16(frame, width=None, height=None):
+    """
+    Extract luma from a captured frame as a 2-D uint16 array.
+
+    Handles raw YUYV (h, w, 2), BGR, 8/16-bit grey and the flat 1-row buffer
+    OpenCV returns for Y16 when CONVERT_RGB is off. Returns None for anything
+    else.
+    """
+    if frame is None:
+        return None
+
+    if frame.ndim == 2 and frame.shape[0] == 1 and width and height:
+        # Raw Y16 buffer (little-endian, one sample per pixel)
+        if frame.dtype == np.uint8 and frame.size == width * height * 2:
+            return frame.view("<u2").reshape(height, width)
+
+    if frame.ndim == 2:
+        if frame.dtype == np.uint16:
+            return frame
+        if frame.dtype == np.uint8:
+            return np.multiply(frame, LUMA8_TO_16, dtype=np.uint16)
+        return None
+
+    if frame.ndim == 3 and frame.shape[2] == 2:
+        gray = cv2.cvtColor(frame, cv2.COLOR_YUV2GRAY_YUY2)
+    elif frame.ndim == 3 and frame.shape[2] == 3:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    else:
+        return None
+
+    if gray.dtype == np.uint16:
+        return gray
+    return np.multiply(gray, LUMA8_TO_16, dtype=np.uint16)
+
+
+def to_uint16(frame):
+    """Round an integrated float32 frame back to uint16 (for export)."""
+    if frame.dtype == np.uint16:
+        return frame
+    return np.clip(frame + 0.5, 0, LUT_SIZE - 1).astype(np.uint16)
+
+
+def export_tiff16(path, frame):
+    """Write an integrated frame as a lossless 16-bit grey TIFF."""
+    return cv2.imwrite(path, to_uint16(frame))
+
+
+class FramePipeline:
+    """
+    16-bit integration and display mapping for the shim.
+
+    integrate() keeps a float32 running average (slow scan); to_display()
+    maps either a uint16 frame or the float accumulator through the display
+    LUT. The LUT is only rebuilt when the tone settings change.
+    """
+
+    def __init__(self, alpha=0.1, contrast=1.0, brightness=0.0, gamma=1.0):
+        self.alpha = alpha
+        self.contrast = contrast
+        self.brightness = brightness
+        self.gamma = gamma
+        self.black = 0
+        self.white = LUT_SIZE - 1
+        self.accum_buffer = None
+        self.lut = build_display_lut(contrast, brightness, gamma)
+
+    def _rebuild_lut(self):
+        self.lut = build_display_lut(
+            self.contrast, self.brightness, self.gamma, self.black, self.white
+        )
+
+    def set_tone(self, contrast=None, brightness=None, gamma=None):
+        if contrast is not None:
+            self.contrast = contrast
+        if brightness is not None:
+            self.brightness = brightness
+        if gamma is not None:
+            self.gamma = gamma
+        self._rebuild_lut()
+
+    def set_levels(self, black=0, white=LUT_SIZE - 1):
+        """Set the input window mapped onto the display range (ACB)."""
+        if (black, white) == (self.black, self.white):
+            return
+        self.black = black
+        self.white = white
+        self._rebuild_lut()
+
+    def reset(self):
+        self.accum_buffer = None
+
+    def integrate(self, luma16):
+        if self.accum_buffer is None or self.accum_buffer.shape != luma16.shape:
+            self.accum_buffer = luma16.astype(np.float32)
+        else:
+            cv2.accumulateWeighted(luma16, self.accum_buffer, self.alpha)
+        return self.accum_buffer
+
+    def quantize(self, frame):
+        """The uint16 frame to_display() maps (what the recorder stores)."""
+        if frame.dtype != np.uint16:
+            # Accumulator values are a weighted mean of uint16 samples, so
+            # they are already in range; truncation costs < 1 LSB of 16 bits.
+            frame = frame.astype(np.uint16)
+        return frame
+
+    def to_display(self, frame):
+        return np.take(self.lut, self.quantize(frame))
+
+
+class AutoContrast:
+    """
+    Live auto contrast/brightness (ACB).
+
+    Each frame contributes a 256-bin histogram of a strided view (every
+    step-th row and column, 1/16 of the pixels at step=4) which is blended
+    into a running histogram. The black/white points are the clip_low /
+    clip_high percentiles of that running histogram; update() only returns
+    new levels when one of them moves by more than `hysteresis` bins, so the
+    display LUT is rebuilt on real scene changes rather than on noise.
+    """
+
+    BINS = 256
+    BIN_WIDTH = LUT_SIZE // BINS
+
+    def __init__(self, step=4, smoothing=0.25, clip_low=0.005, clip_high=0.995,
+                 hysteresis=2):
+        self.step = step
+        self.smoothing = smoothing
+        self.clip_low = clip_low
+        self.clip_high = clip_high
+        self.hysteresis = hysteresis
+        self.hist = None
+        self.levels = (0, LUT_SIZE - 1)
+        self._bins = (0, self.BINS - 1)
+
+    def reset(self):
+        self.hist = None
+        self.levels = (0, LUT_SIZE - 1)
+        self._bins = (0, self.BINS - 1)
+
+    def update(self, frame16):
+        """Feed one frame; returns (black, white) when the levels change."""
+        view = frame16[:: self.step, :: self.step]
+        hist = cv2.calcHist([view], [0], None, [self.BINS], [0, LUT_SIZE]).ravel()
+        if self.hist is None:
+            self.hist = hist
+        else:
+            # In-place EMA: hist += s * (new - hist)
+            hist -= self.hist
+            hist *= self.smoothing
+            self.hist += hist
+
+        cdf = np.cumsum(self.hist)
+        total = cdf[-1]
+        if total <= 0:
+            return None
+        lo = int(np.searchsorted(cdf, total * self.clip_low))
+        hi = int(np.searchsorted(cdf, total * self.clip_high))
+        if hi <= lo:
+            hi = min(lo + 1, self.BINS - 1)
+
+        old_lo, old_hi = self._bins
+        if abs(lo - old_lo) <= self.hysteresis and abs(hi - old_hi) <= self.hysteresis:
+            return None
+        self._bins = (lo, hi)
+        self.levels = (lo * self.BIN_WIDTH, (hi + 1) * self.BIN_WIDTH - 1)
+        return self.levels
+
+
+def bench_acb(width=640, height=480, iterations=500, step=4):
+    """
+    Time ACB per frame (histogram + level update + any LUT rebuild) on a
+    synthetic 16-bit scene whose exposure drifts so the levels keep moving.
+    """
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = 0.5 + 0.25 * np.sin(xx / 23.0) * np.cos(yy / 31.0)
+    pipeline = FramePipeline()
+    acb = AutoContrast(step=step)
+
+    frames = []
+    for i in range(16):
+        gain = 0.4 + 0.5 * (i / 15.0)
+        noisy = base * gain + rng.normal(0, 0.03, base.shape).astype(np.float32)
+        frames.append((np.clip(noisy, 0, 1) * 65535).astype(np.uint16))
+
+    times = np.empty(iterations, dtype=np.float64)
+    rebuilds = 0
+    for i in range(iterations):
+        frame = frames[(i // 8) % len(frames)]
+        t0 = time.perf_counter_ns()
+        levels = acb.update(frame)
+        if levels is not None:
+            pipeline.set_levels(*levels)
+            rebuilds += 1
+        times[i] = time.perf_counter_ns() - t0
+
+    times /= 1e6
+    print(f"ACB {width}x{height} step={step}, {iterations} frames:")
+    print(
+        f"  mean {times.mean():.3f} ms  p50 {np.percentile(times, 50):.3f} ms  "
+        f"p99 {np.percentile(times, 99):.3f} ms  max {times.max():.3f} ms"
+    )
+    print(f"  LUT rebuilds: {rebuilds}")
+    return times
+
+
+if __name__ == "__main__":
+    bench_acb()
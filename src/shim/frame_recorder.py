@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+import os
+import queue
+import threading
+
+import numpy as np
+
+# index.csv columns, one row per frame. Offsets are byte offsets into the
+# chunk file, so any frame can be read back with a single seek + read.
+INDEX_COLUMNS = (
+    "frame",
+    "chunk",
+    "offset",
+    "width",
+    "height",
+    "dtype",
+    "t_mono_ns",
+    "t_dev_ms",
+    "mag",
+    "accv",
+    "speed",
+    "scanning",
+)
+
+
+class FrameRecorder:
+    """
+    Lossless recorder for the shim's integrated frames (uint16, before the
+    display LUT, so a replay can be tone-mapped afresh).
+
+    Frames are appended unmodified to raw chunk files (chunk_00000.raw, ...)
+    by a background thread, with one index.csv row per frame carrying the
+    capture timestamps and the IPC state at capture time. submit() never
+    blocks: when the writer falls behind the bounded queue fills up and the
+    frame is counted as dropped instead of stalling capture. If the writer
+    fails (disk full, unwritable out_dir) `error` is set and submit()
+    refuses further frames.
+    """
+
+    def __init__(self, out_dir, chunk_bytes=256 * 1024 * 1024, queue_size=64):
+        self.out_dir = out_dir
+        self.chunk_bytes = chunk_bytes
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.error = None
+        self._thread = None
+        self._chunk_no = -1
+        self._chunk_file = None
+        self._chunk_pos = 0
+        self._index_file = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.error = None
+        os.makedirs(self.out_dir, exist_ok=True)
+        self._index_file = open(os.path.join(self.out_dir, "index.csv"), "w")
+        self._index_file.write(",".join(INDEX_COLUMNS) + "\n")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print(f"[Recorder] Recording to {self.out_dir}")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        # The sentinel must get through even when the queue is full, but a
+        # writer that already died drains nothing: never block on it.
+        while self._thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        self._thread = None
+        print(
+            f"[Recorder] Stopped: {self.frames_written} frames written, "
+            f"{self.frames_dropped} dropped"
+        )
+
+    def submit(self, frame, t_mono_ns, t_dev_ms=0.0, mag=None, accv=None,
+               speed=None, scanning=False):
+        """Queue a frame for writing. Returns False if it had to be dropped."""
+        if self._thread is None or self.error is not None:
+            return False
+        try:
+            self.queue.put_nowait(
+                (frame, t_mono_ns, t_dev_ms, mag, accv, speed, scanning)
+            )
+        except queue.Full:
+            self.frames_dropped += 1
+            return False
+        return True
+
+    def _open_next_chunk(self):
+        if self._chunk_file:
+            self._chunk_file.close()
+        self._chunk_no += 1
+        path = os.path.join(self.out_dir, f"chunk_{self._chunk_no:05d}.raw")
+        self._chunk_file = open(path, "wb")
+        self._chunk_pos = 0
+
+    def _run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                self._write_frame(*item)
+        except Exception as e:
+            self.error = e
+            print(f"[Recorder] Writer error: {e}")
+        finally:
+            if self._chunk_file:
+                self._chunk_file.close()
+                self._chunk_file = None
+            if self._index_file:
+                self._index_file.close()
+                self._index_file = None
+
+    def _write_frame(self, frame, t_mono_ns, t_dev_ms, mag, accv, speed, scanning):
+        frame = np.ascontiguousarray(frame)
+        if self._chunk_file is None or (
+            self._chunk_pos > 0 and self._chunk_pos + frame.nbytes > self.chunk_bytes
+        ):
+            self._open_next_chunk()
+
+        h, w = frame.shape[:2]
+        offset = self._chunk_pos
+        self._chunk_file.write(frame.data)
+        self._chunk_pos += frame.nbytes
+
+        row = (
+            self.frames_written,
+            self._chunk_no,
+            offset,
+            w,
+            h,
+            frame.dtype.str,
+            t_mono_ns,
+            f"{t_dev_ms:.3f}",
+            "" if mag is None else mag,
+            "" if accv is None else accv,
+            "" if speed is None else speed,
+            int(bool(scanning)),
+        )
+        self._index_file.write(",".join(str(v) for v in row) + "\n")
+        self.frames_written += 1
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import csv
+import os
+
+import cv2
+import numpy as np
+
+# Every source duck-types the small part of cv2.VideoCapture the shim uses:
+# isOpened(), read() -> (ok, frame), get(prop), set(prop, value), release().
+# `fps` is the nominal frame rate (None = let the shim pick its refresh rate).
+
+
+class V4L2Source:
+    """Capture card via OpenCV's V4L2 backend (the shim's original path)."""
+
+    def __init__(self, index=0, width=640, height=480, fourcc="YUYV"):
+        self.name = f"/dev/video{index}"
+        self.fps = None
+        self.cap = cv2.VideoCapture(index, cv2.CAP_V4L2)
+        # Try to set resolution (standard NTSC/PAL is 720x480 or 640x480)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        return self.cap.read()
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+
+class RawReplaySource:
+    """
+    Replays a FrameRecorder directory (index.csv + chunk_*.raw).
+
+    Recorded frames are already integrated (uint16, before the display
+    LUT), so `integrated` tells the shim to skip integration and only tone
+    map them. Older recordings hold 8-bit display frames, which the shim
+    shows as they are.
+    """
+
+    # Frames are the pipeline's integrated output, not raw captures.
+    integrated = True
+
+    def __init__(self, rec_dir, fps=None, loop=True):
+        self.name = rec_dir
+        self.fps = fps
+        self.loop = loop
+        self.pos = 0
+        self.rows = []
+        self.chunks = {}
+        index_path = os.path.join(rec_dir, "index.csv")
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, newline="") as f:
+            for row in csv.DictReader(f):
+                self.rows.append(
+                    (
+                        int(row["chunk"]),
+                        int(row["offset"]),
+                        int(row["width"]),
+                        int(row["height"]),
+                        np.dtype(row["dtype"]),
+                        float(row["t_dev_ms"] or 0.0),
+                    )
+                )
+        for chunk in {r[0] for r in self.rows}:
+            path = os.path.join(rec_dir, f"chunk_{chunk:05d}.raw")
+            self.chunks[chunk] = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def isOpened(self):
+        return bool(self.rows)
+
+    def read(self):
+        if self.pos >= len(self.rows):
+            if not self.loop or not self.rows:
+                return False, None
+            self.pos = 0
+        chunk, offset, w, h, dtype, _ = self.rows[self.pos]
+        self.pos += 1
+        nbytes = w * h * dtype.itemsize
+        buf = self.chunks[chunk][offset : offset + nbytes]
+        return True, np.frombuffer(buf, dtype=dtype).reshape(h, w)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC and self.pos > 0:
+            return self.rows[self.pos - 1][5]
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.pos)
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.chunks = {}
+
+
+class FileReplaySource:
+    """Replays a video file or image sequence through cv2.VideoCapture."""
+
+    def __init__(self, path, fps=None, loop=True):
+        self.name = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        file_fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0
+        self.fps = fps or (file_fps if file_fps > 0 else None)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def get(self, prop):
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return self.cap.set(prop, value)
+
+    def release(self):
+        self.cap.release()
+
+
+class SyntheticSource:
+    """
+    SEM-like test pattern: a textured specimen drifting across the field,
+    per-line gain jitter (scan lines) and additive detector noise.
+
+    The texture and a small pool of noise fields are generated once, so
+    read() costs a few slices and adds rather than a fresh RNG draw per
+    pixel. Output is raw YUYV (h, w, 2) by default to exercise the same
+    conversion path as the capture card; "gray" and "y16" are also
+    available.
+    """
+
+    NOISE_POOL = 8
+
+    def __init__(self, width=640, height=480, fps=30.0, fmt="yuyv", noise=0.04,
+                 drift=(1.5, 0.7), seed=0):
+        self.name = f"synthetic {width}x{height}@{fps:g} {fmt}"
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fmt = fmt
+        self.drift = drift
+        self.frame_no = 0
+        rng = np.random.default_rng(seed)
+
+        # Specimen: blurred grain + bright particles with edge highlights,
+        # twice the field size so the drift can wrap without seams.
+        th, tw = height * 2, width * 2
+        grain = cv2.GaussianBlur(
+            rng.random((th, tw), dtype=np.float32), (0, 0), sigmaX=6
+        )
+        grain = (grain - grain.min()) / max(float(np.ptp(grain)), 1e-6)
+        particles = np.zeros((th, tw), np.float32)
+        for _ in range(int(th * tw / 4000)):
+            center = (int(rng.integers(tw)), int(rng.integers(th)))
+            radius = int(rng.integers(3, 18))
+            cv2.circle(particles, center, radius, 1.0, -1)
+        edges = cv2.Laplacian(cv2.GaussianBlur(particles, (0, 0), 1.5), cv2.CV_32F)
+        texture = 0.35 + 0.3 * grain + 0.25 * particles + 0.8 * np.abs(edges)
+        self.texture = np.clip(texture, 0.0, 1.0).astype(np.float32)
+
+        self.noise_pool = [
+            rng.normal(0.0, noise, (height, width)).astype(np.float32)
+            for _ in range(self.NOISE_POOL)
+        ]
+        self.line_gain = [
+            (1.0 + rng.normal(0.0, 0.02, (height, 1))).astype(np.float32)
+            for _ in range(self.NOISE_POOL)
+        ]
+        self._chroma = np.full((height, width), 128, np.uint8)
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        i = self.frame_no
+        self.frame_no += 1
+        ox = int(i * self.drift[0]) % self.width
+        oy = int(i * self.drift[1]) % self.height
+        img = self.texture[oy : oy + self.height, ox : ox + self.width]
+        img = img * self.line_gain[i % self.NOISE_POOL]
+        img += self.noise_pool[(i * 3) % self.NOISE_POOL]
+        np.clip(img, 0.0, 1.0, out=img)
+
+        if self.fmt == "y16":
+            return True, (img * 65535.0).astype(np.uint16)
+        gray = (img * 255.0).astype(np.uint8)
+        if self.fmt == "gray":
+            return True, gray
+        return True, np.dstack((gray, self._chroma))
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return max(self.frame_no - 1, 0) * 1000.0 / self.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.frame_no)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+def open_source(spec="v4l2", width=640, height=480, fourcc="YUYV", fps=None):
+    """
+    Open a frame source from a spec string:
+
+        v4l2[:N]              capture card /dev/videoN (default 0)
+        synthetic[:FMT]       test pattern, FMT = yuyv | gray | y16
+        replay:PATH           FrameRecorder directory or video file
+    """
+    kind, _, arg = spec.partition(":")
+    if kind == "v4l2":
+        return V4L2Source(int(arg or 0), width, height, fourcc)
+    if kind == "synthetic":
+        return SyntheticSource(width, height, fps or 30.0, fmt=arg or "yuyv")
+    if kind == "replay":
+        if os.path.isdir(arg):
+            return RawReplaySource(arg, fps=fps)
+        return FileReplaySource(arg, fps=fps)
+    raise ValueError(f"Unknown video source: {spec}")
@@ -1,16 +1,36 @@
 #!/usr/bin/env python3
+import argparse
+import os
 import sys
+import time
+from datetime import datetime
 import zmq
 import cv2
 import numpy as np
 import json
 from PyQt6.QtWidgets import QApplication, QMainWindow, QLabel, QVBoxLayout, QWidget
-from PyQt6.QtCore import QTimer, Qt
+from PyQt6.QtCore import QSocketNotifier, QTimer, Qt
 from PyQt6.QtGui import QImage, QPixmap, QPainter, QColor, QFont
 
+from frame_pipeline import AutoContrast, FramePipeline, export_tiff16, to_luma16
+from frame_recorder import FrameRecorder
+from frame_sources import open_source
+
 
 class SEMVideoShim(QMainWindow):
-    def __init__(self):
+    def __init__(
+        self,
+        record_dir=None,
+        source="v4l2",
+        fps=None,
+        width=640,
+        height=480,
+        fourcc="YUYV",
+        contrast=1.0,
+        brightness=0.0,
+        gamma=1.0,
+        acb=False,
+    ):
         super().__init__()
         self.setWindowTitle("JEOL SEM - Linux Video Shim")
         self.resize(800, 640)
@@ -33,12 +53,16 @@ class SEMVideoShim(QMainWindow):
         self.is_scanning = False
         self.micron_bar_width_px = 0
         self.micron_text = "10um"
+        self.ht_mode = None
+        self.ht_state = None
         self.last_display_frame = None
+        self.last_frame16 = None
         self.base_fov_um_at_1k = 120.0
 
         # --- IPC (ZeroMQ SUB) ---
         self.zmq_ctx = zmq.Context()
         self.zmq_sub = self.zmq_ctx.socket(zmq.SUB)
+        self.ipc_notifier = None
         try:
             self.zmq_sub.connect("tcp://127.0.0.1:5556")
             self.zmq_sub.setsockopt_string(zmq.SUBSCRIBE, "")
@@ -47,109 +71,193 @@ class SEMVideoShim(QMainWindow):
             print(f"[Shim] IPC Connection failed: {e}")
 
         # --- Video Capture ---
-        # Open /dev/video0.
-        # Note: We prefer YUYV or MJPEG.
-        self.cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
+        # Default is /dev/video0 (we prefer YUYV or MJPEG; Y16 keeps the full
+        # ADC depth). See frame_sources.open_source() for replay/synthetic.
+        self.cap_width = width
+        self.cap_height = height
+        self.cap = open_source(source, width, height, fourcc, fps)
         if not self.cap.isOpened():
-            self.video_label.setText("Error: No Camera (/dev/video0)")
+            self.video_label.setText(f"Error: No video source ({self.cap.name})")
+        print(f"[Shim] Video source: {self.cap.name}")
 
-        # Try to set resolution (standard NTSC/PAL is 720x480 or 640x480)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
-        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"YUYV"))
+        # Per-stage timings (ns) collected while benchmarking, else None.
+        self.profile = None
 
-        # Buffer for integration (Slow Scan)
-        self.accum_buffer = None
-        self.alpha = 0.1  # Integration factor
+        # 16-bit integration (Slow Scan) + display LUT
+        self.pipeline = FramePipeline(
+            alpha=0.1, contrast=contrast, brightness=brightness, gamma=gamma
+        )
+        self.snapshot_root = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "snapshots"
+        )
 
-        # --- Timers ---
-        # IPC Polling (Check often)
-        self.ipc_timer = QTimer()
-        self.ipc_timer.timeout.connect(self.check_ipc)
-        self.ipc_timer.start(50)
+        # Auto contrast/brightness ('A' toggles)
+        self.acb = AutoContrast()
+        self.acb_enabled = acb
 
-        # Video Refresh (~30 FPS)
+        # --- Recording ---
+        # 'R' toggles recording into a timestamped directory under recordings/.
+        self.recorder = None
+        self.record_root = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "recordings"
+        )
+        if record_dir:
+            self.start_recording(record_dir)
+
+        # --- IPC Wakeups ---
+        # The ZMQ_FD is edge-triggered: Qt wakes us when the socket *may* have
+        # become readable, and check_ipc() then drains until ZMQ_EVENTS says the
+        # queue is empty. No timer, so an idle shim never wakes up.
+        ipc_fd = self.zmq_sub.getsockopt(zmq.FD)
+        self.ipc_notifier = QSocketNotifier(ipc_fd, QSocketNotifier.Type.Read, self)
+        self.ipc_notifier.activated.connect(self.check_ipc)
+        # Messages queued before the notifier existed won't raise a new edge.
+        self.check_ipc()
+
+        # --- Timers ---
+        # Video Refresh (~30 FPS, or the source's nominal rate)
         self.video_timer = QTimer()
         self.video_timer.timeout.connect(self.update_frame)
-        self.video_timer.start(33)
+        self.video_timer.start(int(1000 / self.cap.fps) if self.cap.fps else 33)
 
-    def check_ipc(self):
+    def check_ipc(self, *_):
+        if self.ipc_notifier is not None:
+            self.ipc_notifier.setEnabled(False)
         try:
-            while True:
+            while self.zmq_sub.getsockopt(zmq.EVENTS) & zmq.POLLIN:
                 # Non-blocking receive
-                msg_bytes = self.zmq_sub.recv(flags=zmq.NOBLOCK)
-                msg = json.loads(msg_bytes.decode("utf-8"))
-
-                event = msg.get("event")
-                value = msg.get("value")
-
-                if event == "MAG":
-                    self.current_mag = value
-                    print(f"[Shim] Mag changed: x{value}")
-                elif event == "ACCV":
-                    self.current_accv = value
-                    print(f"[Shim] Accv changed: {value / 1000} kV")
-                elif event == "SPEED":
-                    if value is not None:
-                        self.scan_speed = value
-                        print(f"[Shim] Speed changed: {value}")
-                elif event == "SCAN_STATUS":
-                    self.is_scanning = bool(value)
-                    print(f"[Shim] Scan: {self.is_scanning}")
-                elif event == "HT_MODE":
-                    self.ht_mode = value
-                    print(f"[Shim] HT Mode: {value}")
-                elif event == "HT_STATE":
-                    self.ht_state = value
-                    print(f"[Shim] HT State: {value}")
-
-        except zmq.Again:
-            pass
-        except Exception as e:
+                try:
+                    msg_bytes = self.zmq_sub.recv(flags=zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                # A bad message is skipped, not the rest of the queue: the
+                # edge-triggered FD would not wake us for what is left.
+                try:
+                    self.handle_ipc_message(json.loads(msg_bytes.decode("utf-8")))
+                except Exception as e:
+                    print(f"[Shim] IPC Error: {e} in {msg_bytes[:200]!r}")
+        except zmq.ZMQError as e:
             print(f"[Shim] IPC Error: {e}")
+        finally:
+            if self.ipc_notifier is not None:
+                self.ipc_notifier.setEnabled(True)
+
+    def handle_ipc_message(self, msg):
+        event = msg.get("event")
+        value = msg.get("value")
+
+        if event == "MAG":
+            self.current_mag = value
+            print(f"[Shim] Mag changed: x{value}")
+        elif event == "ACCV":
+            self.current_accv = value
+            print(f"[Shim] Accv changed: {value / 1000} kV")
+        elif event == "SPEED":
+            if value is not None:
+                self.scan_speed = value
+                print(f"[Shim] Speed changed: {value}")
+        elif event == "SCAN_STATUS":
+            self.is_scanning = bool(value)
+            print(f"[Shim] Scan: {self.is_scanning}")
+        elif event == "HT_MODE":
+            self.ht_mode = value
+            print(f"[Shim] HT Mode: {value}")
+        elif event == "HT_STATE":
+            self.ht_state = value
+            print(f"[Shim] HT State: {value}")
 
     def update_frame(self):
         if not self.cap.isOpened():
             return
 
         ret, frame = self.cap.read()
-        if not ret:
+        if not ret or frame is None:
             return
-
-        # --- 1. Grayscale Conversion (Luma Extraction) ---
-        # Try to interpret raw YUYV when available; fallback to BGR->GRAY.
-        if frame is None:
-            return
-
-        gray = None
-        if len(frame.shape) == 2:
-            gray = frame
-        elif len(frame.shape) == 3 and frame.shape[2] == 2:
-            gray = cv2.cvtColor(frame, cv2.COLOR_YUV2GRAY_YUY2)
-        elif len(frame.shape) == 3 and frame.shape[2] == 3:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        else:
-            return
-
-        # --- 2. Image Processing (Integration) ---
-        display_frame = gray
+        # Host monotonic time at dequeue plus the V4L2 buffer timestamp the
+        # driver stamped at capture.
+        t_capture_ns = time.monotonic_ns()
+        t_device_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+
+        display_frame = self.process_frame(frame, t_capture_ns, t_device_ms)
+        if display_frame is not None:
+            self.render_frame(display_frame)
+
+    def _profile_mark(self, stage, t0):
+        t1 = time.perf_counter_ns()
+        self.profile.setdefault(stage, []).append(t1 - t0)
+        return t1
+
+    def process_frame(self, frame, t_capture_ns=0, t_device_ms=0.0):
+        """Luma extraction, integration and display mapping; returns uint8."""
+        profiling = self.profile is not None
+        t0 = time.perf_counter_ns() if profiling else 0
+
+        # A recording replays frames that already went through the pipeline:
+        # uint16 integrated frames only get the display LUT, and old 8-bit
+        # recordings (display frames) are shown as they are.
+        replayed = getattr(self.cap, "integrated", False)
+        if replayed and frame.dtype == np.uint8 and frame.ndim == 2:
+            self.last_display_frame = frame
+            return frame
+
+        # --- 1. Luma Extraction (16-bit) ---
+        # Raw YUYV, Y16 or BGR; 8-bit sources are widened to 16 bits.
+        luma = to_luma16(frame, self.cap_width, self.cap_height)
+        if luma is None:
+            return None
+        if profiling:
+            t0 = self._profile_mark("convert", t0)
+
+        # --- 2. Image Processing (Integration, float32) ---
+        frame16 = luma
         is_slow = self.scan_speed >= 2
 
-        if is_slow and self.is_scanning:
-            if self.accum_buffer is None or self.accum_buffer.shape != gray.shape:
-                self.accum_buffer = gray.astype(np.float32)
-            else:
-                cv2.accumulateWeighted(gray, self.accum_buffer, self.alpha)
-
-            display_frame = cv2.convertScaleAbs(self.accum_buffer)
+        if replayed:
+            pass  # integrated when it was recorded
+        elif is_slow and self.is_scanning:
+            frame16 = self.pipeline.integrate(luma)
         else:
             if not is_slow:
-                self.accum_buffer = None
-            elif not self.is_scanning and self.last_display_frame is not None:
-                display_frame = self.last_display_frame
+                self.pipeline.reset()
+            elif not self.is_scanning and self.last_frame16 is not None:
+                frame16 = self.last_frame16
+
+        self.last_frame16 = frame16
 
+        if self.acb_enabled:
+            levels = self.acb.update(frame16)
+            if levels is not None:
+                self.pipeline.set_levels(*levels)
+        if profiling:
+            t0 = self._profile_mark("integrate", t0)
+
+        # Quantise to 8 bits only here, through the display LUT.
+        display_frame = self.pipeline.to_display(frame16)
         self.last_display_frame = display_frame
+        if profiling:
+            t0 = self._profile_mark("display_lut", t0)
+
+        if self.recorder is not None and self.recorder.failed:
+            print(f"[Shim] Recording stopped: {self.recorder.error}")
+            self.stop_recording()
+        if self.recorder is not None:
+            # The integrated frame before the LUT: lossless, and a replay
+            # only has to tone-map it.
+            self.recorder.submit(
+                self.pipeline.quantize(frame16),
+                t_capture_ns,
+                t_device_ms,
+                mag=self.current_mag,
+                accv=self.current_accv,
+                speed=self.scan_speed,
+                scanning=self.is_scanning,
+            )
+
+        return display_frame
+
+    def render_frame(self, display_frame):
+        profiling = self.profile is not None
+        t0 = time.perf_counter_ns() if profiling else 0
 
         # --- 3. Convert to QImage ---
         h, w = display_frame.shape
@@ -160,12 +268,70 @@ class SEMVideoShim(QMainWindow):
         painter = QPainter(pixmap)
         self.draw_overlay(painter, w, h)
         painter.end()
+        if profiling:
+            t0 = self._profile_mark("overlay", t0)
 
         # --- 5. Scale to Window ---
         scaled_pixmap = pixmap.scaled(
             self.video_label.size(), Qt.AspectRatioMode.KeepAspectRatio
         )
         self.video_label.setPixmap(scaled_pixmap)
+        if profiling:
+            self._profile_mark("scale", t0)
+
+    def start_recording(self, out_dir=None):
+        if self.recorder is not None:
+            return
+        if out_dir is None:
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            out_dir = os.path.join(self.record_root, f"sem_rec_{stamp}")
+        self.recorder = FrameRecorder(out_dir)
+        self.recorder.start()
+
+    def stop_recording(self):
+        if self.recorder is None:
+            return
+        self.recorder.stop()
+        self.recorder = None
+
+    def set_acb(self, enabled):
+        self.acb_enabled = enabled
+        self.acb.reset()
+        self.pipeline.set_levels()
+        print(f"[Shim] ACB: {'ON' if enabled else 'OFF'}")
+
+    def export_snapshot(self, path=None):
+        """Save the current integrated frame as a 16-bit TIFF."""
+        if self.last_frame16 is None:
+            return None
+        if path is None:
+            os.makedirs(self.snapshot_root, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            path = os.path.join(self.snapshot_root, f"sem_{stamp}.tif")
+        if not export_tiff16(path, self.last_frame16):
+            print(f"[Shim] Snapshot failed: {path}")
+            return None
+        print(f"[Shim] Snapshot saved: {path}")
+        return path
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key.Key_R:
+            if self.recorder is None:
+                self.start_recording()
+            else:
+                self.stop_recording()
+            return
+        if event.key() == Qt.Key.Key_S:
+            self.export_snapshot()
+            return
+        if event.key() == Qt.Key.Key_A:
+            self.set_acb(not self.acb_enabled)
+            return
+        super().keyPressEvent(event)
+
+    def closeEvent(self, event):
+        self.stop_recording()
+        super().closeEvent(event)
 
     def draw_overlay(self, painter, w, h):
         # Setup Font
@@ -181,6 +347,8 @@ class SEMVideoShim(QMainWindow):
             else "-.-kV"
         )
         mode_str = "SLOW" if self.scan_speed >= 2 else "TV"
+        if self.acb_enabled:
+            mode_str += " ACB"
 
         # HT Status (Mapped from byte 6)
         ht_str = "HT: WAIT"
@@ -193,6 +361,11 @@ class SEMVideoShim(QMainWindow):
 
         painter.drawText(10, 30, info_text)
 
+        if self.recorder is not None:
+            painter.setPen(QColor(255, 0, 0))
+            painter.drawText(w - 60, 30, "REC")
+            painter.setPen(QColor(255, 255, 0))
+
         # 2. Micron Bar Calculation
         # Assuming basic calibration:
         # Field of View (FOV) width in microns = Constant / Mag
@@ -226,8 +399,98 @@ class SEMVideoShim(QMainWindow):
             painter.drawText(bar_x, bar_y - 10, label)
 
 
+def run_benchmark(window, frames=600, warmup=30):
+    """
+    Drive the full capture -> conversion -> integration -> overlay path
+    headlessly, as fast as the source delivers, and report throughput plus
+    per-stage latency percentiles.
+    """
+    window.video_timer.stop()
+    # Slow-scan integration on, so the float32 path is exercised.
+    window.scan_speed = 2
+    window.is_scanning = True
+    window.current_mag = window.current_mag or 1000
+    window.current_accv = window.current_accv or 15000
+
+    for _ in range(warmup):
+        window.update_frame()
+
+    window.profile = {}
+    totals = []
+    t_start = time.perf_counter_ns()
+    for _ in range(frames):
+        t0 = time.perf_counter_ns()
+        window.update_frame()
+        totals.append(time.perf_counter_ns() - t0)
+    elapsed_s = (time.perf_counter_ns() - t_start) / 1e9
+    stages = window.profile
+    window.profile = None
+
+    print(f"Benchmark: {window.cap.name}, {frames} frames")
+    print(f"  throughput: {frames / elapsed_s:.1f} frames/s")
+    stages["total"] = totals
+    for stage, samples in stages.items():
+        ms = np.asarray(samples, dtype=np.float64) / 1e6
+        print(
+            f"  {stage:<12} p50 {np.percentile(ms, 50):7.3f} ms  "
+            f"p95 {np.percentile(ms, 95):7.3f} ms  "
+            f"p99 {np.percentile(ms, 99):7.3f} ms"
+        )
+    return stages
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = SEMVideoShim()
+    parser = argparse.ArgumentParser(description="JEOL SEM Linux video shim")
+    parser.add_argument(
+        "--source",
+        default="v4l2",
+        help="v4l2[:N], synthetic[:yuyv|gray|y16] or replay:PATH",
+    )
+    parser.add_argument(
+        "--fps", type=float, help="source frame rate (synthetic/replay)"
+    )
+    parser.add_argument(
+        "--bench",
+        type=int,
+        metavar="N",
+        help="run N frames headless through the full pipeline and report timings",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="start recording integrated frames to DIR immediately",
+    )
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument(
+        "--fourcc", default="YUYV", help="capture format, e.g. YUYV or Y16"
+    )
+    parser.add_argument("--contrast", type=float, default=1.0)
+    parser.add_argument("--brightness", type=float, default=0.0)
+    parser.add_argument("--gamma", type=float, default=1.0)
+    parser.add_argument(
+        "--acb", action="store_true", help="start with auto contrast/brightness on"
+    )
+    args, qt_args = parser.parse_known_args()
+
+    if args.bench:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = SEMVideoShim(
+        record_dir=args.record,
+        source=args.source,
+        fps=args.fps,
+        width=args.width,
+        height=args.height,
+        fourcc=args.fourcc,
+        contrast=args.contrast,
+        brightness=args.brightness,
+        gamma=args.gamma,
+        acb=args.acb,
+    )
+    if args.bench:
+        run_benchmark(window, frames=args.bench)
+        window.stop_recording()
+        sys.exit(0)
     window.show()
     sys.exit(app.exec())
@@ -0,0 +1,156 @@
+import argparse
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+# ASPI-over-TCP framing used by fake_wnaspi32 (see ExecSCSI there):
+#   request:  cdb_len(4) dir(1) xfer_len(4) | CDB | data-out if dir == 2
+#   response: status(1) scsi_status(1) sense_len(1) | sense | data_len(4) | data
+REQ_HEADER = struct.Struct("<IBI")
+RES_HEADER = struct.Struct("<BBB")
+RES_LEN = struct.Struct("<I")
+
+DIR_NONE = 0
+DIR_IN = 1
+DIR_OUT = 2
+
+# SRB_Status values
+SS_PENDING = 0
+SS_COMP = 1
+
+
+class AspiTcpClient:
+    """Minimal synchronous client for VirtualSEM / BridgeSEM."""
+
+    def __init__(self, host="127.0.0.1", port=9999, timeout=10.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _recvall(self, length):
+        buf = bytearray(length)
+        view = memoryview(buf)
+        got = 0
+        while got < length:
+            n = self.sock.recv_into(view[got:], length - got)
+            if not n:
+                raise ConnectionError("connection closed by server")
+            got += n
+        return bytes(buf)
+
+    def execute(self, cdb, direction=DIR_IN, xfer_len=0, data_out=None):
+        """
+        Run one SRB. Returns (status, scsi_status, sense, data).
+        For DIR_OUT, xfer_len defaults to len(data_out).
+        """
+        cdb = bytes(cdb)
+        if direction == DIR_OUT and data_out is not None:
+            xfer_len = len(data_out)
+        msg = REQ_HEADER.pack(len(cdb), direction, xfer_len) + cdb
+        if direction == DIR_OUT and data_out:
+            msg += data_out
+        self.sock.sendall(msg)
+
+        status, scsi_status, sense_len = RES_HEADER.unpack(self._recvall(3))
+        sense = self._recvall(sense_len) if sense_len else b""
+        (data_len,) = RES_LEN.unpack(self._recvall(4))
+        data = self._recvall(data_len) if data_len else b""
+        return status, scsi_status, sense, data
+
+
+# --- ReadSemData throughput ---
+
+REQ_VIDEO = bytes.fromhex("04 01 00 00 1E 07 00 01 00 00")
+READ_SEM_DATA = bytes.fromhex("ED 82 00 00 00 00 00 00 00 00")
+
+
+def bench_read_sem_data(client, seconds=5.0, chunk=65536, frame_bytes=640 * 480):
+    """
+    Pull image data with ED 82 in `chunk`-sized transfers, re-arming with
+    ReqVideoAD every frame the way the DLL does. Returns MB/s.
+    """
+    total = 0
+    srbs = 0
+    frames = 0
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    while time.perf_counter() < deadline:
+        client.execute(REQ_VIDEO, direction=DIR_NONE)
+        srbs += 1
+        remaining = frame_bytes
+        while remaining > 0:
+            n = min(chunk, remaining)
+            status, _, _, data = client.execute(READ_SEM_DATA, DIR_IN, n)
+            if status != SS_COMP or len(data) != n:
+                raise RuntimeError(f"ReadSemData failed: status={status} len={len(data)}")
+            remaining -= n
+            total += n
+            srbs += 1
+        frames += 1
+    elapsed = time.perf_counter() - t0
+    mbps = total / elapsed / 1e6
+    print(
+        f"ReadSemData: {total / 1e6:.1f} MB in {elapsed:.2f}s -> {mbps:.1f} MB/s "
+        f"({frames / elapsed:.1f} frames/s, {srbs / elapsed:.0f} SRB/s, "
+        f"chunk={chunk})"
+    )
+    return mbps
+
+
+def _spawn_emulator():
+    """In-process VirtualSEM on a free port (no ZMQ, session log in a temp dir)."""
+    from virtual_sem import VirtualSEM
+
+    emu = VirtualSEM(port=0, ipc_endpoint=None, log_dir=tempfile.mkdtemp(prefix="vsem_"))
+    emu.bind()
+    threading.Thread(target=emu.start, daemon=True).start()
+    return emu
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ASPI-over-TCP client tools")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument(
+        "--spawn", action="store_true", help="start an in-process VirtualSEM"
+    )
+    parser.add_argument(
+        "--bench-ed",
+        type=float,
+        metavar="SECONDS",
+        help="measure ReadSemData (ED 82) throughput",
+    )
+    parser.add_argument("--chunk", type=int, default=65536)
+    parser.add_argument("--frame-bytes", type=int, default=640 * 480)
+    args = parser.parse_args()
+
+    if args.spawn:
+        emu = _spawn_emulator()
+        args.host, args.port = emu.host, emu.port
+
+    if not args.bench_ed:
+        parser.print_help()
+        sys.exit(1)
+
+    with AspiTcpClient(args.host, args.port) as client:
+        bench_read_sem_data(client, args.bench_ed, args.chunk, args.frame_bytes)
@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import queue
+import random
+import socket
+import tempfile
+import time
+from collections import deque
+
+from aspi_client import DIR_IN, DIR_OUT, REQ_HEADER, RES_HEADER, RES_LEN, SS_COMP
+from latency_hist import LogLinearHistogram
+
+# --- Workloads ---
+# A workload is a list of (cdb, direction, xfer_len, data_out) requests
+# that each connection cycles through.
+
+FA_SET_ACCV = bytes.fromhex("02 01 00 08 40 02 01 03 00 98 3A")  # 15 kV
+
+
+def synthetic_mix(n=1000, seed=0):
+    """
+    Steady-state SEM32 traffic: mostly C4 01 vacuum polls, FA-wrapped
+    writes (SetAccv) and 128-byte D0 status blocks.
+    """
+    poll = (bytes.fromhex("C4 01 00 00 04 00"), DIR_IN, 4, None)
+    fa_cdb = bytearray.fromhex("FA 00 00 00 00 00 00 00 00 00")
+    fa_cdb[8] = len(FA_SET_ACCV)
+    fa_write = (bytes(fa_cdb), DIR_OUT, len(FA_SET_ACCV), FA_SET_ACCV)
+    status_block = (bytes.fromhex("D0 00 00 00 80 00"), DIR_IN, 128, None)
+    rng = random.Random(seed)
+    return rng.choices((poll, fa_write, status_block), weights=(60, 25, 15), k=n)
+
+
+def _xfer_len_guess(cdb):
+    # Logs do not record the SRB buffer length; take the CDB's allocation
+    # length (6-byte: [4], 10-byte: [7:9]) like the DLL fills it in.
+    if len(cdb) >= 10:
+        n = int.from_bytes(cdb[7:9], "big")
+    elif len(cdb) > 4:
+        n = cdb[4]
+    else:
+        n = 0
+    return n or 4
+
+
+def session_workload(path):
+    """The command stream of a captured session, in order."""
+    from session_log import read_session, transactions
+
+    reqs = []
+    for cmd, _ in transactions(read_session(path)):
+        if cmd.payload is not None:
+            reqs.append((cmd.cdb, DIR_OUT, len(cmd.payload), cmd.payload))
+        else:
+            reqs.append((cmd.cdb, DIR_IN, _xfer_len_guess(cmd.cdb), None))
+    return reqs
+
+
+def _encode(req):
+    cdb, direction, xfer_len, data_out = req
+    msg = REQ_HEADER.pack(len(cdb), direction, xfer_len) + cdb
+    if direction == DIR_OUT and data_out:
+        msg += data_out
+    return msg
+
+
+# --- Driver ---
+
+# Pause between attempts when a connection is refused.
+CONNECT_RETRY_S = 0.1
+# How long past the run a worker process may take to report its stats.
+WORKER_GRACE_S = 30.0
+
+
+class LoadStats:
+    def __init__(self):
+        self.latency = LogLinearHistogram()
+        self.requests = 0
+        self.errors = 0
+        self.lost = 0
+        self.reconnects = 0
+        self.connect_errors = 0
+        self.bytes_in = 0
+        self.elapsed = 0.0
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.requests += other.requests
+        self.errors += other.errors
+        self.lost += other.lost
+        self.reconnects += other.reconnects
+        self.connect_errors += other.connect_errors
+        self.bytes_in += other.bytes_in
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+    def to_dict(self):
+        d = {k: v for k, v in vars(self).items() if k != "latency"}
+        d["latency"] = self.latency.to_dict()
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls()
+        for k, v in d.items():
+            setattr(stats, k, v)
+        stats.latency = LogLinearHistogram.from_dict(d["latency"])
+        return stats
+
+
+async def _session(host, port, messages, depth, deadline, stats, offset, timeout):
+    """
+    One connection until the deadline or until the server drops it (or a
+    response takes longer than `timeout`). Returns the next message index,
+    or None if the connection could not be opened (counted in
+    connect_errors). Requests still in flight when the connection dies
+    count as lost.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        stats.connect_errors += 1
+        return None
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    window = asyncio.Semaphore(depth)
+    sent_at = deque()  # send times of the requests still in flight
+    done_sending = asyncio.Event()
+    sent = 0
+    received = 0
+    i = offset
+
+    async def send():
+        nonlocal sent, i
+        n = len(messages)
+        while time.perf_counter() < deadline:
+            await window.acquire()
+            sent_at.append(time.perf_counter_ns())
+            writer.write(messages[i % n])
+            i += 1
+            sent += 1
+            if sent % depth == 0:
+                await writer.drain()
+        await writer.drain()
+        done_sending.set()
+
+    async def receive():
+        nonlocal received
+        while not (done_sending.is_set() and received == sent):
+            header = await asyncio.wait_for(reader.readexactly(3), timeout)
+            status, _, sense_len = RES_HEADER.unpack(header)
+            if sense_len:
+                await reader.readexactly(sense_len)
+            (data_len,) = RES_LEN.unpack(await reader.readexactly(4))
+            if data_len:
+                await reader.readexactly(data_len)
+            stats.latency.record(time.perf_counter_ns() - sent_at.popleft())
+            received += 1
+            stats.requests += 1
+            stats.bytes_in += data_len
+            if status != SS_COMP:
+                stats.errors += 1
+            window.release()
+
+    sender = asyncio.ensure_future(send())
+    try:
+        await receive()
+        await sender
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        sender.cancel()
+        stats.lost += sent - received
+    finally:
+        writer.close()
+    return i
+
+
+async def _connection(host, port, messages, depth, deadline, stats, offset, timeout):
+    i = offset
+    while True:
+        nxt = await _session(host, port, messages, depth, deadline, stats, i, timeout)
+        if time.perf_counter() >= deadline:
+            break
+        if nxt is None:
+            # Refused (server down or restarting): retry until the deadline.
+            await asyncio.sleep(CONNECT_RETRY_S)
+            continue
+        i = nxt
+        stats.reconnects += 1
+
+
+async def run_load(
+    host, port, workload, connections=4, depth=1, seconds=5.0, timeout=2.0
+):
+    """
+    Drive `connections` sockets, each keeping up to `depth` SRBs in flight.
+    A connection the server drops (or that stalls for `timeout` seconds,
+    the shim's limit) is reopened, as SEM32 would after a bus error.
+    """
+    messages = [_encode(r) for r in workload]
+    stats = LoadStats()
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    await asyncio.gather(
+        *(
+            _connection(host, port, messages, depth, deadline, stats,
+                        i * len(messages) // max(connections, 1), timeout)
+            for i in range(connections)
+        )
+    )
+    stats.elapsed = time.perf_counter() - t0
+    return stats
+
+
+def _worker(host, port, workload, connections, depth, seconds, timeout, out):
+    stats = asyncio.run(
+        run_load(host, port, workload, connections, depth, seconds, timeout)
+    )
+    out.put(stats.to_dict())
+
+
+def run_multiprocess(
+    host, port, workload, procs, connections, depth, seconds, timeout=2.0
+):
+    """Split `connections` across `procs` event loops and merge their stats."""
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    per_proc = [connections // procs + (1 if i < connections % procs else 0)
+                for i in range(procs)]
+    workers = [
+        ctx.Process(target=_worker,
+                    args=(host, port, workload, n, depth, seconds, timeout, out))
+        for n in per_proc if n
+    ]
+    for w in workers:
+        w.start()
+    stats = LoadStats()
+    pending = len(workers)
+    give_up = time.monotonic() + seconds + timeout + WORKER_GRACE_S
+    try:
+        while pending:
+            try:
+                stats.merge(LoadStats.from_dict(out.get(timeout=0.5)))
+                pending -= 1
+                continue
+            except queue.Empty:
+                pass
+            # A worker that died never reports; don't wait for it.
+            dead = [w for w in workers if w.exitcode not in (None, 0)]
+            if dead:
+                raise RuntimeError(
+                    f"Load worker (pid {dead[0].pid}) exited with code {dead[0].exitcode}"
+                )
+            if time.monotonic() > give_up:
+                raise RuntimeError(
+                    f"{pending}/{len(workers)} load workers did not report in time"
+                )
+    finally:
+        for w in workers:
+            w.join(5.0)
+            if w.is_alive():
+                w.terminate()
+                w.join()
+    return stats
+
+
+def report(stats, label=""):
+    h = stats.latency
+    rate = stats.requests / stats.elapsed if stats.elapsed else 0.0
+    us = 1e-3
+    print(
+        f"{label}{stats.requests} SRBs in {stats.elapsed:.2f}s -> {rate:,.0f} SRB/s, "
+        f"{stats.bytes_in / stats.elapsed / 1e6:.2f} MB/s in, {stats.errors} errors, "
+        f"{stats.lost} lost, {stats.reconnects} reconnects, "
+        f"{stats.connect_errors} failed connects"
+    )
+    print(
+        f"  latency us: p50 {h.percentile(50) * us:.1f}  p99 {h.percentile(99) * us:.1f}  "
+        f"p99.9 {h.percentile(99.9) * us:.1f}  max {h.max * us:.1f}  "
+        f"mean {h.mean * us:.1f}"
+    )
+    return {
+        "srb_per_s": rate,
+        "errors": stats.errors,
+        "lost": stats.lost,
+        "reconnects": stats.reconnects,
+        "connect_errors": stats.connect_errors,
+        "p50_us": h.percentile(50) * us,
+        "p99_us": h.percentile(99) * us,
+        "p999_us": h.percentile(99.9) * us,
+        "max_us": h.max * us,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load generator for the ASPI-over-TCP protocol"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9999)
+    parser.add_argument(
+        "--spawn",
+        action="store_true",
+        help="start a VirtualSEM in its own process on a free port",
+    )
+    parser.add_argument("--session", metavar="LOG", help="replay a captured session")
+    parser.add_argument("-c", "--connections", type=int, default=4)
+    parser.add_argument("-d", "--depth", type=int, default=1, help="SRBs in flight")
+    parser.add_argument("-p", "--procs", type=int, default=1, help="client processes")
+    parser.add_argument("-t", "--seconds", type=float, default=5.0)
+    parser.add_argument(
+        "--timeout", type=float, default=2.0, help="per-SRB response timeout (s)"
+    )
+    parser.add_argument(
+        "--faults", metavar="CONFIG", help="fault plan for the --spawn emulator"
+    )
+    parser.add_argument("--json", action="store_true", help="print a JSON summary")
+    args = parser.parse_args()
+
+    workload = session_workload(args.session) if args.session else synthetic_mix()
+
+    farm = None
+    if args.spawn:
+        from vsem_farm import VSEMFarm
+
+        farm = VSEMFarm(
+            1, log_dir=tempfile.mkdtemp(prefix="vsem_"), faults=args.faults
+        )
+        inst = farm.start()[0]
+        args.host, args.port = inst["host"], inst["port"]
+
+    try:
+        if args.procs > 1:
+            stats = run_multiprocess(args.host, args.port, workload, args.procs,
+                                     args.connections, args.depth, args.seconds,
+                                     args.timeout)
+        else:
+            stats = asyncio.run(run_load(args.host, args.port, workload,
+                                         args.connections, args.depth, args.seconds,
+                                         args.timeout))
+    finally:
+        if farm:
+            farm.stop()
+
+    label = f"[{args.connections} conn x depth {args.depth}, {args.procs} proc] "
+    summary = report(stats, label)
+    if args.json:
+        print(json.dumps(summary))
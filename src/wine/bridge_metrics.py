@@ -0,0 +1,229 @@
+import http.server
+import json
+import logging
+import threading
+
+from latency_hist import LogLinearHistogram
+
+logger = logging.getLogger("BridgeSEM")
+
+# Latencies are recorded in ns. io_hdr.duration only has ms resolution, so
+# the ioctl's own wall time is kept alongside it. SRB counts and "srb" are
+# keyed by the opcode SEM32 sent; the SG_IO timings by the CDB that reached
+# the device, i.e. the inner command of an unwrapped FA.
+TIMINGS = ("srb", "lock_wait", "ioctl", "kernel")
+TIMING_HELP = {
+    "srb": "End-to-end SRB time, request header in to response sent.",
+    "lock_wait": "Time spent waiting for the SCSI device lock.",
+    "ioctl": "Wall time of the SG_IO ioctl.",
+    "kernel": "SG_IO duration reported by the kernel (sg_io_hdr.duration).",
+}
+
+# Fixed `le` bounds for the Prometheus histograms (seconds), so every scrape
+# exposes the same series whatever the HDR buckets hold.
+EXPORT_BOUNDS_S = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0,
+)
+
+
+class OpcodeMetrics:
+    __slots__ = ("count", "errors") + TIMINGS
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        for name in TIMINGS:
+            setattr(self, name, LogLinearHistogram())
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        for name in TIMINGS:
+            getattr(self, name).merge(getattr(other, name))
+
+
+class BridgeMetrics:
+    """
+    Per-opcode SRB counters and latency histograms.
+
+    Each thread records into its own shard (a dict opcode -> OpcodeMetrics
+    reached through threading.local), so the hot path takes no lock; only
+    the first record on a new thread registers its shard. BridgeSEM runs
+    one thread per client, so a thread's shard is also that session's
+    metrics. When a session ends, retire() folds its shard into one
+    retired total, so scrapes still count finished sessions but the shard
+    list only holds live ones.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+
+    def shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def retire(self):
+        """Fold this thread's shard into the retired total (session over)."""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            return
+        self._local.shard = None
+        with self._shards_lock:
+            self._shards.remove(shard)
+            for opcode, op in shard.items():
+                self._retired.setdefault(opcode, OpcodeMetrics()).merge(op)
+
+    def _op(self, opcode):
+        shard = self.shard()
+        op = shard.get(opcode)
+        if op is None:
+            op = shard[opcode] = OpcodeMetrics()
+        return op
+
+    def record_srb(self, opcode, ns, ok=True):
+        op = self._op(opcode)
+        op.count += 1
+        if not ok:
+            op.errors += 1
+        op.srb.record(ns)
+
+    def record_ioctl(self, opcode, lock_wait_ns, ioctl_ns, kernel_ms):
+        op = self._op(opcode)
+        op.lock_wait.record(lock_wait_ns)
+        op.ioctl.record(ioctl_ns)
+        op.kernel.record(kernel_ms * 1_000_000)
+
+    def merged(self):
+        total = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+            for opcode, op in self._retired.items():
+                total.setdefault(opcode, OpcodeMetrics()).merge(op)
+        for shard in shards:
+            for opcode, op in list(shard.items()):
+                total.setdefault(opcode, OpcodeMetrics()).merge(op)
+        return total
+
+    # --- Export ---
+
+    def prometheus(self):
+        ops = sorted(self.merged().items())
+        lines = [
+            "# HELP bridge_srb_total SRBs handled, by opcode.",
+            "# TYPE bridge_srb_total counter",
+        ]
+        for opcode, op in ops:
+            lines.append(f'bridge_srb_total{{opcode="{opcode:02X}"}} {op.count}')
+        lines += [
+            "# HELP bridge_srb_errors_total SRBs answered with a non-success status.",
+            "# TYPE bridge_srb_errors_total counter",
+        ]
+        for opcode, op in ops:
+            lines.append(f'bridge_srb_errors_total{{opcode="{opcode:02X}"}} {op.errors}')
+        for name in TIMINGS:
+            metric = f"bridge_{name}_seconds"
+            lines += [f"# HELP {metric} {TIMING_HELP[name]}", f"# TYPE {metric} histogram"]
+            for opcode, op in ops:
+                h = getattr(op, name)
+                if not h.total:
+                    continue
+                label = f'opcode="{opcode:02X}"'
+                for bound in EXPORT_BOUNDS_S:
+                    count = h.count_le(bound * 1e9)
+                    lines.append(f'{metric}_bucket{{{label},le="{bound:g}"}} {count}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {h.total}')
+                lines.append(f"{metric}_sum{{{label}}} {h.sum / 1e9:.9f}")
+                lines.append(f"{metric}_count{{{label}}} {h.total}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, shard=None):
+        """{opcode hex: {count, errors, <timing>: {p50, p99, p999, max} in us}}."""
+        ops = self.merged() if shard is None else shard
+        out = {}
+        for opcode, op in sorted(ops.items()):
+            entry = {"count": op.count, "errors": op.errors, "sg_io": op.ioctl.total}
+            for name in TIMINGS:
+                h = getattr(op, name)
+                if h.total:
+                    entry[name] = {
+                        "p50_us": round(h.percentile(50) / 1e3, 1),
+                        "p99_us": round(h.percentile(99) / 1e3, 1),
+                        "p999_us": round(h.percentile(99.9) / 1e3, 1),
+                        "max_us": round(h.max / 1e3, 1),
+                    }
+            out[f"{opcode:02X}"] = entry
+        return out
+
+    def dump_session(self, session_logger):
+        """
+        Write this thread's (= this session's) metrics next to its log as
+        <log>.metrics.json, plus one summary line per opcode in the log.
+        """
+        shard = getattr(self._local, "shard", None)
+        if not shard:
+            return
+        summary = self.summary(shard)
+        path = session_logger.filename[: -len(".log")] + ".metrics.json"
+        try:
+            with open(path, "w") as f:
+                json.dump(summary, f, indent=1)
+        except OSError as e:
+            logger.error(f"Metrics: failed to write {path}: {e}")
+        busiest = sorted(
+            summary.items(), key=lambda kv: -max(kv[1]["count"], kv[1]["sg_io"])
+        )
+        for opcode, entry in busiest:
+            srb = entry.get("srb", {})
+            kernel = entry.get("kernel", {})
+            session_logger.write_meta(
+                f"METRICS {opcode}: n={entry['count']} err={entry['errors']} "
+                f"sg_io={entry['sg_io']} "
+                f"srb p50={srb.get('p50_us', 0)}us p99={srb.get('p99_us', 0)}us "
+                f"kernel p99={kernel.get('p99_us', 0)}us"
+            )
+
+
+# --- HTTP Endpoint ---
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = self.metrics.prometheus().encode("utf-8")
+            ctype = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body = json.dumps(self.metrics.summary()).encode("utf-8")
+            ctype = "application/json"
+        else:
+            self.send_error(404, "Not found")
+            return
+        self.send_response(200)
+        self.send_header("Content-type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(metrics, host="127.0.0.1", port=9464):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    handler = type("BoundMetricsHandler", (MetricsHandler,), {"metrics": metrics})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="bridge-metrics", daemon=True
+    ).start()
+    logger.info(f"Metrics: serving http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -6,10 +6,15 @@ import os
 import fcntl
 import sys
 import ctypes
+import itertools
 import json
 import time
 from datetime import datetime
 
+from bridge_metrics import BridgeMetrics, serve_metrics
+from bridge_trace import TRACER, install as install_tracing
+from log_rotation import compressor, from_env as rotating_log
+
 try:
     import zmq
 
@@ -120,14 +125,31 @@ class ProtocolDecoder:
 
 # --- Session Logger ---
 class SCSILogger:
+    _names_lock = threading.Lock()
+
     def __init__(self, log_dir="logs"):
         self.log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), log_dir)
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.filename = os.path.join(self.log_dir, f"sem_session_{timestamp}.log")
-        self.file = open(self.filename, "w", buffering=1)  # Line buffering
+        base = os.path.join(self.log_dir, f"sem_session_{timestamp}")
+        # Block-buffered and split into segments (BRIDGE_LOG_* settings);
+        # closed segments are compressed in the background. filename stays
+        # the first segment's name.
+        with SCSILogger._names_lock:
+            # Clients connecting in the same second get _2, _3, ... rather
+            # than truncating each other's log.
+            self.filename = f"{base}.log"
+            n = 1
+            while any(os.path.exists(self.filename + s) for s in ("", ".gz", ".zst")):
+                n += 1
+                self.filename = f"{base}_{n}.log"
+            self.file = rotating_log(
+                self.filename,
+                on_close=lambda new: self.write_meta(f"Log continues in {os.path.basename(new)}"),
+                on_open=lambda old: self.write_meta(f"Session Continued from {os.path.basename(old)}"),
+            )
         self.write_meta("Session Started", level="INFO")
 
     def close(self):
@@ -149,6 +171,9 @@ class SCSILogger:
         cmd_name,
         defined_level="INFO",
         extra_info="",
+        txn=None,
+        start_ns=None,
+        end_ns=None,
     ):
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
 
@@ -176,6 +201,12 @@ class SCSILogger:
 
         # Format: [TIMESTAMP] [LEVEL] [DIRECTION] [NAME] | CDB: ... | DATA: ... -> STATUS
         extra = f" {extra_info}" if extra_info else ""
+        # Transaction id and epoch-ns times, last so that parsers can cut
+        # them off (session_log.py); CMD has the start, RES both.
+        if txn is not None:
+            extra += f" | TXN: {txn} start_ns={start_ns}"
+            if end_ns is not None:
+                extra += f" end_ns={end_ns}"
         line = (
             f"{ts} [{level:<4}] [{direction}] {cmd_name:<20} | CDB: {cdb_str:<20} "
             f"{data_str}-> Status={status}{extra}\n"
@@ -253,6 +284,25 @@ class BridgeSEM:
         self._state_lock = threading.Lock()  # Protect shared status state
         self.sg_timeout_ms = int(os.environ.get("BRIDGE_SG_TIMEOUT_MS", "1200"))
 
+        # --- Metrics ---
+        # Per-opcode counters and latency histograms, served on
+        # BRIDGE_METRICS_PORT (0 disables the endpoint) and dumped per session.
+        self.metrics = BridgeMetrics()
+        self.metrics_port = int(os.environ.get("BRIDGE_METRICS_PORT", "9464"))
+        self.metrics_server = None
+
+        # --- Transactions ---
+        # Every SRB gets the next id (shared by all clients; next() on a
+        # count is atomic). The id of the SRB a client thread is handling
+        # tags the IPC events it publishes.
+        self._txn_ids = itertools.count(1)
+        self._txn = threading.local()
+
+        # Client threads and their sockets, so shutdown can end every
+        # session (closing its log) before the last segments are compressed.
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
         # --- IPC (ZeroMQ) ---
         self.zmq_pub = None
         if HAS_ZMQ:
@@ -268,8 +318,15 @@ class BridgeSEM:
     def _publish_state(self, event_type, value):
         if self.zmq_pub:
             try:
-                msg = json.dumps({"event": event_type, "value": value})
-                self.zmq_pub.send_string(msg)
+                event = {"event": event_type, "value": value}
+                ctx = self._txn
+                txn = getattr(ctx, "id", None)
+                if txn is not None:
+                    event["txn"] = txn
+                    event["start_ns"] = ctx.start_ns
+                    if ctx.end_ns is not None:
+                        event["end_ns"] = ctx.end_ns
+                self.zmq_pub.send_string(json.dumps(event))
             except Exception as e:
                 logger.error(f"IPC: Publish failed: {e}")
 
@@ -377,6 +434,16 @@ class BridgeSEM:
             logger.error(f"Failed to open device {self.device_path}: {e}")
             return
 
+        # BRIDGE_TRACE=1 traces from the start; SIGUSR2 toggles and exports.
+        trace_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+        install_tracing(TRACER, trace_dir)
+
+        if self.metrics_port:
+            try:
+                self.metrics_server = serve_metrics(self.metrics, port=self.metrics_port)
+            except OSError as e:
+                logger.error(f"Metrics: failed to bind port {self.metrics_port}: {e}")
+
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         try:
@@ -389,12 +456,33 @@ class BridgeSEM:
                 conn, addr = self.server_socket.accept()
                 logger.info(f"Client connected: {addr}")
                 t = threading.Thread(target=self.handle_client, args=(conn, addr))
+                with self._clients_lock:
+                    self._clients[t] = conn
                 t.start()
         except Exception as e:
             logger.error(f"Server error: {e}")
         finally:
+            if TRACER.enabled:
+                stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                TRACER.export(os.path.join(trace_dir, f"bridge_trace_{stamp}.json"))
+            self._close_clients()
             if self.dev_fd >= 0:
                 os.close(self.dev_fd)
+            # The compressor thread is a daemon: without this it dies with
+            # the process mid-segment and leaves a .tmp behind.
+            compressor().drain()
+
+    def _close_clients(self, timeout=5.0):
+        """Disconnect the remaining clients and wait for their sessions to close."""
+        with self._clients_lock:
+            clients = list(self._clients.items())
+        for _, conn in clients:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for t, _ in clients:
+            t.join(timeout)
 
     def handle_client(self, conn, addr):
         session_logger = None
@@ -423,6 +511,13 @@ class BridgeSEM:
                 header = recvall(conn, 9)
                 if not header or len(header) < 9:
                     break
+                t_srb = time.perf_counter_ns()
+                txn = self._txn.id = next(self._txn_ids)
+                start_ns = self._txn.start_ns = time.time_ns()
+                self._txn.end_ns = None
+                # Spans chain on t: each one closes where the next begins.
+                tr = TRACER if TRACER.enabled else None
+                t = t_srb
                 cdb_len, dir_byte, xfer_len = struct.unpack("<IBI", header)
 
                 # 2. Read CDB
@@ -459,6 +554,9 @@ class BridgeSEM:
                     if not data_out or len(data_out) != xfer_len:
                         break
 
+                if tr:
+                    t = tr.span("recv", t, cdb[0])
+
                 cmd_extra_info = ""
                 if data_out and len(data_out) > 0:
                     payload = self._format_bytes(data_out)
@@ -476,7 +574,11 @@ class BridgeSEM:
                     cmd_name,
                     defined_level=cmd_level,
                     extra_info=cmd_extra_info,
+                    txn=txn,
+                    start_ns=start_ns,
                 )
+                if tr:
+                    t = tr.span("log_cmd", t, cdb[0])
 
                 # --- 2.5 Intercept / Patch Logic ---
                 # Some commands fail on the target or need to be faked for the Shim to work.
@@ -586,6 +688,11 @@ class BridgeSEM:
                     )
                 else:
                     pass  # scsi_status and sense_bytes already set by intercept logic
+                # Wall-clock start plus the monotonic elapsed time, so a clock
+                # step mid-SRB cannot skew the latency.
+                end_ns = self._txn.end_ns = start_ns + time.perf_counter_ns() - t_srb
+                if tr:
+                    t = tr.span("execute", t, cdb[0])
 
                 # --- 3.5 Intercept / Patch Responses (Read Synch) ---
                 # Sniff responses to "Get" commands to sync the shim
@@ -612,6 +719,9 @@ class BridgeSEM:
                     # This is tricky as it's a SET command but sometimes apps read back?
                     # No, usually apps read via C6/C8.
 
+                if tr:
+                    t = tr.span("sniff", t, cdb[0])
+
                 # For RES, we can pass resp_data to decoder for FA_Response logic
                 cmd_name_res, cmd_level_res = self.decoder.decode(
                     cdb, data_bytes=resp_data, direction="RES"
@@ -629,8 +739,14 @@ class BridgeSEM:
                     cmd_name_res,
                     defined_level=cmd_level_res,
                     extra_info=res_extra,
+                    txn=txn,
+                    start_ns=start_ns,
+                    end_ns=end_ns,
                 )
 
+                if tr:
+                    t = tr.span("log_res", t, cdb[0])
+
                 # 4. Send Response (extended protocol: status + scsi_tgt_stat + sense_len + sense + data_len + data)
                 sense_to_send = sense_bytes[:32] if sense_bytes else b""
                 resp_header = struct.pack(
@@ -642,15 +758,28 @@ class BridgeSEM:
                 conn.sendall(struct.pack("<I", len(resp_data)))
                 if len(resp_data) > 0:
                     conn.sendall(resp_data)
+                if tr:
+                    t = tr.span("send", t, cdb[0])
+                    tr.record("srb", t_srb, t, cdb[0])
+                self.metrics.record_srb(
+                    cdb[0], time.perf_counter_ns() - t_srb, ok=status == 1
+                )
+                self._txn.id = None
 
         except Exception as e:
             logger.error(f"Handler error: {e}")
             if session_logger:
                 session_logger.write_meta(f"Error: {e}", level="ERR")
         finally:
+            self._txn.id = None
             if session_logger:
+                self.metrics.dump_session(session_logger)
                 session_logger.close()
+            self.metrics.retire()
+            TRACER.release()
             conn.close()
+            with self._clients_lock:
+                self._clients.pop(threading.current_thread(), None)
 
     def send_scsi_cmd(self, cdb_bytes, direction=1, data_out=None, xfer_len=0):
         buff_size = max(int(xfer_len), 0)
@@ -688,35 +817,46 @@ class BridgeSEM:
         io_hdr.sbp = ctypes.cast(sense_buff, ctypes.c_void_p)
 
         try:
+            t_wait = time.perf_counter_ns()
             with self._scsi_lock:
+                t_ioctl = time.perf_counter_ns()
                 fcntl.ioctl(self.dev_fd, SG_IO, io_hdr)
-                status = io_hdr.status
-                sense_len = min(int(io_hdr.sb_len_wr), 32)
-                sense_bytes = (
-                    bytes(sense_buff.raw[:sense_len]) if sense_len > 0 else b""
+                t_done = time.perf_counter_ns()
+            # Everything after the ioctl runs with the lock released, so the
+            # next SRB waiting for the device is not held up by bookkeeping.
+            self.metrics.record_ioctl(
+                cdb_bytes[0], t_ioctl - t_wait, t_done - t_ioctl, io_hdr.duration
+            )
+            if TRACER.enabled:
+                TRACER.record("lock_wait", t_wait, t_ioctl, cdb_bytes[0])
+                TRACER.record("ioctl", t_ioctl, t_done, cdb_bytes[0])
+            status = io_hdr.status
+            sense_len = min(int(io_hdr.sb_len_wr), 32)
+            sense_bytes = (
+                bytes(sense_buff.raw[:sense_len]) if sense_len > 0 else b""
+            )
+            detail = ""
+            if status != 0 or io_hdr.host_status != 0 or io_hdr.driver_status != 0:
+                sense_hex = (
+                    " ".join(f"{b:02X}" for b in sense_bytes) if sense_bytes else ""
                 )
-                detail = ""
-                if status != 0 or io_hdr.host_status != 0 or io_hdr.driver_status != 0:
-                    sense_hex = (
-                        " ".join(f"{b:02X}" for b in sense_bytes) if sense_bytes else ""
-                    )
-                    detail = (
-                        f"| SCSI=0x{status:02X} Host=0x{io_hdr.host_status:02X} "
-                        f"Driver=0x{io_hdr.driver_status:02X}"
-                    )
-                    if sense_hex:
-                        detail += f" Sense={sense_hex}"
-
-                # Only return success (status=1) if target logic AND kernel host delivery succeeded
-                if status == 0 and io_hdr.host_status == 0 and io_hdr.driver_status == 0:
-                    if direction == 1:
-                        xfered = int(io_hdr.dxfer_len - io_hdr.resid)
-                        return data_buff.raw[:xfered], 1, detail, status, sense_bytes
-                    return b"", 1, detail, status, sense_bytes
-                
-                # Command failed (either SCSI target error or Linux host transport error)
-                # Return empty bytes to avoid leaking previously successful kernel buffer contents
-                return b"", 4, detail, status, sense_bytes
+                detail = (
+                    f"| SCSI=0x{status:02X} Host=0x{io_hdr.host_status:02X} "
+                    f"Driver=0x{io_hdr.driver_status:02X}"
+                )
+                if sense_hex:
+                    detail += f" Sense={sense_hex}"
+
+            # Only return success (status=1) if target logic AND kernel host delivery succeeded
+            if status == 0 and io_hdr.host_status == 0 and io_hdr.driver_status == 0:
+                if direction == 1:
+                    xfered = int(io_hdr.dxfer_len - io_hdr.resid)
+                    return data_buff.raw[:xfered], 1, detail, status, sense_bytes
+                return b"", 1, detail, status, sense_bytes
+            
+            # Command failed (either SCSI target error or Linux host transport error)
+            # Return empty bytes to avoid leaking previously successful kernel buffer contents
+            return b"", 4, detail, status, sense_bytes
         except Exception as e:
             logger.error(f"IOCTL failed: {e}")
             return b"", 4, f"| IOCTL={e}", 0, b""
@@ -0,0 +1,218 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger("BridgeSEM")
+
+now_ns = time.perf_counter_ns
+
+
+class SpanRing:
+    """
+    Fixed-size ring of spans for one thread, overwritten oldest-first once
+    full. Slots hold (name, start_ns, end_ns, arg) tuples; one list store
+    per span is cheaper than four typed-array stores. Only its own thread
+    writes to it.
+    """
+
+    __slots__ = ("tid", "thread_name", "capacity", "buf", "i", "n")
+
+    def __init__(self, capacity):
+        self.tid = threading.get_native_id()
+        self.thread_name = threading.current_thread().name
+        self.capacity = capacity
+        self.buf = [None] * capacity
+        self.i = 0  # next slot
+        self.n = 0  # spans ever written
+
+    def spans(self):
+        """Recorded spans, oldest first, as (name, start_ns, end_ns, arg)."""
+        if self.n <= self.capacity:
+            return self.buf[: self.n]
+        return self.buf[self.i :] + self.buf[: self.i]
+
+
+class Tracer:
+    """
+    Low-overhead span recorder for the bridge's SRB path.
+
+    Call sites check `tracer.enabled` once per SRB and then chain spans:
+
+        t = now_ns()
+        ...
+        t = tracer.span("decode", t)     # records [t, now], returns now
+
+    so one perf_counter_ns() call closes a span and opens the next. When
+    disabled, the cost is the attribute check. arg is an int carried into
+    the trace (the opcode for SRB spans, -1 for none).
+
+    Each thread gets a ring on its first span. release() hands it back when
+    the thread's client disconnects; the last `keep_finished` released
+    rings stay in exports, so memory is bounded by live connections plus
+    that many, however many clients come and go.
+    """
+
+    def __init__(self, capacity=1 << 16, keep_finished=8):
+        self.capacity = capacity
+        self.enabled = False
+        self._local = threading.local()
+        self._rings = []
+        self._finished = collections.deque(maxlen=keep_finished)
+        self._rings_lock = threading.Lock()
+
+    def _ring(self):
+        ring = SpanRing(self.capacity)
+        self._local.ring = ring
+        with self._rings_lock:
+            self._rings.append(ring)
+        return ring
+
+    def release(self):
+        """The calling thread is done recording (its connection closed)."""
+        ring = getattr(self._local, "ring", None)
+        if ring is None:
+            return
+        del self._local.ring
+        with self._rings_lock:
+            self._rings.remove(ring)
+            if ring.n:
+                self._finished.append(ring)
+
+    def span(self, name, start, arg=-1):
+        end = now_ns()
+        try:
+            ring = self._local.ring
+        except AttributeError:
+            ring = self._ring()
+        i = ring.i
+        ring.buf[i] = (name, start, end, arg)
+        i += 1
+        ring.i = 0 if i == ring.capacity else i
+        ring.n += 1
+        return end
+
+    def record(self, name, start, end, arg=-1):
+        """A span whose end was already measured (e.g. around an ioctl)."""
+        try:
+            ring = self._local.ring
+        except AttributeError:
+            ring = self._ring()
+        i = ring.i
+        ring.buf[i] = (name, start, end, arg)
+        i += 1
+        ring.i = 0 if i == ring.capacity else i
+        ring.n += 1
+
+    def enable(self):
+        self.enabled = True
+        logger.info(f"Trace: enabled ({self.capacity} spans per thread)")
+
+    def disable(self):
+        self.enabled = False
+        logger.info("Trace: disabled")
+
+    def clear(self):
+        with self._rings_lock:
+            self._finished.clear()
+            for ring in self._rings:
+                ring.i = ring.n = 0
+
+    # --- Export ---
+
+    def chrome_trace(self):
+        """Chrome trace-event JSON object (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        events = []
+        with self._rings_lock:
+            rings = list(self._finished) + self._rings
+        for ring in rings:
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": ring.tid,
+                    "args": {"name": ring.thread_name},
+                }
+            )
+            for name, start, end, arg in ring.spans():
+                ev = {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start / 1000.0,
+                    "dur": (end - start) / 1000.0,
+                    "pid": pid,
+                    "tid": ring.tid,
+                }
+                if arg >= 0:
+                    ev["args"] = {"opcode": f"{arg:02X}"}
+                events.append(ev)
+        return {"traceEvents": events, "displayTimeUnit": "ns"}
+
+    def export(self, path):
+        trace = self.chrome_trace()
+        with open(path, "w") as f:
+            json.dump(trace, f, separators=(",", ":"))
+        spans = sum(1 for ev in trace["traceEvents"] if ev["ph"] == "X")
+        logger.info(f"Trace: {spans} spans written to {path}")
+        return path
+
+
+def install(tracer, trace_dir, env_var="BRIDGE_TRACE", sig=signal.SIGUSR2):
+    """
+    Enable from the environment (BRIDGE_TRACE=1) and toggle with a signal:
+    each SIGUSR2 while tracing writes bridge_trace_<time>.json into
+    trace_dir and stops; the next one starts a fresh capture.
+    """
+    if os.environ.get(env_var, "") not in ("", "0"):
+        tracer.enable()
+
+    def _toggle(signum, frame):
+        if tracer.enabled:
+            tracer.disable()
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            path = os.path.join(trace_dir, f"bridge_trace_{stamp}.json")
+            # Export off the signal handler's stack frame.
+            threading.Thread(target=tracer.export, args=(path,), daemon=True).start()
+        else:
+            tracer.clear()
+            tracer.enable()
+
+    signal.signal(sig, _toggle)
+
+
+TRACER = Tracer()
+
+
+def bench(iterations=1_000_000):
+    """Per-span cost with tracing on, and per-check cost with it off."""
+    tracer = Tracer()
+    t0 = now_ns()
+    for _ in range(iterations):
+        if tracer.enabled:
+            tracer.span("x", 0)
+    off = (now_ns() - t0) / iterations
+
+    tracer.enable()
+    t = now_ns()
+    t0 = t
+    for _ in range(iterations):
+        if tracer.enabled:
+            t = tracer.span("x", t)
+    on = (now_ns() - t0) / iterations
+    print(f"Trace: {on:.0f} ns per span enabled, {off:.1f} ns per check disabled")
+    return on, off
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bridge span tracer")
+    parser.add_argument("--bench", type=int, metavar="N", help="measure span overhead")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    bench(args.bench or 1_000_000)
@@ -0,0 +1,147 @@
+"""
+Check that two revisions of VirtualSEM answer every command alike.
+
+The commands of the bundled session logs, then one CDB per match rule in
+protocol_definitions.json (seeded random filler, as reads and as writes),
+go through process_scsi_command on each side in order; the response,
+status, resulting state and any transition scheduled are compared.
+Physics is off on both sides; behaviour added since the revision still
+shows up (with NumPy installed, ED reads return the synthetic image
+rather than zeros before it existed).
+
+    python3 dispatch_check.py                 # HEAD vs the working tree
+    python3 dispatch_check.py --ref 3813dd5^  # the old if/elif dispatcher
+"""
+
+import argparse
+import inspect
+import logging
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LOGS = ("logs/sem_session_20260201_220324.log", "logs/sem_session_20260201_220424.log")
+
+
+def corpus(seed=1, per_rule=4):
+    """[(cdb, direction, data_out, xfer_len)] from the logs and the definitions."""
+    from session_log import read_session, transactions
+    from virtual_sem import ProtocolDecoder
+
+    cmds = []
+    for log in LOGS:
+        for cmd, res in transactions(read_session(os.path.join(HERE, log))):
+            data_out = cmd.payload or None
+            direction = 2 if data_out else 1
+            xfer_len = len(data_out) if data_out else max(len((res and res.data) or b""), 4)
+            cmds.append((cmd.cdb, direction, data_out, xfer_len))
+
+    rnd = random.Random(seed)
+    groups = ProtocolDecoder().definitions.get("groups", {})
+    for op_hex, group in sorted(groups.items()):
+        for rule in group.get("matches", []):
+            match = {int(k): int(v, 16) for k, v in rule.get("match", {}).items()}
+            for _ in range(per_rule):
+                size = max(rnd.choice((6, 10, 12)), max(match, default=0) + 1)
+                cdb = bytearray(rnd.randrange(256) for _ in range(size))
+                cdb[0] = int(op_hex, 16)
+                for offset, value in match.items():
+                    cdb[offset] = value
+                if rnd.random() < 0.5:
+                    cmds.append((bytes(cdb), 1, None, rnd.choice((4, 18, 36, 128))))
+                else:
+                    data_out = bytes(rnd.randrange(256) for _ in range(rnd.choice((2, 4, 12))))
+                    cmds.append((bytes(cdb), 2, data_out, len(data_out)))
+    return cmds
+
+
+def dump(cmds):
+    """Run `cmds` through the virtual_sem on sys.path; one result per command."""
+    import virtual_sem
+    from sim_scheduler import SimulatedClock
+
+    logging.disable(logging.CRITICAL)
+    # Older revisions take fewer constructor arguments (and always bind).
+    wanted = {"port": 0, "ipc_endpoint": None, "clock": SimulatedClock(), "physics": False}
+    params = inspect.signature(virtual_sem.VirtualSEM).parameters
+    emu = virtual_sem.VirtualSEM(**{k: v for k, v in wanted.items() if k in params})
+    scheduled = []
+    emu._schedule_state_update = lambda key, value, delay_s: scheduled.append(
+        (key, value, delay_s)
+    )
+    results = []
+    for cdb, direction, data_out, xfer_len in cmds:
+        try:
+            reply = emu.process_scsi_command(
+                cdb, direction=direction, data_out=data_out, xfer_len=xfer_len
+            )
+        except Exception as e:
+            reply = ("EXC", type(e).__name__)
+        results.append((reply, dict(emu.state), list(scheduled)))
+        scheduled.clear()
+    return results
+
+
+def _run(wine_dir, corpus_path):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--dump", corpus_path],
+        cwd=wine_dir,
+        capture_output=True,
+        check=True,
+    )
+    return pickle.loads(out.stdout)
+
+
+def check(ref="HEAD", show=10):
+    """Compare `ref` (a git revision) with the working tree. Returns mismatches."""
+    top = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], cwd=HERE, capture_output=True, text=True,
+        check=True,
+    ).stdout.strip()
+    prefix = os.path.relpath(HERE, top)
+    cmds = corpus()
+    with tempfile.TemporaryDirectory() as tmp:
+        archive = subprocess.run(
+            ["git", "archive", ref, prefix], cwd=top, capture_output=True, check=True
+        ).stdout
+        subprocess.run(["tar", "-x", "-C", tmp], input=archive, check=True)
+        corpus_path = os.path.join(tmp, "corpus.pkl")
+        with open(corpus_path, "wb") as f:
+            pickle.dump(cmds, f)
+        old = _run(os.path.join(tmp, prefix), corpus_path)
+        new = _run(HERE, corpus_path)
+
+    # State keys added since `ref` are not a difference in dispatch.
+    common = set(old[0][1]) & set(new[0][1]) if old and new else set()
+    mismatches = 0
+    for i, (cmd, a, b) in enumerate(zip(cmds, old, new)):
+        a = (a[0], {k: a[1][k] for k in common}, a[2])
+        b = (b[0], {k: b[1][k] for k in common}, b[2])
+        if a != b:
+            mismatches += 1
+            if mismatches <= show:
+                print(f"#{i} CDB {cmd[0].hex(' ').upper()} dir={cmd[1]}:\n  {ref}: {a}\n  tree: {b}")
+    print(f"{len(cmds)} commands, {mismatches} differ between {ref} and the working tree")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare VirtualSEM responses between a git revision and the working tree"
+    )
+    parser.add_argument("--ref", default="HEAD", help="git revision to compare with")
+    parser.add_argument("--show", type=int, default=10, help="differences to print")
+    parser.add_argument("--dump", metavar="CORPUS", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.dump:
+        sys.path.insert(0, os.getcwd())
+        with open(args.dump, "rb") as f:
+            cmds = pickle.load(f)
+        pickle.dump(dump(cmds), sys.stdout.buffer)
+    else:
+        sys.exit(1 if check(args.ref, args.show) else 0)
@@ -0,0 +1,166 @@
+import json
+import logging
+import math
+import random
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger("VirtualSEM")
+
+# --- Sense Data ---
+# Fixed-format sense (0x70), 18 bytes, same layout BridgeSEM fakes for
+# CheckSemStatus: [2] sense key, [7] additional length, [12] ASC, [13] ASCQ.
+CHECK_CONDITION = 0x02
+SS_ERR = 4
+
+SENSE_PRESETS = {
+    # Power on / bus reset: the bridge retries FA commands on this.
+    "unit_attention": (0x06, 0x29, 0x00),
+    # LUN not ready, becoming ready.
+    "not_ready": (0x02, 0x04, 0x01),
+    # SCSI parity error.
+    "aborted": (0x0B, 0x47, 0x00),
+    # Invalid field in CDB.
+    "illegal_request": (0x05, 0x24, 0x00),
+}
+
+
+def fixed_sense(key, asc, ascq=0):
+    sense = bytearray(18)
+    sense[0] = 0x70
+    sense[2] = key & 0x0F
+    sense[7] = 0x0A
+    sense[12] = asc
+    sense[13] = ascq
+    return bytes(sense)
+
+
+# --- Latency Distributions ---
+# Specs are JSON objects in milliseconds:
+#   {"dist": "fixed", "ms": 2}
+#   {"dist": "uniform", "lo_ms": 1, "hi_ms": 5}
+#   {"dist": "exp", "mean_ms": 3}
+#   {"dist": "lognormal", "median_ms": 0.8, "sigma": 0.7}
+# plus an optional heavy tail, e.g. to push past the shim's 2 s timeout:
+#   "tail": {"p": 0.001, "ms": 2500}
+
+
+def make_latency(spec):
+    """Returns a sampler rng -> seconds for a latency spec (None -> no delay)."""
+    if not spec:
+        return None
+    dist = spec.get("dist", "fixed")
+    if dist == "fixed":
+        s = spec.get("ms", 0) / 1000.0
+        base = lambda rng: s
+    elif dist == "uniform":
+        lo, hi = spec["lo_ms"] / 1000.0, spec["hi_ms"] / 1000.0
+        base = lambda rng: rng.uniform(lo, hi)
+    elif dist == "exp":
+        rate = 1000.0 / spec["mean_ms"]
+        base = lambda rng: rng.expovariate(rate)
+    elif dist == "lognormal":
+        mu = math.log(spec["median_ms"] / 1000.0)
+        sigma = spec.get("sigma", 0.5)
+        base = lambda rng: rng.lognormvariate(mu, sigma)
+    else:
+        raise ValueError(f"Unknown latency distribution: {dist}")
+
+    tail = spec.get("tail")
+    if not tail:
+        return base
+    tail_p = tail["p"]
+    tail_s = tail["ms"] / 1000.0
+    return lambda rng: tail_s if rng.random() < tail_p else base(rng)
+
+
+# What to do with one SRB. delay is seconds before anything happens; sense
+# replaces execution with CHECK CONDITION; drop closes the connection
+# without answering; partial sends that fraction of the response and
+# then closes.
+Fault = namedtuple("Fault", "delay sense drop partial")
+
+
+class FaultRule:
+    def __init__(self, spec):
+        self.latency = make_latency(spec.get("latency"))
+        cc = spec.get("check_condition") or {}
+        self.cc_p = cc.get("p", 0.0)
+        if "preset" in cc:
+            key, asc, ascq = SENSE_PRESETS[cc["preset"]]
+        else:
+            key = cc.get("sense_key", 0x06)
+            asc = cc.get("asc", 0x29)
+            ascq = cc.get("ascq", 0x00)
+        self.sense = fixed_sense(key, asc, ascq)
+        self.drop_p = spec.get("drop", 0.0)
+        self.partial_p = spec.get("partial", 0.0)
+
+
+class FaultInjector:
+    """
+    Per-opcode fault plan applied in front of process_scsi_command.
+
+    The config maps opcodes (hex strings, "*" for the default) to a rule:
+
+        {
+          "seed": 1,
+          "*":  {"latency": {"dist": "lognormal", "median_ms": 0.5}},
+          "FA": {"check_condition": {"p": 0.05, "preset": "unit_attention"}},
+          "C4": {"drop": 0.001, "partial": 0.001,
+                 "latency": {"dist": "exp", "mean_ms": 2,
+                             "tail": {"p": 0.001, "ms": 2500}}}
+        }
+
+    Opcodes without a rule fall back to "*"; without that, they pass
+    untouched. Draws come from one seeded RNG, so a single client sees the
+    same fault sequence on every run.
+    """
+
+    def __init__(self, config=None, seed=None):
+        config = dict(config or {})
+        if seed is None:
+            seed = config.pop("seed", None)
+        else:
+            config.pop("seed", None)
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.default = FaultRule(config.pop("*")) if "*" in config else None
+        self.rules = {int(op, 16): FaultRule(spec) for op, spec in config.items()}
+        self.counts = {"delayed": 0, "check_condition": 0, "dropped": 0, "partial": 0}
+
+    @classmethod
+    def from_file(cls, path, seed=None):
+        with open(path, "r") as f:
+            return cls(json.load(f), seed=seed)
+
+    def decide(self, cdb):
+        """Returns a Fault for this CDB, or None to run it normally."""
+        rule = self.rules.get(cdb[0], self.default)
+        if rule is None:
+            return None
+        with self.lock:
+            rng = self.rng
+            delay = rule.latency(rng) if rule.latency else 0.0
+            drop = rule.drop_p > 0 and rng.random() < rule.drop_p
+            sense = None
+            partial = 0.0
+            if not drop:
+                if rule.cc_p > 0 and rng.random() < rule.cc_p:
+                    sense = rule.sense
+                elif rule.partial_p > 0 and rng.random() < rule.partial_p:
+                    partial = rng.random()
+            if delay:
+                self.counts["delayed"] += 1
+            if drop:
+                self.counts["dropped"] += 1
+            elif sense:
+                self.counts["check_condition"] += 1
+            elif partial:
+                self.counts["partial"] += 1
+        if not (delay or drop or sense or partial):
+            return None
+        return Fault(delay, sense, drop, partial)
+
+    def summary(self):
+        return ", ".join(f"{k}={v}" for k, v in self.counts.items())
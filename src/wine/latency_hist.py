@@ -0,0 +1,120 @@
+class LogLinearHistogram:
+    """
+    HDR-style histogram for non-negative integer samples (e.g. ns).
+
+    Values below 2**sub_bits are counted exactly; above that, every power
+    of two is split into 2**(sub_bits - 1) linear buckets, so the relative
+    error of any reported percentile is below 2**-(sub_bits - 1) (~3% at
+    the default 6 bits) regardless of range. record() is a couple of
+    integer operations and a list increment; histograms from different
+    threads or processes merge by adding counts.
+    """
+
+    def __init__(self, sub_bits=6, max_bits=40):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half = self.sub_count >> 1
+        self.max_value = (1 << max_bits) - 1
+        # Linear region [0, sub_count) then `half` buckets per extra bit.
+        self.counts = [0] * (self.sub_count + (max_bits - sub_bits) * self.half)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half + ((value >> shift) - self.half)
+
+    def _bucket_range(self, index):
+        if index < self.sub_count:
+            return index, index
+        shift = (index - self.sub_count) // self.half + 1
+        top = (index - self.sub_count) % self.half + self.half
+        lo = top << shift
+        return lo, lo + (1 << shift) - 1
+
+    def record(self, value, count=1):
+        value = int(value)
+        if value < 0:
+            value = 0
+        elif value > self.max_value:
+            value = self.max_value
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total = self.sum = self.max = 0
+        self.min = None
+
+    @property
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def percentile(self, p):
+        """Value at percentile p (0-100): bucket midpoint, clamped to min/max."""
+        if not self.total:
+            return 0
+        rank = max(1, int(-(-self.total * p // 100)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if not c:
+                continue
+            seen += c
+            if seen >= rank:
+                lo, hi = self._bucket_range(i)
+                return min(max((lo + hi) // 2, self.min), self.max)
+        return self.max
+
+    def buckets(self):
+        """(upper_bound, cumulative_count) for every non-empty bucket."""
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                yield self._bucket_range(i)[1], seen
+
+    def count_le(self, value):
+        """Samples <= value, to bucket resolution (for fixed export bounds)."""
+        value = int(value)
+        if value < 0:
+            return 0
+        if value >= self.max_value:
+            return self.total
+        return sum(self.counts[: self._index(value) + 1])
+
+    def to_dict(self):
+        return {
+            "sub_bits": self.sub_bits,
+            "counts": {i: c for i, c in enumerate(self.counts) if c},
+            "total": self.total,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, d, max_bits=40):
+        h = cls(d["sub_bits"], max_bits)
+        for i, c in d["counts"].items():
+            h.counts[int(i)] = c
+        h.total, h.sum, h.min, h.max = d["total"], d["sum"], d["min"], d["max"]
+        return h
@@ -3,16 +3,36 @@ import http.server
 import socketserver
 import json
 import os
-import re
+import sqlite3
+import sys
+import time
 import urllib.parse
-from datetime import datetime
 
 # Configuration
 PORT = 8080
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The log parser is shared with the tools one directory up.
+sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, "..")))
+from session_log import LOG_SUFFIXES, LogEvent, format_time, hex_field, latency_ns, read_session
+from session_index import SessionIndex
 LOG_DIR = os.path.abspath(os.path.join(BASE_DIR, "../logs"))
 PROTOCOL_FILE = os.path.abspath(os.path.join(BASE_DIR, "../protocol_definitions.json"))
 
+# Search index over LOG_DIR, brought up to date at most this often
+SEARCH_REFRESH_S = 5.0
+_index = None
+_index_updated = 0.0
+
+def search_index():
+    global _index, _index_updated
+    if _index is None:
+        _index = SessionIndex(LOG_DIR)
+    if time.monotonic() - _index_updated >= SEARCH_REFRESH_S:
+        _index.update()
+        _index_updated = time.monotonic()
+    return _index
+
 # HTML Template
 HTML_FILE = os.path.join(BASE_DIR, "index.html")
 
@@ -38,7 +58,8 @@ class LogHandler(http.server.BaseHTTPRequestHandler):
             self.end_headers()
             try:
                 if os.path.exists(LOG_DIR):
-                    files = [f for f in os.listdir(LOG_DIR) if f.endswith('.log')]
+                    # Rotated segments are archived as .log.gz / .log.zst
+                    files = [f for f in os.listdir(LOG_DIR) if f.endswith(LOG_SUFFIXES)]
                     files.sort(reverse=True) # Newest first
                     self.wfile.write(json.dumps(files).encode('utf-8'))
                 else:
@@ -68,6 +89,32 @@ class LogHandler(http.server.BaseHTTPRequestHandler):
             self.wfile.write(json.dumps(parsed_logs).encode('utf-8'))
             return
             
+        elif path == '/api/search':
+            # ?q=name:StartEvac_M1&then=dir:res status:4&within=50&limit=200
+            query = urllib.parse.parse_qs(parsed.query)
+            q = query.get('q', [''])[0]
+            if not q:
+                self.send_error(400, "Missing q")
+                return
+            try:
+                t0 = time.perf_counter()
+                hits = search_index().search(
+                    q,
+                    then=query.get('then', [None])[0],
+                    within=int(query.get('within', ['50'])[0]),
+                    limit=int(query.get('limit', ['200'])[0]),
+                )
+                elapsed_ms = (time.perf_counter() - t0) * 1e3
+            except (ValueError, sqlite3.OperationalError) as e:
+                self.send_error(400, str(e))
+                return
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            result = {'query': q, 'hits': hits, 'count': len(hits), 'elapsed_ms': round(elapsed_ms, 2)}
+            self.wfile.write(json.dumps(result).encode('utf-8'))
+            return
+
         elif path == '/api/protocol':
              if os.path.exists(PROTOCOL_FILE):
                 self.send_response(200)
@@ -83,89 +130,34 @@ class LogHandler(http.server.BaseHTTPRequestHandler):
 
     def parse_log_file(self, filepath):
         entries = []
-        # Regex to match format:
-        # [TIMESTAMP] [LEVEL] [DIRECTION] [OPCODE_NAME] | CDB: [HEX] | DATA: [HEX] -> Status=[STATUS]
-        # Example: 2026-02-01 00:04:16.976 [INFO] [CMD] SetSpeed             | CDB: 00                   | DATA: [Empty] -> Status=1
-        
-        # We can split by '|' and then parse parts
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                line = line.strip()
-                if not line: continue
-                
-                try:
-                    # Basic structure check
-                    if '|' in line:
-                        parts = line.split('|')
-                        left_part = parts[0]
-                        
-                        # Parse Left: TS [LEVEL] [DIR] NAME
-                        # Regex for the brackets part
-                        meta_match = re.match(r'^([\d\-\:\. ]+) \[([^\]]+)\] \[([^\]]+)\] (.+)$', left_part.strip())
-                        if meta_match:
-                            ts, lvl, dir_, name = meta_match.groups()
-                        else:
-                            # Try parsing EVT which might be different: TS [LEVEL] [EVT] Msg
-                            meta_match = re.match(r'^([\d\-\:\. ]+) \[([^\]]+)\] \[EVT\] (.+)$', left_part.strip())
-                            if meta_match:
-                                ts, lvl, msg = meta_match.groups()
-                                entries.append({
-                                    'time': ts.strip(),
-                                    'level': lvl.strip(),
-                                    'dir': 'EVT',
-                                    'cmd': 'System Event',
-                                    'cdb': '',
-                                    'data': msg.strip(),
-                                    'status': ''
-                                })
-                                continue
-                            continue
-                        
-                        # Parse CDB and Data
-                        cdb_part = ""
-                        data_part = ""
-                        status_part = ""
-                        
-                        if len(parts) > 1:
-                            # CDB part usually: " CDB: 00 01 "
-                            # Data part usually: " DATA: ... -> Status=1 "
-                            
-                            rest = "|".join(parts[1:])
-                            
-                            # Split by "->" for status
-                            if '->' in rest:
-                                content, status_raw = rest.split('->')
-                                status_part = status_raw.replace('Status=', '').strip()
-                            else:
-                                content = rest
-                            
-                            # Split content by "| DATA:" if present?
-                            # Actually our format is " | CDB: ... | DATA: ... "
-                            # So split via pipe is safer
-                            
-                            # Re-split the original line carefully or trust the pipes
-                            # bridge_sem.py: f"{ts} [{level:<4}] [{direction}] {cmd_name:<20} | CDB: {cdb_str:<20} {data_str}-> Status={status}\n"
-                            
-                            cdb_match = re.search(r'CDB:\s*([0-9a-fA-F ]+)', content)
-                            if cdb_match:
-                                cdb_part = cdb_match.group(1).strip()
-                            
-                            data_match = re.search(r'DATA:\s*(.+)$', content)
-                            if data_match:
-                                data_part = data_match.group(1).strip()
-                        
-                        entries.append({
-                            'time': ts.split(' ')[1], # Just Time for table
-                            'level': lvl.strip(),
-                            'dir': dir_.strip(),
-                            'cmd': name.strip(),
-                            'cdb': cdb_part,
-                            'data': data_part,
-                            'status': status_part
-                        })
-                except Exception:
-                    continue # Skip malformed lines
-                    
+        for rec in read_session(filepath):
+            if isinstance(rec, LogEvent):
+                entries.append({
+                    'time': format_time(rec.t, date=True),
+                    'level': rec.level,
+                    'dir': 'EVT',
+                    'cmd': 'System Event',
+                    'cdb': '',
+                    'data': rec.message.strip(),
+                    'status': '',
+                    'txn': '',
+                    'latency': ''
+                })
+            else:
+                # Bridge logs with TXN ids: latency from the RES line's
+                # start/end ns, no pairing needed
+                ns = latency_ns(rec)
+                entries.append({
+                    'time': format_time(rec.t), # Just Time for table
+                    'level': rec.level,
+                    'dir': rec.direction,
+                    'cmd': rec.name,
+                    'cdb': rec.cdb.hex(' ').upper(),
+                    'data': hex_field(rec.data, rec.data_truncated),
+                    'status': str(rec.status),
+                    'txn': str(rec.txn) if rec.txn is not None else '',
+                    'latency': f"{ns / 1e6:.3f}" if ns is not None else ''
+                })
         return entries
 
 def run():
@@ -0,0 +1,479 @@
+import argparse
+import glob
+import gzip
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+logger = logging.getLogger("BridgeSEM")
+
+# --- Segments ---
+# A session's log is split into segments:
+#   sem_session_20260201_220324.log        segment 0
+#   sem_session_20260201_220324.1.log      segment 1, ...
+# Closed segments are compressed in the background to <segment>.zst (or
+# .gz without the zstandard module) and the plain file removed. Each
+# segment is a complete log on its own (session_log.read_session opens the
+# compressed ones too); an EVT line at the end of one segment and the start
+# of the next links them.
+
+SEGMENT_RE = re.compile(r"^(?P<base>.*?)(?:\.(?P<n>\d+))?\.log(?P<comp>\.zst|\.gz)?$")
+
+
+def segment_path(base_path, index):
+    """Path of segment `index` of the session whose first segment is base_path."""
+    if index == 0:
+        return base_path
+    return f"{base_path[: -len('.log')]}.{index}.log"
+
+
+def segment_paths(path):
+    """
+    All segments of the session `path` belongs to, in order, each as the
+    file that exists now (plain while open, compressed once closed).
+    """
+    m = SEGMENT_RE.match(path)
+    if not m:
+        return [path]
+    base = m.group("base")
+    found = {}
+    for candidate in glob.glob(glob.escape(base) + "*.log*"):
+        cm = SEGMENT_RE.match(candidate)
+        if not cm or cm.group("base") != base:
+            continue
+        index = int(cm.group("n") or 0)
+        # A plain file wins over a compressed one still being written.
+        if index not in found or not cm.group("comp"):
+            found[index] = candidate
+    return [found[i] for i in sorted(found)]
+
+
+def read_segments(path):
+    """Records of every segment of a session, line numbers counted per segment."""
+    from session_log import read_session
+
+    for seg in segment_paths(path):
+        yield from read_session(seg)
+
+
+# --- Compression ---
+
+
+def default_codec():
+    return "zstd" if HAS_ZSTD else "gzip"
+
+
+def compress_file(path, codec=None, level=None):
+    """
+    Compress `path` to path.zst / path.gz and remove the original. The
+    output is written under a temporary name and renamed, so a crash
+    leaves either the plain segment or the finished archive, never a
+    truncated one.
+    """
+    codec = codec or default_codec()
+    if codec == "zstd":
+        if not HAS_ZSTD:
+            raise RuntimeError("zstandard is not installed")
+        out_path = path + ".zst"
+        tmp = out_path + ".tmp"
+        cctx = zstandard.ZstdCompressor(level=level or 6)
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            cctx.copy_stream(src, dst)
+    elif codec == "gzip":
+        out_path = path + ".gz"
+        tmp = out_path + ".tmp"
+        with open(path, "rb") as src, gzip.open(tmp, "wb", compresslevel=level or 6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+    else:
+        raise ValueError(f"Unknown codec: {codec}")
+    os.replace(tmp, out_path)
+    os.remove(path)
+    return out_path
+
+
+class Compressor:
+    """
+    One background thread compressing closed segments in order. Failures
+    are logged and leave the plain segment in place.
+    """
+
+    def __init__(self, codec=None):
+        self.codec = codec or default_codec()
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, path):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self._run, name="log-compress", daemon=True
+                )
+                self.thread.start()
+        self.jobs.put(path)
+
+    def _run(self):
+        while True:
+            path = self.jobs.get()
+            try:
+                t0 = time.perf_counter()
+                size = os.path.getsize(path)
+                out = compress_file(path, self.codec)
+                ratio = size / max(os.path.getsize(out), 1)
+                logger.info(
+                    f"Log: compressed {os.path.basename(out)} "
+                    f"({size / 1e6:.1f} MB, {ratio:.1f}x, {time.perf_counter() - t0:.2f}s)"
+                )
+            except Exception as e:
+                logger.error(f"Log: failed to compress {path}: {e}")
+            finally:
+                self.jobs.task_done()
+
+    def drain(self):
+        """Block until every submitted segment is compressed."""
+        self.jobs.join()
+
+
+COMPRESSOR = None
+
+
+def compressor():
+    global COMPRESSOR
+    if COMPRESSOR is None:
+        codec = os.environ.get("BRIDGE_LOG_COMPRESS", "")
+        COMPRESSOR = Compressor(codec if codec in ("zstd", "gzip") else None)
+    return COMPRESSOR
+
+
+# --- Flushing ---
+
+
+class Flusher:
+    """
+    One background thread that flushes open RotatingLogFiles whose buffer
+    has held data for their flush interval, so an idle (or hung) session
+    is on disk without waiting for its next write.
+    """
+
+    def __init__(self, period_s=0.25):
+        self.period_s = period_s
+        self.files = set()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def add(self, log_file):
+        with self.lock:
+            self.files.add(log_file)
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self._run, name="log-flush", daemon=True
+                )
+                self.thread.start()
+
+    def discard(self, log_file):
+        with self.lock:
+            self.files.discard(log_file)
+
+    def _run(self):
+        while True:
+            time.sleep(self.period_s)
+            with self.lock:
+                files = list(self.files)
+            now = time.monotonic()
+            for log_file in files:
+                try:
+                    log_file.flush_if_due(now)
+                except Exception as e:
+                    logger.error(f"Log: failed to flush {log_file.path}: {e}")
+
+
+FLUSHER = None
+
+
+def flusher():
+    global FLUSHER
+    if FLUSHER is None:
+        FLUSHER = Flusher()
+    return FLUSHER
+
+
+# --- Rotating file ---
+
+
+class RotatingLogFile:
+    """
+    Block-buffered text file that starts a new segment once the current
+    one reaches max_bytes or has been open max_age_s, handing the closed
+    one to the compressor.
+
+    The buffer is flushed at most flush_interval_s after a write (on the
+    next write, or by the shared Flusher thread when none comes), instead
+    of one write() syscall per line as with line buffering. Segments are
+    binary buffered files, whose writes and flushes are serialized
+    internally, so the Flusher needs no lock on the write path.
+    on_close(next_path) and on_open(prev_path) run around a rotation so
+    the caller can write its own EVT lines into both segments.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=64 << 20,
+        max_age_s=3600.0,
+        flush_interval_s=1.0,
+        buffer_size=1 << 16,
+        compress=True,
+        on_close=None,
+        on_open=None,
+    ):
+        self.base_path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.flush_interval_s = flush_interval_s
+        self.buffer_size = buffer_size
+        self.compress = compress
+        self.on_close = on_close
+        self.on_open = on_open
+        self.index = 0
+        self.file = None
+        self._rotating = False
+        self._open(path)
+        if flush_interval_s:
+            flusher().add(self)
+
+    def _open(self, path):
+        self.path = path
+        self.file = open(path, "wb", buffering=self.buffer_size)
+        self.size = 0
+        self.opened = time.monotonic()
+        self.last_flush = self.opened
+        self.dirty = False
+
+    def write(self, text):
+        f = self.file
+        if f is None:
+            return
+        data = text.encode("utf-8")
+        f.write(data)
+        self.size += len(data)
+        self.dirty = True
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval_s:
+            self.dirty = False
+            f.flush()
+            self.last_flush = now
+        if not self._rotating and (
+            (self.max_bytes and self.size >= self.max_bytes)
+            or (self.max_age_s and now - self.opened >= self.max_age_s)
+        ):
+            self.rotate()
+
+    def rotate(self):
+        old = self.path
+        new = segment_path(self.base_path, self.index + 1)
+        self._rotating = True
+        try:
+            if self.on_close:
+                self.on_close(new)
+            self.file.close()
+            if self.compress:
+                compressor().submit(old)
+            self.index += 1
+            self._open(new)
+            if self.on_open:
+                self.on_open(old)
+        finally:
+            self._rotating = False
+
+    def flush(self):
+        if self.file:
+            self.dirty = False
+            self.file.flush()
+            self.last_flush = time.monotonic()
+
+    def flush_if_due(self, now):
+        """Called by the Flusher: flush a buffer that has waited flush_interval_s."""
+        f = self.file
+        if f is None or not self.dirty or now - self.last_flush < self.flush_interval_s:
+            return
+        # Cleared first: a line written during the flush marks it again.
+        self.dirty = False
+        try:
+            f.flush()
+        except ValueError:
+            return  # closed by a rotation meanwhile, which flushed it
+        self.last_flush = now
+
+    def close(self):
+        flusher().discard(self)
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if self.compress:
+            compressor().submit(self.path)
+
+
+def from_env(path, on_close=None, on_open=None):
+    """
+    RotatingLogFile configured by the bridge's environment:
+      BRIDGE_LOG_MAX_MB       segment size (default 64, 0 = unlimited)
+      BRIDGE_LOG_ROTATE_S     segment age (default 3600, 0 = unlimited)
+      BRIDGE_LOG_FLUSH_S      flush interval (default 1.0; 0 = every line)
+      BRIDGE_LOG_COMPRESS     zstd / gzip / none (default zstd if installed)
+    """
+    codec = os.environ.get("BRIDGE_LOG_COMPRESS", "")
+    return RotatingLogFile(
+        path,
+        max_bytes=int(float(os.environ.get("BRIDGE_LOG_MAX_MB", "64")) * (1 << 20)),
+        max_age_s=float(os.environ.get("BRIDGE_LOG_ROTATE_S", "3600")),
+        flush_interval_s=float(os.environ.get("BRIDGE_LOG_FLUSH_S", "1.0")),
+        compress=codec != "none",
+        on_close=on_close,
+        on_open=on_open,
+    )
+
+
+# --- Archival ---
+
+
+def _session_ended(path):
+    """True if the plain log at path ends with the 'Session Ended' EVT line."""
+    with open(path, "rb") as f:
+        f.seek(max(os.path.getsize(path) - 256, 0))
+        tail = f.read().rstrip()
+    return tail.rsplit(b"\n", 1)[-1].endswith(b"[EVT] Session Ended")
+
+
+def archive(log_dir, older_than_s=3600.0, codec=None, dry_run=False, include_open=False):
+    """
+    Compress plain .log files in log_dir (including _decoded/_deep
+    variants) last modified more than older_than_s ago.
+
+    The last plain segment of a session may still be open (an idle session
+    writes nothing for hours), so it is skipped unless it ends with the
+    'Session Ended' EVT line. include_open compresses it anyway, e.g. for
+    the logs of a bridge that crashed.
+    """
+    cutoff = time.time() - older_than_s
+    paths = sorted(glob.glob(os.path.join(log_dir, "*.log")))
+    last = {}
+    for path in paths:
+        m = SEGMENT_RE.match(path)
+        base, index = m.group("base"), int(m.group("n") or 0)
+        if index >= last.get(base, (-1, None))[0]:
+            last[base] = (index, path)
+    still_open = set()
+    if not include_open:
+        still_open = {path for _, path in last.values() if not _session_ended(path)}
+    done = []
+    for path in paths:
+        if os.path.getmtime(path) > cutoff:
+            continue
+        if path in still_open:
+            print(f"skip {path}: no 'Session Ended', may still be open")
+            continue
+        if dry_run:
+            print(f"would compress {path}")
+            continue
+        size = os.path.getsize(path)
+        out = compress_file(path, codec)
+        print(f"{path}: {size / 1e6:.1f} MB -> {os.path.getsize(out) / 1e6:.1f} MB")
+        done.append(out)
+    return done
+
+
+def bench(lines=200_000, line=None):
+    """
+    Per-line write cost of a line-buffered file (the old SCSILogger) vs
+    the block-buffered RotatingLogFile, into a temporary directory.
+    """
+    import tempfile
+
+    line = line or (
+        "2026-02-01 22:03:24.311 [LOG ] [RES] GetStatusBlock       | "
+        "CDB: D0 00 00 00 80 00    | DATA: 00 00 00 00 04 00 40 B7 4A 45 4F 4C "
+        "20 20 20 20 ... -> Status=1\n"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "line.log")
+        with open(path, "w", buffering=1) as f:
+            t0 = time.perf_counter()
+            for _ in range(lines):
+                f.write(line)
+            line_ns = (time.perf_counter() - t0) / lines * 1e9
+
+        path = os.path.join(tmp, "block.log")
+        f = RotatingLogFile(path, max_bytes=16 << 20, compress=False)
+        t0 = time.perf_counter()
+        for _ in range(lines):
+            f.write(line)
+        f.close()
+        block_ns = (time.perf_counter() - t0) / lines * 1e9
+        segments = len(segment_paths(path))
+
+        codec = default_codec()
+        size = sum(os.path.getsize(p) for p in segment_paths(path))
+        first = segment_paths(path)[0]
+        first_size = os.path.getsize(first)
+        t0 = time.perf_counter()
+        out = compress_file(first, codec)
+        elapsed = time.perf_counter() - t0
+        compressed = os.path.getsize(out)
+
+    print(f"Write: line-buffered {line_ns:.0f} ns/line, rotating {block_ns:.0f} ns/line")
+    print(f"  {lines} lines, {size / 1e6:.1f} MB in {segments} segments")
+    print(
+        f"Compress ({codec}): {first_size / 1e6:.1f} MB segment in {elapsed:.2f}s, "
+        f"{first_size / max(compressed, 1):.1f}x"
+    )
+    return line_ns, block_ns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session log rotation and archival")
+    parser.add_argument(
+        "--archive",
+        metavar="DIR",
+        help="compress plain .log files in DIR (e.g. logs/)",
+    )
+    parser.add_argument(
+        "--older-than",
+        type=float,
+        default=3600.0,
+        help="only files untouched for this many seconds",
+    )
+    parser.add_argument("--codec", choices=("zstd", "gzip"), default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--include-open",
+        action="store_true",
+        help="also compress a session's last segment without 'Session Ended'",
+    )
+    parser.add_argument(
+        "--segments", metavar="LOG", help="list the segments of a session"
+    )
+    parser.add_argument("--bench", action="store_true", help="measure per-line write cost")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.archive:
+        archive(args.archive, args.older_than, args.codec, args.dry_run, args.include_open)
+    elif args.segments:
+        for seg in segment_paths(args.segments):
+            print(seg)
+    elif args.bench:
+        bench()
+    else:
+        parser.print_help()
@@ -0,0 +1,234 @@
+import argparse
+import json
+
+import numpy as np
+
+from session_log import LogEntry, read_session
+
+# --- CDB Matrix ---
+# Every CMD line becomes one row of a uint8 matrix: CDB bytes zero-padded to
+# CDB_WIDTH, then the CDB length. An FA command that carried data-out is
+# mined as its inner CDB, since that is what the decoder names FA<...>.
+# Identical rows are counted once (np.unique), so a capture with millions
+# of polls costs as many rows as it has distinct CDBs.
+
+CDB_WIDTH = 16
+LEN_COL = CDB_WIDTH
+
+
+def cdb_matrix(paths):
+    """(rows, counts, first_seen) over the CMD lines of all sessions."""
+    buf = bytearray()
+    origins = []
+    for path in paths:
+        for rec in read_session(path):
+            if not isinstance(rec, LogEntry) or rec.direction != "CMD" or not rec.cdb:
+                continue
+            cdb = rec.payload if rec.cdb[0] == 0xFA and rec.payload else rec.cdb
+            cdb = cdb[:CDB_WIDTH]
+            buf += cdb.ljust(CDB_WIDTH, b"\x00")
+            buf.append(len(cdb))
+            origins.append((path, rec.line_no))
+    if not origins:
+        return np.zeros((0, CDB_WIDTH + 1), dtype=np.uint8), np.zeros(0, dtype=np.int64), []
+    matrix = np.frombuffer(bytes(buf), dtype=np.uint8).reshape(-1, CDB_WIDTH + 1)
+    rows, first, counts = unique_rows(matrix)
+    return rows, counts, [origins[i] for i in first]
+
+
+def unique_rows(matrix):
+    """
+    np.unique(matrix, axis=0) with first indices and counts, done as a
+    lexsort over the rows packed into big-endian uint64 words (several
+    times faster than np.unique's row path on millions of rows).
+    """
+    n, width = matrix.shape
+    words = -(-width // 8)
+    packed = np.zeros((n, words * 8), dtype=np.uint8)
+    packed[:, :width] = matrix
+    keys = packed.view(">u8")
+    order = np.lexsort(keys.T[::-1])  # stable: first occurrence leads its run
+    keys = keys[order]
+    new = np.ones(n, dtype=bool)
+    new[1:] = (keys[1:] != keys[:-1]).any(axis=1)
+    starts = np.flatnonzero(new)
+    counts = np.diff(np.append(starts, n))
+    first = order[starts]
+    return matrix[first], first, counts
+
+
+def column_histograms(rows, weights):
+    """(width, 256) array: weighted count of each byte value per column."""
+    width = rows.shape[1]
+    keys = rows.astype(np.int64) + np.arange(width) * 256
+    w = np.repeat(weights, width)
+    return np.bincount(keys.ravel(), weights=w, minlength=width * 256).reshape(width, 256)
+
+
+# --- Clustering ---
+
+
+def is_unresolved(name):
+    return name.startswith("Unknown") or name.endswith("_Generic")
+
+
+def cluster(rows, weights, max_split=16, min_count=1):
+    """
+    Split rows into clusters that a single `matches` rule can describe.
+
+    Columns holding one value are constant and become the rule; among the
+    varying columns, the one with the fewest distinct values (at most
+    max_split, preferring the lowest offset on ties) is taken as a
+    sub-opcode and the rows are split on it. Columns with more values than
+    that are parameters and stay out of the rule. Returns
+    [(constant {offset: value}, varying [offsets], row indices)].
+    """
+    out = []
+    stack = [np.arange(len(rows))]
+    while stack:
+        idx = stack.pop()
+        cdb_len = int(rows[idx[0], LEN_COL])
+        hist = column_histograms(rows[idx, :cdb_len], weights[idx])
+        distinct = (hist > 0).sum(axis=1)
+        constant = {
+            int(c): int(np.argmax(hist[c])) for c in np.flatnonzero(distinct == 1)
+        }
+        varying = np.flatnonzero(distinct > 1)
+        splittable = varying[distinct[varying] <= max_split]
+        if len(splittable) == 0:
+            out.append((constant, varying.tolist(), idx))
+            continue
+        col = splittable[np.argmin(distinct[splittable])]
+        values = rows[idx, col]
+        for v in np.unique(values):
+            child = idx[values == v]
+            if weights[child].sum() >= min_count:
+                stack.append(child)
+    return out
+
+
+def mine(paths, decoder=None, max_split=16, min_count=2, include_resolved=False):
+    """
+    Proposed rules for CDBs the current definitions leave unresolved
+    (Unknown(0xNN) or <Group>_Generic), grouped by opcode hex:
+      {"0xD0": [{"name", "level", "match", "count", "varying", "example",
+                 "seen", "decodes_as"}]}
+    Rules are meant to be appended to the group's `matches`, after the
+    existing ones, so they never shadow a rule that already matches.
+    include_resolved=True clusters every command instead, to audit rules
+    that lump distinct CDB shapes under one name.
+    """
+    if decoder is None:
+        from virtual_sem import ProtocolDecoder
+
+        decoder = ProtocolDecoder()
+    rows, counts, seen = cdb_matrix(paths)
+    names = [decoder.decode(bytes(r[: r[LEN_COL]]))[0] for r in rows]
+    if not include_resolved:
+        keep = np.array([is_unresolved(n) for n in names], dtype=bool)
+        rows, counts = rows[keep], counts[keep]
+        seen = [s for s, k in zip(seen, keep) if k]
+        names = [n for n, k in zip(names, keep) if k]
+
+    proposals = {}
+    # One clustering per (opcode, CDB length): a 6- and a 10-byte form of an
+    # opcode never share a rule's offsets meaningfully.
+    group_key = rows[:, 0].astype(np.int32) << 8 | rows[:, LEN_COL]
+    for key in np.unique(group_key):
+        sel = np.flatnonzero(group_key == key)
+        opcode = int(key >> 8)
+        rules = []
+        for constant, varying, idx in cluster(rows[sel], counts[sel], max_split, min_count):
+            members = sel[idx]
+            if counts[members].sum() < min_count:
+                continue
+            best = members[np.argmax(counts[members])]
+            example = rows[best]
+            rules.append(
+                {
+                    "match": {str(c): f"0x{v:02X}" for c, v in sorted(constant.items())},
+                    "count": int(counts[members].sum()),
+                    "varying": varying,
+                    "example": bytes(example[: example[LEN_COL]]).hex(" ").upper(),
+                    "seen": f"{seen[best][0]}:{seen[best][1]}",
+                    "decodes_as": sorted({names[i] for i in members}),
+                }
+            )
+        rules.sort(key=lambda r: -r["count"])
+        group = proposals.setdefault(f"0x{opcode:02X}", [])
+        for rule in rules:
+            rule = {"name": f"Mined_{opcode:02X}_{len(group)}", "level": "LOG", **rule}
+            group.append(rule)
+    return proposals
+
+
+def as_definitions(proposals):
+    """The proposals in protocol_definitions.json shape, counts dropped."""
+    return {
+        "groups": {
+            opcode: {
+                "matches": [
+                    {"name": r["name"], "level": r["level"], "match": r["match"]}
+                    for r in rules
+                ]
+            }
+            for opcode, rules in proposals.items()
+        }
+    }
+
+
+def print_report(proposals):
+    if not proposals:
+        print("Every command decodes with the current definitions.")
+        print("(--all clusters the resolved ones too.)")
+        return
+    for opcode, rules in sorted(proposals.items(), key=lambda kv: -sum(r["count"] for r in kv[1])):
+        total = sum(r["count"] for r in rules)
+        print(f"{opcode}: {total} commands, {len(rules)} proposed rules")
+        for r in rules:
+            match = ", ".join(f"{k}={v[2:]}" for k, v in r["match"].items())
+            var = ",".join(str(c) for c in r["varying"]) or "-"
+            print(f"  {r['count']:>8}  {{{match}}}  varying=[{var}]")
+            print(f"            decodes as {', '.join(r['decodes_as'])}")
+            print(f"            e.g. {r['example']}  ({r['seen']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Propose protocol_definitions.json rules from captured sessions"
+    )
+    parser.add_argument("logs", nargs="+", help="session logs to mine")
+    parser.add_argument(
+        "--max-split",
+        type=int,
+        default=16,
+        help="columns with more distinct values are treated as parameters",
+    )
+    parser.add_argument(
+        "--min-count", type=int, default=2, help="drop clusters seen fewer times"
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="cluster every command, not only unresolved ones",
+    )
+    parser.add_argument("--json", action="store_true", help="print proposals as JSON")
+    parser.add_argument(
+        "-o", "--output", help="write the rules in protocol_definitions.json shape"
+    )
+    args = parser.parse_args()
+
+    proposals = mine(
+        args.logs,
+        max_split=args.max_split,
+        min_count=args.min_count,
+        include_resolved=args.all,
+    )
+    if args.json:
+        print(json.dumps(proposals, indent=1))
+    else:
+        print_report(proposals)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(as_definitions(proposals), f, indent=4)
+        print(f"Rules written to {args.output}")
@@ -1,8 +1,9 @@
 import json
 import os
-import re
 import sys
 
+from session_log import LogEntry, format_time, hex_field, open_log, parse_line, txn_field
+
 
 class ProtocolDecoder:
     def __init__(self, definition_file="protocol_definitions.json"):
@@ -69,56 +70,39 @@ class ProtocolDecoder:
 
 def redecode_log(log_path, def_path):
     decoder = ProtocolDecoder(def_path)
-    output_path = log_path.replace(".log", "_decoded.log")
-
-    # Updated pattern to handle various spacings and the "DATA" part
-    log_pattern = re.compile(
-        r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+) \[(.*?)\] \[(.*?)\] (.*?) \| CDB: (.*?) (\| DATA: (.*?) )?-> Status=(.*)$"
-    )
-
-    with open(log_path, "r") as f, open(output_path, "w") as out:
-        for line in f:
-            line = line.strip()
-            match = log_pattern.match(line)
-            if match:
-                ts, level, direction, old_name, cdb_str, data_full, data_hex, status = (
-                    match.groups()
-                )
-
-                try:
-                    cdb_bytes = bytes.fromhex(cdb_str.strip())
-
-                    # For deep decoding, we need data_bytes if available
-                    data_bytes = None
-                    if data_hex and "Empty" not in data_hex:
-                        # Strip "..." if present
-                        clean_hex = data_hex.split("...")[0].strip()
-                        try:
-                            data_bytes = bytes.fromhex(clean_hex)
-                        except:
-                            pass
-
-                    new_name, new_level = decoder.decode(
-                        cdb_bytes, data_bytes=data_bytes, direction=direction.strip()
-                    )
-
-                    # Format levels and status
-                    status_val = int(status)
-                    final_level = new_level
-                    if status_val != 0 and status_val != 1:
-                        if status_val == 4:
-                            final_level = "ERR "
-                        else:
-                            final_level = "WARN"
-
-                    # Reconstruct line
-                    data_part = data_full if data_full else "| DATA: [Empty] "
-                    new_line = f"{ts} [{final_level:<4}] [{direction:<4}] {new_name:<25} | CDB: {cdb_str.strip():<20} {data_part}-> Status={status}\n"
-                    out.write(new_line)
-                except Exception as e:
-                    out.write(line + "\n")
-            else:
-                out.write(line + "\n")
+    # x.log -> x_decoded.log; archived x.log.gz -> x_decoded.log.gz
+    stem, dot, suffix = log_path.rpartition(".log")
+    output_path = f"{stem}_decoded{dot}{suffix}" if dot else log_path + "_decoded.log"
+
+    with open_log(log_path) as f, open_log(output_path, "w") as out:
+        for line_no, line in enumerate(f, 1):
+            rec = parse_line(line, line_no)
+            if not isinstance(rec, LogEntry):
+                out.write(line.strip() + "\n")
+                continue
+
+            # For deep decoding of FA, the inner CDB is the data-out when the
+            # log has it, otherwise whatever DATA shows
+            data_bytes = rec.payload or rec.data
+            new_name, new_level = decoder.decode(
+                rec.cdb, data_bytes=data_bytes, direction=rec.direction
+            )
+
+            # Format levels and status
+            final_level = new_level
+            if rec.status != 0 and rec.status != 1:
+                if rec.status == 4:
+                    final_level = "ERR "
+                else:
+                    final_level = "WARN"
+
+            # Reconstruct line
+            ts = format_time(rec.t, date=True)
+            cdb_str = rec.cdb.hex(" ").upper()
+            data_str = hex_field(rec.data, rec.data_truncated)
+            extra = (f" {rec.extra}" if rec.extra else "") + txn_field(rec)
+            new_line = f"{ts} [{final_level:<4}] [{rec.direction:<4}] {new_name:<25} | CDB: {cdb_str:<20} | DATA: {data_str} -> Status={rec.status}{extra}\n"
+            out.write(new_line)
 
     print(f"Redecoded log saved to: {output_path}")
 
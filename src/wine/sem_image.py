@@ -0,0 +1,114 @@
+import numpy as np
+
+# Specimen texture edge length. Low magnification shows the whole tile,
+# higher magnification samples an ever smaller window of it (nearest
+# neighbour, like the real scan generator stepping the beam).
+TEXTURE_SIZE = 1024
+# Electrons per pixel at scan_speed 0; each speed step doubles the dwell.
+BASE_DOSE = 8.0
+NOISE_POOL = 4
+
+
+def _box_blur(img, radius):
+    """Separable box blur via cumulative sums (wraps at the edges)."""
+    for axis in (0, 1):
+        pad = np.concatenate(
+            (np.take(img, range(-radius - 1, 0), axis=axis), img,
+             np.take(img, range(radius), axis=axis)),
+            axis=axis,
+        )
+        c = np.cumsum(pad, axis=axis, dtype=np.float64)
+        n = img.shape[axis]
+        hi = np.take(c, range(2 * radius + 1, 2 * radius + 1 + n), axis=axis)
+        lo = np.take(c, range(0, n), axis=axis)
+        img = ((hi - lo) / (2 * radius + 1)).astype(np.float32)
+    return img
+
+
+def build_texture(size=TEXTURE_SIZE, seed=0):
+    """Grainy substrate with scattered particles and bright (edge-effect) rims."""
+    rng = np.random.default_rng(seed)
+    grain = _box_blur(_box_blur(rng.random((size, size), dtype=np.float32), 6), 6)
+    grain = (grain - grain.min()) / max(float(grain.max() - grain.min()), 1e-6)
+
+    yy, xx = np.mgrid[0:size, 0:size].astype(np.float32)
+    particles = np.zeros((size, size), np.float32)
+    rims = np.zeros((size, size), np.float32)
+    n = size * size // 6000
+    cx = rng.random(n) * size
+    cy = rng.random(n) * size
+    radius = rng.uniform(3, 24, n)
+    for x, y, r in zip(cx, cy, radius):
+        x0, x1 = int(max(x - r - 2, 0)), int(min(x + r + 3, size))
+        y0, y1 = int(max(y - r - 2, 0)), int(min(y + r + 3, size))
+        d = np.hypot(xx[y0:y1, x0:x1] - x, yy[y0:y1, x0:x1] - y)
+        np.maximum(particles[y0:y1, x0:x1], d <= r, out=particles[y0:y1, x0:x1])
+        np.maximum(
+            rims[y0:y1, x0:x1],
+            np.exp(-((d - r) ** 2) / 2.0),
+            out=rims[y0:y1, x0:x1],
+        )
+    texture = 0.3 + 0.3 * grain + 0.2 * particles + 0.35 * rims
+    return np.clip(texture, 0.0, 1.0)
+
+
+class SemImageSynth:
+    """
+    On-demand SEM frames for the emulated ReadSemData (ED 82) path.
+
+    The specimen texture and a small pool of unit-variance noise fields are
+    built once. render() picks the field of view from mag_index, samples
+    the texture with precomputed index vectors, and adds shot noise whose
+    relative size falls with the dwell time implied by scan_speed
+    (Gaussian approximation of Poisson statistics, sigma = sqrt(S/N)).
+    """
+
+    def __init__(self, width=640, height=480, seed=0):
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+        self.texture = build_texture(seed=seed)
+        self.noise_pool = [
+            self.rng.standard_normal((height, width), dtype=np.float32)
+            for _ in range(NOISE_POOL)
+        ]
+        self.frame_no = 0
+        self._view_key = None
+        self._rows = None
+        self._cols = None
+
+    @property
+    def frame_bytes(self):
+        return self.width * self.height
+
+    def _view(self, mag_index):
+        # mag_index 100 (the emulator default) shows the full tile; every
+        # doubling of the index halves the field of view.
+        if mag_index == self._view_key:
+            return self._rows, self._cols
+        zoom = max(mag_index, 1) / 100.0
+        step = TEXTURE_SIZE / (max(self.width, self.height) * zoom)
+        cy = cx = TEXTURE_SIZE / 2.0
+        rows = (cy + (np.arange(self.height) - self.height / 2.0) * step).astype(np.intp)
+        cols = (cx + (np.arange(self.width) - self.width / 2.0) * step).astype(np.intp)
+        self._rows = rows % TEXTURE_SIZE
+        self._cols = cols % TEXTURE_SIZE
+        self._view_key = mag_index
+        return self._rows, self._cols
+
+    def render(self, mag_index=100, scan_speed=1):
+        """One 8-bit frame as bytes (row-major, width x height)."""
+        rows, cols = self._view(mag_index)
+        signal = self.texture[rows[:, None], cols[None, :]]
+
+        dose = BASE_DOSE * (2.0 ** min(max(scan_speed, 0), 8))
+        noise = self.noise_pool[self.frame_no % NOISE_POOL]
+        # Roll the pooled field so consecutive frames never repeat exactly.
+        shift = int(self.rng.integers(self.height))
+        noise = np.roll(noise, shift, axis=0)
+        signal = signal + np.sqrt(signal * (1.0 / dose)) * noise
+
+        self.frame_no += 1
+        np.clip(signal, 0.0, 1.0, out=signal)
+        signal *= 255.0
+        return signal.astype(np.uint8).tobytes()
@@ -0,0 +1,153 @@
+import struct
+
+import numpy as np
+
+# Channel layout of SemPhysics.pos / target / rate. Stage axes are in the
+# units CB reports (x/y/z in um, r/t in the DLL's raw counts), HT is the
+# actual beam voltage in V and pressure is log10(Pa), so a constant rate
+# on that channel is an exponential pump-down / vent curve.
+STAGE_AXES = ("stage_x", "stage_y", "stage_z", "stage_r", "stage_t")
+CH_STAGE = slice(0, 5)
+CH_HT = 5
+CH_PRESSURE = 6
+N_CHANNELS = 7
+
+# Max axis speeds per second (guesses for the motorised 5600 stage).
+STAGE_RATE = (2000.0, 2000.0, 500.0, 1000.0, 500.0)
+HT_RATE_V = 7500.0  # 15 kV ramps in 2 s
+
+# Chamber pressure, log10(Pa).
+P_ATM = 5.0
+P_BASE = -4.0
+P_READY = -2.0  # HT allowed below 1e-2 Pa
+EVAC_RATE = (P_ATM - P_READY) / 5.0  # ~5 s from air to ready
+VENT_RATE = (P_ATM - P_BASE) / 3.0  # ~3 s back to air
+
+# Slack for float round-off when a tick lands exactly on a milestone.
+EPS = 1e-9
+
+
+class SemPhysics:
+    """
+    Fixed-tick model of the stage, the HT ramp and the chamber pressure.
+
+    Every channel moves towards its target at a bounded rate, all seven in
+    one vectorised step. The step is exact for any dt, so a simulated clock
+    can jump straight to next_milestone() without losing accuracy. The
+    packed CB payload is rebuilt only on ticks where the stage moved, so
+    reads never recompute anything.
+    """
+
+    def __init__(self, state, now=0.0):
+        self.pos = np.zeros(N_CHANNELS)
+        self.pos[CH_STAGE] = [state[a] for a in STAGE_AXES]
+        self.pos[CH_HT] = state["accv"] if state.get("ht_status") else 0.0
+        self.pos[CH_PRESSURE] = P_BASE if state.get("vacuum_status") == 3 else P_ATM
+        self.target = self.pos.copy()
+        self.rate = np.empty(N_CHANNELS)
+        self.rate[CH_STAGE] = STAGE_RATE
+        self.rate[CH_HT] = HT_RATE_V
+        self.rate[CH_PRESSURE] = EVAC_RATE
+        self.evacuating = self.pos[CH_PRESSURE] < P_ATM
+        self.t_last = now
+        self._stage_int = None
+        self.stage_bytes = b""
+        self._pack_stage()
+
+    # --- Setpoints ---
+
+    def move_stage(self, target):
+        self.target[CH_STAGE] = target
+
+    def ramp_ht(self, volts):
+        self.target[CH_HT] = volts
+
+    def evacuate(self):
+        self.evacuating = True
+        self.target[CH_PRESSURE] = P_BASE
+        self.rate[CH_PRESSURE] = EVAC_RATE
+
+    def vent(self):
+        self.evacuating = False
+        self.target[CH_PRESSURE] = P_ATM
+        self.rate[CH_PRESSURE] = VENT_RATE
+
+    # --- Derived status ---
+
+    @property
+    def pressure_pa(self):
+        return 10.0 ** self.pos[CH_PRESSURE]
+
+    def vacuum_ready(self):
+        return self.evacuating and self.pos[CH_PRESSURE] <= P_READY + EPS
+
+    def vented(self):
+        return not self.evacuating and self.pos[CH_PRESSURE] >= P_ATM - EPS
+
+    def ht_ready(self):
+        return self.pos[CH_HT] == self.target[CH_HT]
+
+    def stage_settled(self):
+        return np.array_equal(self.pos[CH_STAGE], self.target[CH_STAGE])
+
+    def settled(self):
+        return np.array_equal(self.pos, self.target)
+
+    # --- Integration ---
+
+    def advance(self, now):
+        """Integrate up to `now`. Returns True if the stage position changed."""
+        dt = now - self.t_last
+        self.t_last = now
+        if dt <= 0 or self.settled():
+            return False
+        diff = self.target - self.pos
+        reach = self.rate * dt
+        arrived = np.abs(diff) <= reach + EPS
+        self.pos = np.where(arrived, self.target, self.pos + np.sign(diff) * reach)
+        return self._pack_stage()
+
+    def next_milestone(self):
+        """
+        Seconds until the next discrete event (an axis arriving, or the
+        pressure crossing the ready threshold), or None once settled.
+        """
+        diff = np.abs(self.target - self.pos)
+        moving = diff > 0
+        if not moving.any():
+            return None
+        eta = float((diff[moving] / self.rate[moving]).min())
+        p = self.pos[CH_PRESSURE]
+        if self.evacuating and p > P_READY + EPS:
+            eta = min(eta, (p - P_READY) / self.rate[CH_PRESSURE])
+        return max(eta, 0.0)
+
+    # --- Checkpoints ---
+
+    def snapshot(self):
+        return {
+            "pos": self.pos.tolist(),
+            "target": self.target.tolist(),
+            "rate": self.rate.tolist(),
+            "evacuating": bool(self.evacuating),
+        }
+
+    def restore(self, snap, now):
+        self.pos = np.array(snap["pos"], dtype=float)
+        self.target = np.array(snap["target"], dtype=float)
+        self.rate = np.array(snap["rate"], dtype=float)
+        self.evacuating = snap["evacuating"]
+        self.t_last = now
+        self._stage_int = None
+        self._pack_stage()
+
+    def _pack_stage(self):
+        stage = tuple(int(round(v)) for v in self.pos[CH_STAGE])
+        if stage == self._stage_int:
+            return False
+        self._stage_int = stage
+        self.stage_bytes = struct.pack("<5i", *stage)
+        return True
+
+    def stage_position(self):
+        return self._stage_int
@@ -0,0 +1,307 @@
+import argparse
+import json
+
+import numpy as np
+
+from session_log import LogEntry, latency_ns, read_session
+
+# --- Columnar Session ---
+# One row per CMD/RES line. Names are interned into `names` and stored as
+# an index; CDB and logged data keep their first 16 bytes (all the log has).
+
+DIR_CMD = 0
+DIR_RES = 1
+NO_SUB = -1
+NO_TXN = -1
+
+ROW_DTYPE = np.dtype(
+    [
+        ("line", "u4"),
+        ("t", "f8"),  # seconds since the epoch
+        ("dir", "u1"),
+        ("opcode", "u1"),
+        ("sub", "i2"),  # sub-opcode byte, NO_SUB if the group has none
+        ("status", "i2"),
+        ("name", "u2"),  # index into Session.names
+        ("cdb", "S16"),
+        ("cdb_len", "u1"),
+        ("data", "S16"),
+        # S fields drop trailing NULs on read; the *_len columns keep the
+        # real length.
+        ("data_len", "u2"),  # logged bytes; 16 may mean truncated
+        ("txn", "i8"),  # transaction id, NO_TXN in logs without them
+        ("latency_ns", "i8"),  # RES lines: end_ns - start_ns, else NO_TXN
+    ]
+)
+
+
+def _percentiles(values):
+    if len(values) == 0:
+        return {"n": 0}
+    p = np.percentile(values, [50, 90, 99])
+    return {
+        "n": int(len(values)),
+        "mean": float(values.mean()),
+        "p50": float(p[0]),
+        "p90": float(p[1]),
+        "p99": float(p[2]),
+        "max": float(values.max()),
+    }
+
+
+def _group_stats(keys, values):
+    """{key: percentile summary} for values grouped by integer keys, sorted once."""
+    if len(keys) == 0:
+        return {}
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    uniq, starts = np.unique(keys, return_index=True)
+    return {
+        int(k): _percentiles(chunk)
+        for k, chunk in zip(uniq, np.split(values, starts[1:]))
+    }
+
+
+class Session:
+    """
+    A captured session loaded once into a structured array (`rows`), with
+    vectorised queries over it. Times in results are milliseconds.
+    """
+
+    def __init__(self, rows, names, path=None):
+        self.rows = rows
+        self.names = names
+        self.path = path
+
+    @classmethod
+    def load(cls, path, decoder=None, redecode=False):
+        """
+        Parse `path` into rows. redecode=True names commands with the
+        current protocol_definitions.json instead of the name in the log.
+        """
+        if decoder is None:
+            from virtual_sem import ProtocolDecoder
+
+            decoder = ProtocolDecoder()
+        sub_offsets = decoder.subop_offsets()
+
+        names = []
+        name_index = {}
+        records = [r for r in read_session(path) if isinstance(r, LogEntry)]
+        rows = np.zeros(len(records), dtype=ROW_DTYPE)
+        for i, r in enumerate(records):
+            name = r.name
+            if redecode:
+                name, _ = decoder.decode(r.cdb, r.payload, r.direction)
+            idx = name_index.get(name)
+            if idx is None:
+                idx = name_index[name] = len(names)
+                names.append(name)
+            opcode = r.cdb[0] if r.cdb else 0
+            offset = sub_offsets.get(opcode)
+            sub = r.cdb[offset] if offset is not None and offset < len(r.cdb) else NO_SUB
+            data = r.data or b""
+            latency = latency_ns(r)
+            rows[i] = (
+                r.line_no,
+                r.t,
+                DIR_CMD if r.direction == "CMD" else DIR_RES,
+                opcode,
+                sub,
+                r.status,
+                idx,
+                r.cdb[:16],
+                len(r.cdb),
+                data[:16],
+                len(data),
+                NO_TXN if r.txn is None else r.txn,
+                NO_TXN if latency is None else latency,
+            )
+        return cls(rows, names, path)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def commands(self):
+        return self.rows[self.rows["dir"] == DIR_CMD]
+
+    @property
+    def responses(self):
+        return self.rows[self.rows["dir"] == DIR_RES]
+
+    @staticmethod
+    def _op_key(rows):
+        # opcode << 9 | (sub + 1): one sortable int per (opcode, sub-op).
+        return (rows["opcode"].astype(np.int32) << 9) | (rows["sub"].astype(np.int32) + 1)
+
+    @staticmethod
+    def op_label(key):
+        opcode, sub = key >> 9, (key & 0x1FF) - 1
+        return f"{opcode:02X}" if sub == NO_SUB else f"{opcode:02X}/{sub:02X}"
+
+    # --- Queries ---
+
+    def command_frequency(self, by="name"):
+        """[(label, count)] over CMD lines, most frequent first."""
+        cmds = self.commands
+        if by == "name":
+            keys, counts = np.unique(cmds["name"], return_counts=True)
+            labels = [self.names[k] for k in keys]
+        elif by == "opcode":
+            keys, counts = np.unique(self._op_key(cmds), return_counts=True)
+            labels = [self.op_label(k) for k in keys]
+        else:
+            raise ValueError(f"Unknown grouping: {by}")
+        order = np.argsort(-counts, kind="stable")
+        return [(labels[i], int(counts[i])) for i in order]
+
+    def inter_arrival(self, opcode=None):
+        """Gaps between consecutive commands (ms), optionally of one opcode."""
+        cmds = self.commands
+        if opcode is not None:
+            cmds = cmds[cmds["opcode"] == opcode]
+        return np.diff(cmds["t"]) * 1e3
+
+    def poll_periods(self, min_count=3):
+        """
+        {op label: gap summary} between successive commands of the same
+        (opcode, sub-op), i.e. the period of each polling loop.
+        """
+        cmds = self.commands
+        keys = self._op_key(cmds)
+        order = np.lexsort((cmds["t"], keys))
+        keys, t = keys[order], cmds["t"][order]
+        same = keys[1:] == keys[:-1]
+        gaps = np.diff(t)[same] * 1e3
+        stats = _group_stats(keys[1:][same], gaps)
+        return {
+            self.op_label(k): s for k, s in stats.items() if s["n"] + 1 >= min_count
+        }
+
+    def latency(self):
+        """
+        {op label: CMD->RES latency summary (ms)}. RES lines with TXN times
+        carry their own latency (ns); in older logs a RES pairs with the
+        line right before it when that is the CMD for the same CDB.
+        """
+        rows = self.rows
+        timed = rows[(rows["dir"] == DIR_RES) & (rows["latency_ns"] != NO_TXN)]
+        prev, cur = rows[:-1], rows[1:]
+        paired = (
+            (prev["dir"] == DIR_CMD)
+            & (cur["dir"] == DIR_RES)
+            & (prev["cdb"] == cur["cdb"])
+            & (cur["latency_ns"] == NO_TXN)
+        )
+        keys = np.concatenate((self._op_key(timed), self._op_key(prev[paired])))
+        lat = np.concatenate(
+            (timed["latency_ns"] / 1e6, (cur["t"] - prev["t"])[paired] * 1e3)
+        )
+        stats = _group_stats(keys, lat)
+        return {self.op_label(k): s for k, s in stats.items()}
+
+    def error_bursts(self, gap_ms=500.0, statuses=None):
+        """
+        Runs of failed responses no more than gap_ms apart:
+        [{start, end, duration_ms, count, first_line, ops}], longest first.
+        Failure means status not in `statuses` (default: anything but 1).
+        """
+        res = self.responses
+        if statuses is None:
+            failed = res["status"] != 1
+        else:
+            failed = ~np.isin(res["status"], statuses)
+        errs = res[failed]
+        if len(errs) == 0:
+            return []
+        new_burst = np.concatenate(([True], np.diff(errs["t"]) * 1e3 > gap_ms))
+        burst_id = np.cumsum(new_burst) - 1
+        starts = np.flatnonzero(new_burst)
+        ends = np.append(starts[1:], len(errs)) - 1
+        counts = np.bincount(burst_id)
+        keys = self._op_key(errs)
+        bursts = []
+        for b, (s, e) in enumerate(zip(starts, ends)):
+            ops = np.unique(keys[s : e + 1])
+            bursts.append(
+                {
+                    "start": float(errs["t"][s]),
+                    "end": float(errs["t"][e]),
+                    "duration_ms": float((errs["t"][e] - errs["t"][s]) * 1e3),
+                    "count": int(counts[b]),
+                    "first_line": int(errs["line"][s]),
+                    "ops": [self.op_label(k) for k in ops],
+                }
+            )
+        bursts.sort(key=lambda b: (-b["count"], b["start"]))
+        return bursts
+
+    def summary(self, top=15):
+        cmds = self.commands
+        span = float(self.rows["t"][-1] - self.rows["t"][0]) if len(self) else 0.0
+        return {
+            "path": self.path,
+            "commands": int(len(cmds)),
+            "duration_s": span,
+            "frequency": self.command_frequency("name")[:top],
+            "inter_arrival_ms": _percentiles(self.inter_arrival()),
+            "poll_periods_ms": self.poll_periods(),
+            "latency_ms": self.latency(),
+            "error_bursts": self.error_bursts()[:top],
+        }
+
+
+def _print_report(s, top):
+    summary = s.summary(top)
+    print(
+        f"{summary['path']}: {summary['commands']} commands over "
+        f"{summary['duration_s']:.1f}s"
+    )
+    print("\nMost frequent commands:")
+    for name, n in summary["frequency"]:
+        print(f"  {n:>6}  {name}")
+    ia = summary["inter_arrival_ms"]
+    if ia["n"]:
+        print(
+            f"\nInter-arrival: p50 {ia['p50']:.1f} ms  p90 {ia['p90']:.1f} ms  "
+            f"p99 {ia['p99']:.1f} ms  max {ia['max']:.1f} ms"
+        )
+    print("\nPoll periods (same opcode/sub-op):")
+    busiest = sorted(summary["poll_periods_ms"].items(), key=lambda kv: -kv[1]["n"])
+    for op, st in busiest[:top]:
+        print(f"  {op:<6} n={st['n']:<6} p50 {st['p50']:>8.1f} ms  p90 {st['p90']:>8.1f} ms")
+    print("\nCMD->RES latency:")
+    slowest = sorted(summary["latency_ms"].items(), key=lambda kv: -kv[1]["p99"])
+    for op, st in slowest[:top]:
+        print(
+            f"  {op:<6} n={st['n']:<6} p50 {st['p50']:>6.1f} ms  "
+            f"p99 {st['p99']:>6.1f} ms  max {st['max']:>6.1f} ms"
+        )
+    print("\nError bursts:")
+    if not summary["error_bursts"]:
+        print("  none")
+    for b in summary["error_bursts"]:
+        print(
+            f"  line {b['first_line']:>6}: {b['count']} errors in "
+            f"{b['duration_ms']:.0f} ms ({', '.join(b['ops'])})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse a captured SEM session log")
+    parser.add_argument("log", help="session log (logs/sem_session_*.log)")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    parser.add_argument(
+        "--redecode",
+        action="store_true",
+        help="name commands from the current protocol_definitions.json",
+    )
+    args = parser.parse_args()
+
+    session = Session.load(args.log, redecode=args.redecode)
+    if args.json:
+        print(json.dumps(session.summary(args.top), indent=1))
+    else:
+        _print_report(session, args.top)
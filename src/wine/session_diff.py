@@ -0,0 +1,391 @@
+import argparse
+import bisect
+import difflib
+import random
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from session_log import read_session, transactions
+
+# --- Tokens ---
+# Each transaction becomes an int token for (CDB, data-out prefix); equal
+# tokens mean the same request. Polling loops are collapsed into runs
+# before aligning, so 4000 D0 reads cost one token, and a loop that simply
+# ran longer on one side is reported as a repeat-count change rather than
+# thousands of inserts.
+
+Txn = namedtuple("Txn", "line name cdb payload data status")
+
+
+class SessionTokens:
+    def __init__(self, path, vocab):
+        self.path = path
+        self.txns = []
+        toks = []
+        for cmd, res in transactions(read_session(path)):
+            key = (cmd.cdb, cmd.payload)
+            tok = vocab.get(key)
+            if tok is None:
+                tok = vocab[key] = len(vocab)
+            toks.append(tok)
+            self.txns.append(
+                Txn(
+                    cmd.line_no,
+                    cmd.name,
+                    cmd.cdb,
+                    cmd.payload,
+                    res.data if res else None,
+                    res.status if res else None,
+                )
+            )
+        self.tokens = np.array(toks, dtype=np.int64)
+        self.run_tok, self.run_start, self.run_len = run_length(self.tokens)
+
+
+def run_length(tokens):
+    """(token, start, length) arrays for each run of identical tokens."""
+    if len(tokens) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    change = np.flatnonzero(tokens[1:] != tokens[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.append(starts, len(tokens)))
+    return tokens[starts], starts, lengths
+
+
+# --- Alignment ---
+
+KGRAM = 8
+# Gaps smaller than this (on both sides) go straight to difflib.
+DIFFLIB_WINDOW = 400
+HASH_MUL = np.uint64(0x9E3779B97F4A7C15)
+
+
+def kgram_hashes(tokens, k):
+    """Rolling hash of every k-token window (uint64 arithmetic wraps)."""
+    n = len(tokens) - k + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.uint64)
+    t = tokens.astype(np.uint64) + np.uint64(1)
+    h = np.zeros(n, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(k):
+            h = h * HASH_MUL + t[j : j + n]
+    return h
+
+
+# k-grams repeating more often than this are too periodic to anchor on.
+MAX_OCCURRENCES = 64
+
+
+def _sorted_occurrences(h):
+    """Positions sorted by (hash, position), plus each hash's start and count."""
+    order = np.argsort(h, kind="stable")
+    uniq, start, count = np.unique(h[order], return_index=True, return_counts=True)
+    return order, uniq, start, count
+
+
+def anchor_pairs(ha, hb, max_occ=MAX_OCCURRENCES):
+    """
+    Candidate (i, j) anchors: k-grams occurring equally often on both sides
+    (at most max_occ times), the n-th occurrence in a paired with the n-th
+    in b. Unique k-grams are the count-1 case; equal counts also anchor
+    sessions made of repeated init/poll cycles. Sorted by i.
+    """
+    order_a, ua, sa, ca = _sorted_occurrences(ha)
+    order_b, ub, sb, cb = _sorted_occurrences(hb)
+    _, ia, ib = np.intersect1d(ua, ub, assume_unique=True, return_indices=True)
+    keep = (ca[ia] == cb[ib]) & (ca[ia] <= max_occ)
+    ia, ib = ia[keep], ib[keep]
+    counts = ca[ia]
+    if counts.sum() == 0:
+        return []
+    # Expand each kept hash into its occurrence indices, without a loop.
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pa = order_a[np.repeat(sa[ia], counts) + offsets]
+    pb = order_b[np.repeat(sb[ib], counts) + offsets]
+    by_a = np.argsort(pa, kind="stable")
+    return list(zip(pa[by_a].tolist(), pb[by_a].tolist()))
+
+
+def _longest_increasing(pairs):
+    """Longest chain of (a, b) pairs increasing in both, given sorted by a."""
+    tails = []  # b values
+    tail_idx = []
+    prev = [-1] * len(pairs)
+    for i, (_, b) in enumerate(pairs):
+        j = bisect.bisect_left(tails, b)
+        if j == len(tails):
+            tails.append(b)
+            tail_idx.append(i)
+        else:
+            tails[j] = b
+            tail_idx[j] = i
+        prev[i] = tail_idx[j - 1] if j else -1
+    chain = []
+    i = tail_idx[-1] if tail_idx else -1
+    while i >= 0:
+        chain.append(pairs[i])
+        i = prev[i]
+    return chain[::-1]
+
+
+def _difflib_blocks(a, b, a0, b0):
+    sm = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return [(a0 + i, b0 + j, n) for i, j, n in sm.get_matching_blocks() if n]
+
+
+def align(a, b, a0=0, b0=0, k=KGRAM):
+    """
+    Matching blocks [(i, j, n)] between int sequences a and b.
+
+    k-grams that occur equally often on each side are anchors (see
+    anchor_pairs); the longest chain of anchors in order on both sides
+    fixes the alignment, and only the gaps between anchors are aligned
+    again (recursively, with smaller k once no anchors are left, and by
+    difflib once they are small).
+    Near-linear for long sessions instead of difflib's quadratic worst case.
+    """
+    if len(a) == 0 or len(b) == 0:
+        return []
+    if len(a) <= DIFFLIB_WINDOW and len(b) <= DIFFLIB_WINDOW:
+        return _difflib_blocks(list(a), list(b), a0, b0)
+
+    pairs = anchor_pairs(kgram_hashes(a, k), kgram_hashes(b, k))
+    if not pairs:
+        if k > 2:
+            return align(a, b, a0, b0, k // 2)
+        # Nothing distinctive left: anchor the common prefix/suffix only.
+        return _prefix_suffix_blocks(a, b, a0, b0)
+
+    chain = _longest_increasing(pairs)
+
+    blocks = []
+    ai = bi = 0
+    for pa_i, pb_i in chain:
+        if pa_i < ai or pb_i < bi:
+            continue  # overlaps the previous anchor's k-gram
+        if pa_i - ai == pb_i - bi and pa_i > ai and np.array_equal(a[ai:pa_i], b[bi:pb_i]):
+            blocks.append((a0 + ai, b0 + bi, pa_i - ai))
+        else:
+            blocks.extend(align(a[ai:pa_i], b[bi:pb_i], a0 + ai, b0 + bi, k))
+        blocks.append((a0 + pa_i, b0 + pb_i, k))
+        ai, bi = pa_i + k, pb_i + k
+    blocks.extend(align(a[ai:], b[bi:], a0 + ai, b0 + bi, k))
+    return _merge_blocks(blocks)
+
+
+def _prefix_suffix_blocks(a, b, a0, b0):
+    n = min(len(a), len(b))
+    pre = int(np.argmin(a[:n] == b[:n])) if not np.array_equal(a[:n], b[:n]) else n
+    blocks = [(a0, b0, pre)] if pre else []
+    ra, rb = a[pre:][::-1], b[pre:][::-1]
+    m = min(len(ra), len(rb))
+    suf = int(np.argmin(ra[:m] == rb[:m])) if not np.array_equal(ra[:m], rb[:m]) else m
+    if suf:
+        blocks.append((a0 + len(a) - suf, b0 + len(b) - suf, suf))
+    return blocks
+
+
+def _merge_blocks(blocks):
+    merged = []
+    for i, j, n in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            pi, pj, pn = merged[-1]
+            merged[-1] = (pi, pj, pn + n)
+        else:
+            merged.append((i, j, n))
+    return merged
+
+
+# --- Report ---
+
+Hunk = namedtuple("Hunk", "kind a_lines b_lines a_names b_names detail")
+
+
+def _names(session, runs):
+    names = []
+    for r in runs:
+        txn = session.txns[session.run_start[r]]
+        n = session.run_len[r]
+        names.append(f"{txn.name}x{n}" if n > 1 else txn.name)
+    return names
+
+
+def _lines(session, runs):
+    if len(runs) == 0:
+        return None
+    first = session.txns[session.run_start[runs[0]]].line
+    last_run = runs[-1]
+    last = session.txns[session.run_start[last_run] + session.run_len[last_run] - 1].line
+    return first, last
+
+
+def diff_sessions(a, b):
+    """
+    Align b against a and list the differences:
+      insert / delete / replace  command runs only one side has
+      repeat                     same command, different loop length
+      status / data              same command, different response
+    """
+    blocks = align(a.run_tok, b.run_tok)
+    hunks = []
+    ai = bi = 0
+    for i, j, n in blocks + [(len(a.run_tok), len(b.run_tok), 0)]:
+        if i > ai or j > bi:
+            kind = "replace" if i > ai and j > bi else ("delete" if i > ai else "insert")
+            ra, rb = list(range(ai, i)), list(range(bi, j))
+            hunks.append(
+                Hunk(kind, _lines(a, ra), _lines(b, rb), _names(a, ra), _names(b, rb), "")
+            )
+        for r in range(n):
+            ra, rb = i + r, j + r
+            la, lb = a.run_len[ra], b.run_len[rb]
+            if la != lb:
+                hunks.append(
+                    Hunk(
+                        "repeat",
+                        _lines(a, [ra]),
+                        _lines(b, [rb]),
+                        _names(a, [ra]),
+                        _names(b, [rb]),
+                        f"{la} vs {lb} times",
+                    )
+                )
+            _compare_responses(a, b, ra, rb, min(la, lb), hunks)
+        ai, bi = i + n, j + n
+    return hunks
+
+
+def _compare_responses(a, b, ra, rb, count, hunks):
+    """One hunk per run for status changes, one for data changes."""
+    sa, sb = a.run_start[ra], b.run_start[rb]
+    status_diff = data_diff = None
+    n_status = n_data = 0
+    for k in range(count):
+        ta, tb = a.txns[sa + k], b.txns[sb + k]
+        if ta.status != tb.status:
+            n_status += 1
+            status_diff = status_diff or (ta, tb)
+        elif ta.data != tb.data:
+            n_data += 1
+            data_diff = data_diff or (ta, tb)
+    if status_diff:
+        ta, tb = status_diff
+        hunks.append(
+            Hunk(
+                "status",
+                (ta.line, ta.line),
+                (tb.line, tb.line),
+                [ta.name],
+                [tb.name],
+                f"Status={ta.status} vs Status={tb.status} ({n_status}/{count} in run)",
+            )
+        )
+    if data_diff:
+        ta, tb = data_diff
+        da = ta.data.hex(" ").upper() if ta.data else "[Empty]"
+        db = tb.data.hex(" ").upper() if tb.data else "[Empty]"
+        hunks.append(
+            Hunk(
+                "data",
+                (ta.line, ta.line),
+                (tb.line, tb.line),
+                [ta.name],
+                [tb.name],
+                f"{da} vs {db} ({n_data}/{count} in run)",
+            )
+        )
+
+
+def _fmt_lines(lines):
+    if lines is None:
+        return "-"
+    return f"{lines[0]}" if lines[0] == lines[1] else f"{lines[0]}-{lines[1]}"
+
+
+def print_report(a, b, hunks, kinds=None, limit=50):
+    counts = {}
+    for h in hunks:
+        counts[h.kind] = counts.get(h.kind, 0) + 1
+    print(f"--- {a.path} ({len(a.txns)} commands, {len(a.run_tok)} runs)")
+    print(f"+++ {b.path} ({len(b.txns)} commands, {len(b.run_tok)} runs)")
+    print("  " + (", ".join(f"{k}={v}" for k, v in sorted(counts.items())) or "identical"))
+    selected = [h for h in hunks if not kinds or h.kind in kinds]
+    shown = 0
+    for h in selected:
+        if shown >= limit:
+            print(f"  ... ({len(selected) - shown} more)")
+            break
+        shown += 1
+        left = " ".join(h.a_names[:6]) + (" ..." if len(h.a_names) > 6 else "")
+        right = " ".join(h.b_names[:6]) + (" ..." if len(h.b_names) > 6 else "")
+        print(
+            f"  [{h.kind:<7}] L{_fmt_lines(h.a_lines):>11} | L{_fmt_lines(h.b_lines):>11}  "
+            f"{left or '-'}  =>  {right or '-'}"
+        )
+        if h.detail:
+            print(f"             {h.detail}")
+
+
+def bench(path, copies=10, mutation=0.001, seed=0):
+    """Align a session against a mutated copy of itself, `copies` times longer."""
+    vocab = {}
+    base = SessionTokens(path, vocab)
+    rng = random.Random(seed)
+    toks = np.tile(base.tokens, copies)
+    other = toks.tolist()
+    for _ in range(int(len(other) * mutation)):
+        i = rng.randrange(len(other))
+        op = rng.random()
+        if op < 0.4:
+            del other[i]
+        elif op < 0.8:
+            other.insert(i, rng.randrange(len(vocab)))
+        else:
+            other[i] = rng.randrange(len(vocab))
+    other = np.array(other, dtype=np.int64)
+    t0 = time.perf_counter()
+    ra, _, _ = run_length(toks)
+    rb, _, _ = run_length(other)
+    blocks = align(ra, rb)
+    elapsed = time.perf_counter() - t0
+    matched = sum(n for _, _, n in blocks)
+    print(
+        f"Align: {len(toks)} vs {len(other)} commands ({len(ra)} vs {len(rb)} runs), "
+        f"{matched} runs matched in {elapsed:.2f}s"
+    )
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Align captured sessions by command sequence and list divergences"
+    )
+    parser.add_argument("logs", nargs="*", help="reference session, then sessions to compare")
+    parser.add_argument(
+        "--only",
+        help="comma-separated hunk kinds (insert,delete,replace,repeat,status,data)",
+    )
+    parser.add_argument("--limit", type=int, default=50, help="hunks shown per pair")
+    parser.add_argument(
+        "--bench",
+        metavar="LOG",
+        help="time aligning LOG x10 against a mutated copy",
+    )
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+    elif len(args.logs) < 2:
+        parser.error("need a reference session and at least one more")
+    else:
+        vocab = {}
+        ref = SessionTokens(args.logs[0], vocab)
+        kinds = set(args.only.split(",")) if args.only else None
+        for other_path in args.logs[1:]:
+            other = SessionTokens(other_path, vocab)
+            print_report(ref, other, diff_sessions(ref, other), kinds, args.limit)
+            print()
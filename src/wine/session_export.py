@@ -0,0 +1,355 @@
+import argparse
+import logging
+import os
+import time
+
+from log_rotation import SEGMENT_RE, segment_path
+from session_log import LogEvent, iter_records, open_log, read_session
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+logger = logging.getLogger("VirtualSEM")
+
+# --- Columns ---
+# One row per log line (CMD, RES and EVT). Times are UTC nanoseconds since
+# the epoch at the log's resolution; cdb / data / payload are the logged
+# bytes (data at most 16, see data_truncated). opcode / sub / status are
+# null on EVT rows, sub also for groups without a sub-opcode byte. txn /
+# start / end are the bridge's transaction id and its ns start and end
+# (end on RES rows only); null in logs written before they existed.
+
+ROW_GROUP_ROWS = 1 << 16
+
+COLUMNS = (
+    "session", "line", "t", "level", "dir", "opcode", "sub", "name", "status",
+    "cdb", "data", "data_truncated", "payload", "payload_len", "message",
+    "txn", "start", "end",
+)
+
+
+def schema():
+    return pa.schema(
+        [
+            ("session", pa.string()),  # log file name, without .gz/.zst
+            ("line", pa.uint32()),
+            ("t", pa.timestamp("ns", tz="UTC")),
+            ("level", pa.string()),
+            ("dir", pa.string()),  # CMD / RES / EVT
+            ("opcode", pa.uint8()),
+            ("sub", pa.uint8()),
+            ("name", pa.string()),
+            ("status", pa.int16()),
+            ("cdb", pa.binary()),
+            ("data", pa.binary()),
+            ("data_truncated", pa.bool_()),
+            ("payload", pa.binary()),
+            ("payload_len", pa.int32()),
+            ("message", pa.string()),
+            ("txn", pa.uint64()),
+            ("start", pa.timestamp("ns", tz="UTC")),
+            ("end", pa.timestamp("ns", tz="UTC")),
+        ]
+    )
+
+
+def session_name(path):
+    name = os.path.basename(path)
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+class BatchWriter:
+    """
+    Collects rows column-wise and writes them out every `row_group_rows`
+    rows (or on flush()), so memory stays at one row group whatever the
+    session length. Parquet for *.parquet, otherwise an Arrow IPC stream,
+    which readers can open while it is still being written.
+    """
+
+    def __init__(self, out_path, sub_offsets, decoder=None, row_group_rows=ROW_GROUP_ROWS):
+        if not HAS_PYARROW:
+            raise RuntimeError("pyarrow is not installed (pip install pyarrow)")
+        self.schema = schema()
+        self.parquet = out_path.endswith(".parquet")
+        if self.parquet:
+            self.writer = pq.ParquetWriter(out_path, self.schema, compression="zstd")
+        else:
+            self.sink = pa.OSFile(out_path, "wb")
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        self.sub_offsets = sub_offsets
+        self.decoder = decoder
+        self.row_group_rows = row_group_rows
+        self.columns = {c: [] for c in COLUMNS}
+        self.rows = 0
+        self.row_groups = 0
+
+    def add(self, session, records):
+        cols = self.columns
+        session_col, line, t, level, direction = (
+            cols["session"], cols["line"], cols["t"], cols["level"], cols["dir"],
+        )
+        opcode_col, sub_col, name_col, status = cols["opcode"], cols["sub"], cols["name"], cols["status"]
+        cdb_col, data, truncated = cols["cdb"], cols["data"], cols["data_truncated"]
+        payload, payload_len, message = cols["payload"], cols["payload_len"], cols["message"]
+        txn, start, end = cols["txn"], cols["start"], cols["end"]
+        sub_offsets, decoder = self.sub_offsets, self.decoder
+        for rec in records:
+            session_col.append(session)
+            line.append(rec.line_no)
+            # Whole microseconds, so float rounding of the epoch seconds
+            # does not show up as stray nanoseconds.
+            t.append(round(rec.t * 1e6) * 1000)
+            level.append(rec.level)
+            if isinstance(rec, LogEvent):
+                direction.append("EVT")
+                for col in (opcode_col, sub_col, name_col, status, cdb_col, data,
+                            truncated, payload, payload_len, txn, start, end):
+                    col.append(None)
+                message.append(rec.message)
+            else:
+                cdb = rec.cdb
+                opcode = cdb[0] if cdb else None
+                at = sub_offsets.get(opcode)
+                name = rec.name
+                if decoder is not None:
+                    name, _ = decoder.decode(cdb, rec.payload, rec.direction)
+                direction.append(rec.direction)
+                opcode_col.append(opcode)
+                sub_col.append(cdb[at] if at is not None and at < len(cdb) else None)
+                name_col.append(name)
+                status.append(rec.status)
+                cdb_col.append(cdb)
+                data.append(rec.data)
+                truncated.append(rec.data_truncated)
+                payload.append(rec.payload)
+                payload_len.append(rec.payload_len)
+                message.append(None)
+                txn.append(rec.txn)
+                start.append(rec.start_ns)
+                end.append(rec.end_ns)
+            if len(line) >= self.row_group_rows:
+                self.flush()
+
+    def flush(self):
+        n = len(self.columns["line"])
+        if not n:
+            return
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(self.columns[f.name], type=f.type) for f in self.schema],
+            schema=self.schema,
+        )
+        if self.parquet:
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+            self.sink.flush()
+        for col in self.columns.values():
+            col.clear()
+        self.rows += n
+        self.row_groups += 1
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        if not self.parquet:
+            self.sink.close()
+
+
+def export(paths, out_path, redecode=False, row_group_rows=ROW_GROUP_ROWS):
+    """Write the records of every log in `paths` to out_path. Returns rows written."""
+    from virtual_sem import ProtocolDecoder
+
+    decoder = ProtocolDecoder()
+    writer = BatchWriter(
+        out_path, decoder.subop_offsets(), decoder if redecode else None, row_group_rows
+    )
+    try:
+        for path in paths:
+            writer.add(session_name(path), read_session(path))
+    finally:
+        writer.close()
+    return writer.rows
+
+
+# --- Live ---
+
+
+def _archived(path):
+    """The compressed form of a closed segment, if log_rotation made one."""
+    for suffix in (".zst", ".gz"):
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+
+def follow_chunks(path, poll_s=0.5):
+    """
+    Yield (segment path, first line number, [complete lines]) as a live
+    session log grows, following it across rotated segments ("Log
+    continues in ..." then the next segment appearing). Segments already
+    closed and compressed are read whole. Yields an empty chunk whenever
+    a poll finds nothing new, so the caller can flush on time; a partial
+    last line waits for its newline.
+    """
+    m = SEGMENT_RE.match(os.path.basename(path))
+    base = os.path.join(os.path.dirname(path), m.group("base") + ".log") if m else path
+    index = int(m.group("n") or 0) if m else 0
+    while True:
+        nxt = segment_path(base, index + 1) if m else None
+        if not os.path.exists(path):
+            archived = _archived(path)
+            if archived is None:
+                # Not created yet (or between a rotation's close and open).
+                yield path, 1, []
+                time.sleep(poll_s)
+                continue
+            with open_log(archived) as f:
+                yield archived, 1, f.read().rstrip("\n").split("\n")
+            if nxt is None or not (os.path.exists(nxt) or _archived(nxt)):
+                return  # the last segment, closed: the session is over
+        else:
+            line_no = 1
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                pending = ""
+                while True:
+                    text = f.read(1 << 20)
+                    if text:
+                        text = pending + text
+                        cut = text.rfind("\n") + 1
+                        pending = text[cut:]
+                        lines = text[: cut - 1].split("\n") if cut else []
+                        if lines:
+                            yield path, line_no, lines
+                            line_no += len(lines)
+                        continue
+                    # At the end: the segment is finished once the next one
+                    # exists (the rotation closes this one before opening it).
+                    if nxt and (os.path.exists(nxt) or _archived(nxt)):
+                        text = pending + f.read()
+                        if text:
+                            yield path, line_no, text.rstrip("\n").split("\n")
+                        break
+                    yield path, line_no, []
+                    time.sleep(poll_s)
+        index += 1
+        path = nxt
+
+
+def follow(path, out_path, flush_s=5.0, idle_exit_s=None, poll_s=0.5,
+           redecode=False, row_group_rows=ROW_GROUP_ROWS):
+    """
+    Export a session while the bridge is still writing it. A row group is
+    written every row_group_rows rows or flush_s seconds, whichever comes
+    first; stops at "Session Ended", after idle_exit_s without new lines,
+    or on Ctrl-C. Returns rows written.
+    """
+    from virtual_sem import ProtocolDecoder
+
+    decoder = ProtocolDecoder()
+    writer = BatchWriter(
+        out_path, decoder.subop_offsets(), decoder if redecode else None, row_group_rows
+    )
+    last_flush = last_data = time.monotonic()
+    try:
+        for seg, line_no, lines in follow_chunks(path, poll_s):
+            now = time.monotonic()
+            ended = False
+            if lines:
+                last_data = now
+                records = list(iter_records(lines, start=line_no))
+                writer.add(session_name(seg), records)
+                ended = any(
+                    isinstance(r, LogEvent) and r.message.strip() == "Session Ended"
+                    for r in records
+                )
+            if ended or now - last_flush >= flush_s:
+                writer.flush()
+                last_flush = now
+            if ended:
+                logger.info(f"Export: session ended in {os.path.basename(seg)}")
+                break
+            if idle_exit_s is not None and now - last_data >= idle_exit_s:
+                logger.info(f"Export: no new lines for {idle_exit_s:.0f}s, stopping")
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def bench(path, out_dir=None, repeat=3):
+    """Rows/s and peak RSS exporting `path` to Parquet and to an Arrow stream."""
+    import resource
+    import tempfile
+
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+        for ext in ("parquet", "arrow"):
+            out = os.path.join(tmp, f"bench.{ext}")
+            best = None
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                rows = export([path], out)
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            print(
+                f"{ext:>8}: {rows} rows in {best:.2f}s ({rows / best:,.0f} rows/s), "
+                f"{os.path.getsize(path) / 1e6:.1f} MB log -> {os.path.getsize(out) / 1e6:.1f} MB"
+            )
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export session logs to Parquet / Arrow for offline analysis"
+    )
+    parser.add_argument("logs", nargs="+", help="session logs (.log, .log.gz, .log.zst)")
+    parser.add_argument(
+        "-o", "--output", help="*.parquet, or anything else for an Arrow IPC stream"
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="export a live log as the bridge writes it, across rotated segments",
+    )
+    parser.add_argument("--flush-s", type=float, default=5.0, help="--follow: row group interval")
+    parser.add_argument(
+        "--idle-exit", type=float, default=None, help="--follow: stop after this many idle seconds"
+    )
+    parser.add_argument(
+        "--row-group", type=int, default=ROW_GROUP_ROWS, help="rows per row group / batch"
+    )
+    parser.add_argument(
+        "--redecode", action="store_true", help="name commands with the current definitions"
+    )
+    parser.add_argument("--bench", action="store_true", help="time exporting the first log")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.bench:
+        bench(args.logs[0])
+    elif not args.output:
+        parser.error("-o/--output is required")
+    elif args.follow:
+        if len(args.logs) != 1:
+            parser.error("--follow takes one log")
+        rows = follow(
+            args.logs[0],
+            args.output,
+            flush_s=args.flush_s,
+            idle_exit_s=args.idle_exit,
+            redecode=args.redecode,
+            row_group_rows=args.row_group,
+        )
+        print(f"{rows} rows written to {args.output}")
+    else:
+        rows = export(args.logs, args.output, args.redecode, args.row_group)
+        print(f"{rows} rows written to {args.output}")
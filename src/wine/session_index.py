@@ -0,0 +1,480 @@
+import argparse
+import bisect
+import logging
+import os
+import shlex
+import sqlite3
+import time
+
+from session_log import LOG_SUFFIXES, LogEvent, format_time, iter_records, open_log
+
+logger = logging.getLogger("VirtualSEM")
+
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+DEFAULT_DB = "session_index.sqlite"
+SCHEMA_VERSION = 1
+
+# --- Schema ---
+# One row per log line in `lines`, and the same rowid in the FTS5 table
+# `lines_fts`, whose `terms` column holds the searchable tokens:
+#   op01 sub40 st4 cmd         opcode, sub-op byte, status, direction
+#   c01 c0140 ...              CDB bytes and byte pairs
+#   d38 d3801 ...              DATA (and data-out PAYLOAD) bytes and pairs
+# so any combination of fields is a single FTS intersection; byte strings
+# longer than two bytes match on their pairs and are verified with instr().
+# `files` remembers how far each log was read, so updates only parse what
+# was appended since, and a segment that log_rotation compressed keeps its
+# rows (it is the same file under a new name).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,        -- file name without .gz/.zst
+    path TEXT,              -- file name as it is now
+    size INTEGER,
+    mtime_ns INTEGER,
+    lines INTEGER,          -- complete lines consumed
+    offset INTEGER          -- bytes consumed (plain files)
+);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER,
+    line INTEGER,
+    t REAL,
+    dir TEXT,
+    opcode INTEGER,
+    sub INTEGER,
+    status INTEGER,
+    name TEXT,
+    cdb BLOB,
+    data BLOB,
+    payload BLOB,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS lines_file_line ON lines (file_id, line);
+CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5 (name, message, terms);
+"""
+
+
+def _byte_terms(prefix, data):
+    if not data:
+        return []
+    hexs = [f"{b:02x}" for b in data]
+    terms = [prefix + h for h in hexs]
+    terms += [prefix + a + b for a, b in zip(hexs, hexs[1:])]
+    return terms
+
+
+def _terms(rec, sub):
+    terms = [rec.direction.lower(), f"op{rec.cdb[0]:02x}" if rec.cdb else "op", f"st{rec.status}"]
+    if sub is not None:
+        terms.append(f"sub{sub:02x}")
+    terms += _byte_terms("c", rec.cdb)
+    terms += _byte_terms("d", rec.data)
+    terms += _byte_terms("d", rec.payload)
+    return " ".join(terms)
+
+
+def _log_key(name):
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def _complete_lines(f, progress):
+    """Lines that end in a newline; a live log's partial last line waits."""
+    for line in f:
+        if not line.endswith("\n"):
+            break
+        progress[0] += 1
+        progress[1] += len(line.encode("utf-8", "ignore"))
+        yield line
+
+
+class SessionIndex:
+    def __init__(self, log_dir=DEFAULT_LOG_DIR, db_path=None, sub_offsets=None):
+        self.log_dir = log_dir
+        self.db_path = db_path or os.path.join(log_dir, DEFAULT_DB)
+        self.db = sqlite3.connect(self.db_path)
+        self.db.executescript(SCHEMA)
+        version = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is None:
+            self.db.execute(
+                "INSERT INTO meta VALUES ('version', ?)", (str(SCHEMA_VERSION),)
+            )
+            self.db.commit()
+        elif int(version[0]) != SCHEMA_VERSION:
+            raise ValueError(f"{self.db_path}: index version {version[0]}, delete it to rebuild")
+        self._sub_offsets = sub_offsets
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def sub_offsets(self):
+        if self._sub_offsets is None:
+            from virtual_sem import ProtocolDecoder
+
+            self._sub_offsets = ProtocolDecoder().subop_offsets()
+        return self._sub_offsets
+
+    # --- Indexing ---
+
+    def _log_files(self):
+        """{key: name} of the logs in log_dir; a plain file wins over its archive."""
+        found = {}
+        for name in os.listdir(self.log_dir):
+            if not name.endswith(LOG_SUFFIXES):
+                continue
+            key = _log_key(name)
+            if key not in found or name == key:
+                found[key] = name
+        return found
+
+    def update(self):
+        """
+        Bring the index in line with log_dir: new logs are indexed, grown
+        ones from where they were left, rewritten ones from scratch, and
+        deleted ones dropped. Returns (files touched, lines added).
+        """
+        t0 = time.perf_counter()
+        on_disk = self._log_files()
+        known = {
+            row[0]: row
+            for row in self.db.execute(
+                "SELECT key, id, path, size, mtime_ns, lines, offset FROM files"
+            )
+        }
+        touched = added = 0
+        for key, name in sorted(on_disk.items()):
+            st = os.stat(os.path.join(self.log_dir, name))
+            row = known.get(key)
+            if row is not None:
+                _, file_id, path, size, mtime_ns, lines, offset = row
+                if path == name and size == st.st_size and mtime_ns == st.st_mtime_ns:
+                    continue
+                compressed = name != key
+                if path != name and compressed:
+                    # Archived by log_rotation: same content, resume by line.
+                    pass
+                elif path == name and not compressed and st.st_size >= offset:
+                    pass  # appended to
+                else:
+                    self._drop(file_id)
+                    row = None
+            if row is None:
+                file_id = self.db.execute(
+                    "INSERT INTO files (key, path, size, mtime_ns, lines, offset) "
+                    "VALUES (?, ?, 0, 0, 0, 0) "
+                    "ON CONFLICT (key) DO UPDATE SET lines = 0, offset = 0 RETURNING id",
+                    (key, name),
+                ).fetchone()[0]
+                lines = offset = 0
+            added += self._index_file(file_id, name, lines, offset, st)
+            touched += 1
+        for key, row in known.items():
+            if key not in on_disk:
+                self._drop(row[1])
+                self.db.execute("DELETE FROM files WHERE id = ?", (row[1],))
+                touched += 1
+        self.db.commit()
+        if touched:
+            logger.info(
+                f"Index: {touched} files, {added} lines added in "
+                f"{time.perf_counter() - t0:.2f}s"
+            )
+        return touched, added
+
+    def _drop(self, file_id):
+        self.db.execute(
+            "DELETE FROM lines_fts WHERE rowid IN (SELECT id FROM lines WHERE file_id = ?)",
+            (file_id,),
+        )
+        self.db.execute("DELETE FROM lines WHERE file_id = ?", (file_id,))
+
+    def _index_file(self, file_id, name, lines, offset, st):
+        path = os.path.join(self.log_dir, name)
+        compressed = name != _log_key(name)
+        progress = [lines, offset]
+        if compressed:
+            f = open_log(path)
+            for _ in range(lines):
+                if not f.readline():
+                    break
+        else:
+            f = open(path, "r", encoding="utf-8", errors="ignore", newline="")
+            f.seek(offset)
+        next_id = self.db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM lines").fetchone()[0]
+        rows, fts = [], []
+        sub_offsets = self.sub_offsets
+        with f:
+            for rec in iter_records(_complete_lines(f, progress), start=lines + 1):
+                if isinstance(rec, LogEvent):
+                    rows.append(
+                        (next_id, file_id, rec.line_no, rec.t, "EVT",
+                         None, None, None, None, None, None, None, rec.message)
+                    )
+                    fts.append((next_id, "", rec.message, "evt"))
+                else:
+                    opcode = rec.cdb[0] if rec.cdb else None
+                    at = sub_offsets.get(opcode)
+                    sub = rec.cdb[at] if at is not None and at < len(rec.cdb) else None
+                    rows.append(
+                        (next_id, file_id, rec.line_no, rec.t, rec.direction, opcode,
+                         sub, rec.status, rec.name, rec.cdb, rec.data, rec.payload, None)
+                    )
+                    fts.append((next_id, rec.name, "", _terms(rec, sub)))
+                next_id += 1
+        self.db.executemany(
+            "INSERT INTO lines VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        self.db.executemany(
+            "INSERT INTO lines_fts (rowid, name, message, terms) VALUES (?, ?, ?, ?)", fts
+        )
+        self.db.execute(
+            "UPDATE files SET path = ?, size = ?, mtime_ns = ?, lines = ?, offset = ? "
+            "WHERE id = ?",
+            (name, st.st_size, st.st_mtime_ns, progress[0],
+             progress[1] if not compressed else 0, file_id),
+        )
+        return len(rows)
+
+    # --- Queries ---
+
+    def search(self, query, then=None, within=50, limit=200):
+        """
+        Lines matching `query`, optionally only those followed within
+        `within` lines of the same log by a line matching `then`.
+        Returns [{file, line, t, time, dir, name, cdb, data, status, message,
+        then: {...}}] in log order.
+
+        Query terms (all must hold):
+          name:StartEvac_M1   exact command name (name:Start* globs)
+          op:01  sub:40       opcode / sub-op byte, hex
+          status:4  status:!1 status, or anything but
+          dir:cmd|res|evt
+          data:"38 01"        bytes in DATA or PAYLOAD (hex, any length)
+          cdb:"01 01 00"      bytes in the CDB
+          file:*_220324*      log file name glob
+          word                full-text over names and event messages
+        """
+        a = _compile(query)
+        if not then:
+            sql = (
+                f"SELECT l.*, f.path FROM ({a.sql}) AS l JOIN files f ON f.id = l.file_id "
+                f"ORDER BY f.key, l.line LIMIT ?"
+            )
+            cur = self.db.execute(sql, a.params + [limit])
+            return [_row(r) for r in cur]
+        b = _compile(then)
+        # Both sides are FTS lookups; joining them in SQL defeats the FTS
+        # index, so fetch (file, line) for each and pair every first match
+        # with the nearest following match by bisection.
+        key = "SELECT l.file_id, l.line, l.id FROM ({}) AS l ORDER BY l.file_id, l.line"
+        following = {}
+        for file_id, line, row_id in self.db.execute(key.format(b.sql), b.params):
+            lines_ids = following.setdefault(file_id, ([], []))
+            lines_ids[0].append(line)
+            lines_ids[1].append(row_id)
+        pairs = []
+        for file_id, line, row_id in self.db.execute(key.format(a.sql), a.params):
+            lines_ids = following.get(file_id)
+            if lines_ids is None:
+                continue
+            at = bisect.bisect_right(lines_ids[0], line)
+            if at < len(lines_ids[0]) and lines_ids[0][at] <= line + within:
+                pairs.append((row_id, lines_ids[1][at]))
+        rows = {}
+        ids = [i for pair in pairs for i in pair]
+        for chunk in range(0, len(ids), 500):
+            part = ids[chunk : chunk + 500]
+            for r in self.db.execute(
+                "SELECT l.*, f.path FROM lines l JOIN files f ON f.id = l.file_id "
+                f"WHERE l.id IN ({','.join('?' * len(part))})",
+                part,
+            ):
+                rows[r[0]] = _row(r)
+        hits = []
+        for first, nxt in pairs:
+            hit = rows[first]
+            hit["then"] = rows[nxt]
+            hits.append(hit)
+        hits.sort(key=lambda h: (h["file"], h["line"]))
+        return hits[:limit]
+
+    def stats(self):
+        files, lines = self.db.execute(
+            "SELECT (SELECT COUNT(*) FROM files), (SELECT COUNT(*) FROM lines)"
+        ).fetchone()
+        return {"files": files, "lines": lines, "db_bytes": os.path.getsize(self.db_path)}
+
+
+COLUMNS = (
+    "id", "file_id", "line", "t", "dir", "opcode", "sub", "status",
+    "name", "cdb", "data", "payload", "message",
+)
+
+
+def _hex(blob):
+    return blob.hex(" ").upper() if blob else ""
+
+
+def _row(r):
+    rec = dict(zip(COLUMNS + ("file",), r))
+    return {
+        "file": rec["file"],
+        "line": rec["line"],
+        "t": rec["t"],
+        "time": format_time(rec["t"], date=True),
+        "dir": rec["dir"],
+        "name": rec["name"] or "",
+        "cdb": _hex(rec["cdb"]),
+        "data": _hex(rec["data"]),
+        "payload": _hex(rec["payload"]),
+        "status": rec["status"],
+        "message": rec["message"] or "",
+    }
+
+
+class _Compiled:
+    def __init__(self, sql, params):
+        self.sql = sql
+        self.params = params
+
+
+def _fts_string(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _hex_bytes(text):
+    try:
+        return bytes.fromhex(text.replace(" ", ""))
+    except ValueError:
+        raise ValueError(f"Not hex bytes: {text!r}")
+
+
+def _compile(query):
+    """Query string -> SELECT over `lines` (one FTS MATCH plus SQL checks)."""
+    match, where, params = [], [], []
+    for token in shlex.split(query):
+        field, sep, value = token.partition(":")
+        if not sep:
+            field, value = "", token
+        field = field.lower()
+        if field == "name":
+            if any(c in value for c in "*?["):
+                where.append("l.name GLOB ?")
+            else:
+                match.append(f"name : {_fts_string(value)}")
+                where.append("l.name = ?")
+            params.append(value)
+        elif field == "op":
+            match.append(f"op{int(value, 16):02x}")
+        elif field == "sub":
+            match.append(f"sub{int(value, 16):02x}")
+        elif field == "status":
+            if value.startswith("!"):
+                where.append("l.status != ?")
+                params.append(int(value[1:]))
+            else:
+                match.append(f"st{int(value)}")
+        elif field == "dir":
+            if value.lower() not in ("cmd", "res", "evt"):
+                raise ValueError(f"dir must be cmd, res or evt: {value}")
+            match.append(value.lower())
+        elif field in ("data", "cdb"):
+            prefix = "d" if field == "data" else "c"
+            needle = _hex_bytes(value)
+            if len(needle) == 1:
+                match.append(f"{prefix}{needle[0]:02x}")
+            else:
+                match += [f"{prefix}{a:02x}{b:02x}" for a, b in zip(needle, needle[1:])]
+                if len(needle) > 2:
+                    if field == "data":
+                        where.append("(instr(l.data, ?) > 0 OR instr(l.payload, ?) > 0)")
+                        params += [needle, needle]
+                    else:
+                        where.append("instr(l.cdb, ?) > 0")
+                        params.append(needle)
+        elif field == "file":
+            where.append("l.file_id IN (SELECT id FROM files WHERE key GLOB ?)")
+            params.append(value)
+        elif field == "":
+            match.append("{name message} : " + _fts_string(value))
+        else:
+            raise ValueError(f"Unknown search field: {field}")
+
+    sql = "SELECT l.* FROM lines l"
+    if match:
+        sql += " JOIN lines_fts ON lines_fts.rowid = l.id"
+        where.insert(0, "lines_fts MATCH ?")
+        params.insert(0, " AND ".join(match))
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return _Compiled(sql, params)
+
+
+def _print_hit(hit, indent=""):
+    what = hit["message"] if hit["dir"] == "EVT" else f"{hit['name']} | {hit['cdb']} | {hit['data'] or '[Empty]'} -> Status={hit['status']}"
+    print(f"{indent}{hit['file']}:{hit['line']} {hit['time']} [{hit['dir']}] {what}")
+
+
+def bench(index, queries, repeat=20):
+    t0 = time.perf_counter()
+    touched, added = index.update()
+    print(f"Update: {touched} files, {added} lines in {time.perf_counter() - t0:.2f}s ({index.stats()})")
+    t0 = time.perf_counter()
+    index.update()
+    print(f"No-op update: {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    for q, then in queries:
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            hits = index.search(q, then=then)
+        ms = (time.perf_counter() - t0) / repeat * 1e3
+        label = q + (f"  then  {then}" if then else "")
+        print(f"  {ms:7.2f} ms  {len(hits):>5} hits  {label}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search index over captured session logs")
+    parser.add_argument("query", nargs="?", help="e.g. 'name:StartEvac_M1' or 'op:c8 data:\"40 b7\"'")
+    parser.add_argument("--then", help="only hits followed by a line matching this")
+    parser.add_argument("--within", type=int, default=50, help="lines, for --then")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--logs", default=DEFAULT_LOG_DIR, help="log directory")
+    parser.add_argument("--db", help=f"index file (default LOGS/{DEFAULT_DB})")
+    parser.add_argument("--rebuild", action="store_true", help="drop the index first")
+    parser.add_argument("--bench", action="store_true", help="time an update and sample queries")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    db_path = args.db or os.path.join(args.logs, DEFAULT_DB)
+    if args.rebuild and os.path.exists(db_path):
+        os.remove(db_path)
+    index = SessionIndex(args.logs, db_path)
+    if args.bench:
+        bench(
+            index,
+            [
+                ("name:GetIMS", None),
+                ("op:d0 status:1", None),
+                ('data:"4A 45 4F 4C"', None),
+                ("status:!1 dir:res", None),
+                ("dir:cmd op:fa", "dir:res status:4"),
+                ("Client", None),
+            ],
+        )
+    else:
+        index.update()
+        if args.query:
+            hits = index.search(args.query, then=args.then, within=args.within, limit=args.limit)
+            for hit in hits:
+                _print_hit(hit)
+                if "then" in hit:
+                    _print_hit(hit["then"], "    -> ")
+            print(f"{len(hits)} hits")
+        else:
+            print(index.stats())
+    index.close()
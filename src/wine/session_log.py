@@ -0,0 +1,432 @@
+import argparse
+import gzip
+import io
+import operator
+import time
+from collections import namedtuple
+from datetime import datetime
+from itertools import count, islice
+
+try:
+    import zstandard
+
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+# Session log line, as written by SCSILogger (bridge_sem.py / virtual_sem.py):
+#   TS [LVL ] [DIR] Name | CDB: hex | DATA: hex [...]|[Empty] -> Status=N [extra]
+#   TS [LVL ] [EVT] message
+# DATA holds at most the first 16 bytes; a trailing "..." marks truncation.
+# VirtualSEM adds "| PAYLOAD: hex [...] (len=N)" after CMD lines that carried
+# data-out. redecode_log.py pads the direction ("[CMD ]"); both forms parse.
+# Both bridges end CMD/RES lines with the transaction they belong to:
+#   ... -> Status=0 [extra] | TXN: 42 start_ns=N
+#   ... -> Status=1 [extra] | TXN: 42 start_ns=N end_ns=N
+# (ids count up per bridge instance; times are epoch ns). Older logs have
+# none; txn / start_ns / end_ns are then None.
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+# t is seconds since the epoch. data / payload are the logged bytes (None
+# when the log says [Empty]); *_len is the full length when it is known.
+# Records are namedtuples (__slots__ = (), no per-record dict) and are
+# built with one tuple.__new__ call from cached fields.
+LogEntry = namedtuple(
+    "LogEntry",
+    "line_no t level direction name cdb data data_truncated status payload payload_len extra "
+    "txn start_ns end_ns",
+)
+LogEvent = namedtuple("LogEvent", "line_no t level message")
+_new = tuple.__new__
+
+
+# --- Tokenizer ---
+# Fixed markers are located with str.find instead of a regex, so there is
+# no backtracking over the padded name/CDB columns. Everything after the
+# timestamp repeats heavily in a session (a polling loop logs the same
+# CMD/RES text thousands of times; the 1.3 MB capture has 114 distinct
+# line bodies in 9952 lines), so bodies are parsed once and cached, and
+# the date/time is converted once per second of log. The TXN suffix is
+# unique per line, so it is cut off before the cache lookup.
+
+_CACHE_LIMIT = 1 << 16
+_second_cache = {}
+_frac_cache = {}
+_hex_cache = {}
+
+
+def _second(text):
+    """Epoch seconds of a 'YYYY-MM-DD HH:MM:SS' prefix (local time), cached."""
+    base = _second_cache.get(text)
+    if base is None:
+        if len(_second_cache) >= _CACHE_LIMIT:
+            _second_cache.clear()
+        # Same result as strptime, without its per-call format parsing.
+        base = _second_cache[text] = datetime(
+            int(text[0:4]),
+            int(text[5:7]),
+            int(text[8:10]),
+            int(text[11:13]),
+            int(text[14:16]),
+            int(text[17:19]),
+        ).timestamp()
+    return base
+
+
+def _fraction(text):
+    """0.268 for '.268', 0.0 for ''."""
+    frac = _frac_cache.get(text)
+    if frac is None:
+        if text and (text[0] != "." or not text[1:].isdigit()):
+            raise ValueError(f"bad fraction of a second: {text!r}")
+        if len(_frac_cache) >= _CACHE_LIMIT:
+            _frac_cache.clear()
+        frac = _frac_cache[text] = int(text[1:]) / 10 ** (len(text) - 1) if text else 0.0
+    return frac
+
+
+def parse_timestamp(ts):
+    """Seconds since the epoch for a TS_FORMAT timestamp (local time)."""
+    return _second(ts[:19]) + _fraction(ts[19:])
+
+
+def format_time(t, date=False):
+    """A record's t as the log writes it: [YYYY-MM-DD ]HH:MM:SS.mmm."""
+    fmt = TS_FORMAT if date else "%H:%M:%S.%f"
+    return datetime.fromtimestamp(t).strftime(fmt)[:-3]
+
+
+def _hex(field):
+    """(bytes or None, truncated) for a CDB/DATA hex field."""
+    hit = _hex_cache.get(field)
+    if hit is not None:
+        return hit
+    text = field.strip()
+    truncated = text.endswith("...")
+    if truncated:
+        text = text[:-3]
+    if not text or text == "[Empty]":
+        result = (None, False)
+    else:
+        try:
+            result = (bytes.fromhex(text), truncated)
+        except ValueError:
+            result = (None, False)
+    if len(_hex_cache) >= _CACHE_LIMIT:
+        _hex_cache.clear()
+    _hex_cache[field] = result
+    return result
+
+
+def hex_field(data, truncated=False):
+    """Inverse of the DATA field: 'XX XX ...' or '[Empty]'."""
+    if not data:
+        return "[Empty]"
+    return data.hex(" ").upper() + (" ..." if truncated else "")
+
+
+def _payload(extra):
+    # "| PAYLOAD: hex [...] (len=N)"
+    start = extra.find("PAYLOAD: ")
+    end = extra.find("(len=", start)
+    close = extra.find(")", end)
+    if start < 0 or end < 0 or close < 0:
+        return None, None
+    try:
+        payload_len = int(extra[end + 5 : close])
+    except ValueError:
+        return None, None
+    return _hex(extra[start + 9 : end])[0], payload_len
+
+
+_body_cache = {}
+_JUNK = (None, None)
+
+
+def _parse_body(body):
+    """(record type, fields after line_no/t) for the text after the timestamp."""
+    # " [LVL ] [DIR] ..."
+    close = body.find("] [")
+    tag_end = body.find("] ", close + 3)
+    if not body.startswith(" [") or close < 0 or tag_end < 0:
+        return _JUNK
+    level = body[2:close].strip()
+    direction = body[close + 3 : tag_end].rstrip()
+
+    if direction == "EVT":
+        return LogEvent, (level, body[tag_end + 2 :].rstrip("\r\n"))
+    if direction != "CMD" and direction != "RES":
+        return _JUNK
+
+    cdb_at = body.find("| CDB: ", tag_end)
+    data_at = body.find("| DATA: ", cdb_at)
+    arrow = body.find(" -> Status=", data_at)
+    if cdb_at < 0 or data_at < 0 or arrow < 0:
+        return _JUNK
+    field = body[cdb_at + 7 : data_at]
+    cdb, _ = _hex(field)
+    if cdb is None:
+        # An empty CDB logs as "CDB: " and is still a transaction.
+        if field.strip():
+            return _JUNK
+        cdb = b""
+    data, truncated = _hex(body[data_at + 8 : arrow])
+
+    tail = body[arrow + 11 :].rstrip("\r\n")
+    status_end = tail.find(" ")
+    if status_end < 0:
+        status_end = len(tail)
+    try:
+        status = int(tail[:status_end])
+    except ValueError:
+        return _JUNK
+    extra = tail[status_end:].strip()
+    payload = payload_len = None
+    if "PAYLOAD: " in extra:
+        payload, payload_len = _payload(extra)
+
+    name = body[tag_end + 2 : cdb_at].rstrip()
+    fields = (level, direction, name, cdb, data, truncated, status, payload, payload_len, extra)
+    return LogEntry, fields + _NO_TXN
+
+
+TXN_MARK = "| TXN: "
+_NO_TXN = (None, None, None)
+
+
+def _txn(text):
+    """(txn, start_ns, end_ns) from the text after '| TXN: '."""
+    # "42 start_ns=N[ end_ns=N]"; partition() is cheaper than split() and
+    # int() ignores the trailing newline.
+    txn, _, rest = text.partition(" start_ns=")
+    start_ns, _, end_ns = rest.partition(" end_ns=")
+    try:
+        return int(txn), int(start_ns), int(end_ns) if end_ns else None
+    except ValueError:
+        return _NO_TXN
+
+
+def txn_field(rec):
+    """The ' | TXN: ...' suffix of a LogEntry as the bridges write it, or ''."""
+    if rec.txn is None:
+        return ""
+    end = f" end_ns={rec.end_ns}" if rec.end_ns is not None else ""
+    return f" {TXN_MARK}{rec.txn} start_ns={rec.start_ns}{end}"
+
+
+def latency_ns(res):
+    """A RES line's start-to-end time, or None for logs without TXN."""
+    if res.start_ns is None or res.end_ns is None:
+        return None
+    return res.end_ns - res.start_ns
+
+
+_CHUNK = 512
+_has_txn = operator.methodcaller("__contains__", TXN_MARK)
+_split_txn = operator.methodcaller("rpartition", TXN_MARK)
+_head = operator.itemgetter(0)
+_body_at = operator.itemgetter(slice(23, None))
+_second_at = operator.itemgetter(slice(0, 19))
+_millis_at = operator.itemgetter(slice(19, 23))
+# ".268" -> 0.268 for the millisecond timestamps the bridges write. A fixed
+# table rather than a cache, so the fast path below always finds them.
+_MILLIS = {f".{i:03d}": i / 1000 for i in range(1000)}
+
+
+def iter_records(lines, start=1):
+    """Yield LogEntry / LogEvent records from an iterable of lines, skipping junk."""
+    # Lines are taken a chunk at a time. For the common case (millisecond
+    # timestamp, a body seen before) the slicing and cache lookups run over
+    # the whole chunk in map(), in C; per line Python only checks the hits
+    # and builds the record. Chunks with TXN suffixes also split those off
+    # in map(). Everything else goes through _parse_one.
+    lines = iter(lines)
+    body_cache, second_cache = _body_cache, _second_cache
+    last_txn_text = last_start_text = last_txn = last_start = None
+    line_no = start
+    while True:
+        chunk = list(islice(lines, _CHUNK))
+        if not chunk:
+            return
+        seconds = map(second_cache.get, map(_second_at, chunk))
+        millis = map(_MILLIS.get, map(_millis_at, chunk))
+        # Only routes the chunk: a line the sample misses still parses right.
+        if not any(map(_has_txn, chunk[::64])):
+            hits = map(body_cache.get, map(_body_at, chunk))
+            for n, line, hit, sec, frac in zip(count(line_no), chunk, hits, seconds, millis):
+                if hit is None or frac is None:
+                    rec = _parse_one(line, n)
+                    if rec is not None:
+                        yield rec
+                    continue
+                kind, fields = hit
+                if kind is None:
+                    continue
+                if sec is None:
+                    try:
+                        sec = _second(line[:19])
+                    except ValueError:
+                        continue
+                yield _new(kind, (n, sec + frac) + fields)
+        else:
+            # rpartition gives ("", "", line) for lines without a suffix.
+            parts = list(map(_split_txn, chunk))
+            hits = map(body_cache.get, map(_body_at, map(_head, parts)))
+            for n, line, (_, _, suffix), hit, sec, frac in zip(
+                count(line_no), chunk, parts, hits, seconds, millis
+            ):
+                if hit is not None and frac is not None and sec is not None:
+                    kind, fields = hit
+                    if kind is LogEntry:
+                        # _txn inlined. A RES line repeats its CMD's id and
+                        # start_ns, usually the line before, so those int()
+                        # calls are reused and only end_ns is new.
+                        txn_text, _, rest = suffix.partition(" start_ns=")
+                        start_text, _, end_ns = rest.partition(" end_ns=")
+                        try:
+                            if start_text != last_start_text or txn_text != last_txn_text:
+                                last_txn, last_start = int(txn_text), int(start_text)
+                                last_txn_text, last_start_text = txn_text, start_text
+                            txn = (last_txn, last_start, int(end_ns) if end_ns else None)
+                        except ValueError:
+                            pass
+                        else:
+                            yield _new(kind, (n, sec + frac) + fields[:-3] + txn)
+                            continue
+                rec = _parse_one(line, n)
+                if rec is not None:
+                    yield rec
+        line_no += len(chunk)
+
+
+def _parse_one(line, line_no):
+    """One line to a record, or None; the general case behind iter_records."""
+    sp = line.find(" [", 19)
+    if sp < 0:
+        return None
+    tx = line.rfind(TXN_MARK) if TXN_MARK in line else -1
+    body = line[sp:] if tx < 0 else line[sp:tx]
+    hit = _body_cache.get(body)
+    if hit is None:
+        if len(_body_cache) >= _CACHE_LIMIT:
+            _body_cache.clear()
+        hit = _body_cache[body] = _parse_body(body)
+    kind, fields = hit
+    if kind is None:
+        return None
+    if tx >= 0:
+        if kind is LogEntry:
+            fields = fields[:-3] + _txn(line[tx + 7 :])
+        else:
+            # An event that merely mentions "| TXN: ".
+            kind, fields = _parse_body(line[sp:])
+    try:
+        t = _second(line[:19]) + _fraction(line[19:sp])
+    except ValueError:
+        return None
+    return _new(kind, (line_no, t) + fields)
+
+
+def parse_line(line, line_no=0):
+    """Parse one log line into a LogEntry / LogEvent, or None if it is neither."""
+    return _parse_one(line, line_no)
+
+
+# Plain, and as archived by log_rotation (closed segments are compressed).
+LOG_SUFFIXES = (".log", ".log.gz", ".log.zst")
+
+
+def open_log(path, mode="r"):
+    """
+    Open a session log as text, plain or .gz / .zst by its suffix, for
+    reading ("r") or writing ("w").
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", errors="ignore")
+    if path.endswith(".zst"):
+        if not HAS_ZSTD:
+            raise RuntimeError(f"zstandard is not installed, cannot open {path}")
+        raw = open(path, mode + "b")
+        if mode == "r":
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8", errors="ignore")
+    return open(path, mode, encoding="utf-8", errors="ignore")
+
+
+def read_session(path):
+    """Yield LogEntry / LogEvent records from a session log, skipping junk."""
+    with open_log(path) as f:
+        yield from iter_records(f)
+
+
+def transactions(records):
+    """
+    Pair CMD lines with their RES line: by transaction id where the log
+    has them, otherwise the RES that follows for the same CDB.
+    Yields (cmd, res); res is None for a CMD that never completed.
+    """
+    pending = None
+    open_txns = {}
+    for rec in records:
+        if not isinstance(rec, LogEntry):
+            continue
+        if rec.txn is not None:
+            if rec.direction == "CMD":
+                open_txns[rec.txn] = rec
+            else:
+                cmd = open_txns.pop(rec.txn, None)
+                if cmd is not None:
+                    yield cmd, rec
+            continue
+        if rec.direction == "CMD":
+            if pending is not None:
+                yield pending, None
+            pending = rec
+        elif pending is not None and rec.cdb == pending.cdb:
+            yield pending, rec
+            pending = None
+    if pending is not None:
+        yield pending, None
+    for cmd in open_txns.values():
+        yield cmd, None
+
+
+def bench(path, repeat=20):
+    """Parse rate over `path` held in memory, and end to end from disk."""
+    with open_log(path) as f:
+        lines = f.readlines()
+    best = None
+    for _ in range(repeat):
+        _second_cache.clear()
+        _frac_cache.clear()
+        _hex_cache.clear()
+        _body_cache.clear()
+        t0 = time.perf_counter()
+        n = sum(1 for _ in iter_records(lines))
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    t0 = time.perf_counter()
+    sum(1 for _ in read_session(path))
+    disk = time.perf_counter() - t0
+    print(
+        f"Parse: {len(lines)} lines ({n} records) from {path}: "
+        f"{len(lines) / best:,.0f} lines/s in memory, "
+        f"{len(lines) / disk:,.0f} lines/s from disk"
+    )
+    return len(lines) / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Session log parser")
+    parser.add_argument("log", help="session log")
+    parser.add_argument("--bench", action="store_true", help="measure parse throughput")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.log)
+    else:
+        for rec in read_session(args.log):
+            print(rec)
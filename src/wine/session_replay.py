@@ -0,0 +1,171 @@
+import argparse
+import logging
+import time
+
+from session_log import latency_ns, read_session, transactions
+
+logger = logging.getLogger("VirtualSEM")
+
+
+class SessionReplay:
+    """
+    Recorded responses from a captured session, indexed by CDB.
+
+    Each distinct request maps to the sequence of responses it got, in
+    order. Successive identical requests walk that sequence (so a vacuum
+    poll sees 2, 2, ..., 3 just as it did on the hardware) and then keep
+    returning the last one. Requests that carried data-out are keyed on
+    (cdb, payload) first, then on the CDB alone, because bridge logs do
+    not record payloads.
+
+    Logged data is capped at 16 bytes; the caller pads to the transfer
+    length. Replies are paced by the recording: each waits at least its
+    CMD->RES latency (from the TXN times where the log has them) and, if
+    the client asks sooner, until the recorded gap since the previous
+    reply has passed, so a tight polling loop runs at the captured
+    cadence. `speed` scales that timing: 1.0 is original, 10 is ten times
+    faster, 0 answers immediately.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.speed = speed
+        self.table = {}
+        self.cursor = {}
+        self.hits = 0
+        self.misses = 0
+        self.commands = 0
+        self._last_reply = None
+        self._load(path)
+
+    def _load(self, path):
+        prev_res_t = None
+        for cmd, res in transactions(read_session(path)):
+            if res is None:
+                continue
+            self.commands += 1
+            ns = latency_ns(res)
+            latency = max(res.t - cmd.t, 0.0) if ns is None else ns / 1e9
+            gap = latency if prev_res_t is None else max(res.t - prev_res_t, latency)
+            prev_res_t = res.t
+            entry = (res.data or b"", res.status, latency, gap)
+            self.table.setdefault((cmd.cdb, None), []).append(entry)
+            if cmd.payload is not None:
+                self.table.setdefault((cmd.cdb, cmd.payload), []).append(entry)
+        logger.info(
+            f"Replay: {self.commands} transactions, {len(self.table)} keys from {path}"
+        )
+
+    def reset(self):
+        self.cursor.clear()
+        self.hits = self.misses = 0
+        self._last_reply = None
+
+    def lookup(self, cdb, data_out=None, now=None):
+        """
+        Returns (data, status, delay_s) for the next recorded response, or
+        None. With `now` (clock seconds) the delay also keeps the recorded
+        gap from the previous reply; without it only the latency counts.
+        """
+        key = None
+        if data_out:
+            key = (bytes(cdb), bytes(data_out[:16]))
+            if key not in self.table:
+                key = None
+        if key is None:
+            key = (bytes(cdb), None)
+        seq = self.table.get(key)
+        if seq is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        i = self.cursor.get(key, 0)
+        if i < len(seq) - 1:
+            self.cursor[key] = i + 1
+        data, status, latency, gap = seq[i]
+        if not self.speed:
+            return data, status, 0.0
+        delay = latency / self.speed
+        if now is not None:
+            if self._last_reply is not None:
+                delay = max(delay, gap / self.speed - (now - self._last_reply))
+            self._last_reply = now + delay
+        return data, status, delay
+
+
+def replay_check(path, against=None, replay=True, limit=None):
+    """
+    Feed a captured session's commands through VirtualSEM and compare every
+    response with the recording (logged 16-byte prefix and status).
+    `against` defaults to the session itself; replay=False measures the
+    synthetic handlers instead. Returns (matched, total, cmds_per_s).
+    """
+    from virtual_sem import VirtualSEM
+    from sim_scheduler import SimulatedClock
+
+    emu = VirtualSEM(
+        port=0,
+        clock=SimulatedClock(),
+        ipc_endpoint=None,
+        replay=SessionReplay(against or path) if replay else None,
+    )
+    txns = [(c, r) for c, r in transactions(read_session(path)) if r is not None]
+    if limit:
+        txns = txns[:limit]
+
+    prev_level = logger.level
+    logger.setLevel(logging.WARNING)
+    matched = 0
+    mismatched_ops = {}
+    try:
+        t0 = time.perf_counter()
+        for cmd, res in txns:
+            data_out = cmd.payload if cmd.payload is not None else None
+            direction = 2 if data_out else 1
+            xfer_len = len(data_out) if data_out else max(len(res.data or b""), 4)
+            response, status = emu.process_scsi_command(
+                cmd.cdb, direction=direction, data_out=data_out, xfer_len=xfer_len
+            )
+            expected = res.data or b""
+            if status == res.status and response[: len(expected)] == expected:
+                matched += 1
+            else:
+                op = cmd.cdb[0]
+                mismatched_ops[op] = mismatched_ops.get(op, 0) + 1
+        elapsed = time.perf_counter() - t0
+    finally:
+        logger.setLevel(prev_level)
+        emu.stop()
+
+    total = len(txns)
+    rate = total / elapsed if elapsed > 0 else 0.0
+    mode = "replay" if replay else "synthetic"
+    print(
+        f"{mode}: {matched}/{total} responses match {path} "
+        f"({100.0 * matched / max(total, 1):.1f}%), {rate:,.0f} cmds/s"
+    )
+    if emu.replay:
+        print(f"  replay hits {emu.replay.hits}, misses {emu.replay.misses}")
+    if mismatched_ops:
+        worst = sorted(mismatched_ops.items(), key=lambda kv: -kv[1])[:8]
+        print("  mismatches by opcode: " + ", ".join(f"{op:02X}={n}" for op, n in worst))
+    return matched, total, rate
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check VirtualSEM responses against a captured session"
+    )
+    parser.add_argument("log", help="captured session log")
+    parser.add_argument(
+        "--against", help="session to serve replies from (default: the same log)"
+    )
+    parser.add_argument(
+        "--synthetic",
+        action="store_true",
+        help="compare the synthetic handlers instead of replay",
+    )
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    replay_check(args.log, args.against, replay=not args.synthetic, limit=args.limit)
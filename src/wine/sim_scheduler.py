@@ -0,0 +1,240 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger("VirtualSEM")
+
+
+# --- Clocks ---
+# now() is the monotonic time the scheduler runs on; time() is the matching
+# wall-clock epoch time used for log timestamps.
+
+
+class MonotonicClock:
+    """Real time."""
+
+    simulated = False
+
+    def now(self):
+        return time.monotonic()
+
+    def time(self):
+        return time.time()
+
+    def time_ns(self):
+        return time.time_ns()
+
+
+class SimulatedClock:
+    """
+    Simulated time that only moves when the scheduler advances it.
+
+    Starts at 0 (now) / `epoch` (time), so two runs of the same command
+    sequence produce the same transitions and the same log timestamps.
+    """
+
+    simulated = True
+
+    def __init__(self, epoch=None):
+        self.epoch = time.time() if epoch is None else epoch
+        self._now = 0.0
+
+    def now(self):
+        return self._now
+
+    def time(self):
+        return self.epoch + self._now
+
+    def time_ns(self):
+        return round(self.epoch * 1e9) + round(self._now * 1e9)
+
+    def advance_to(self, t):
+        if t > self._now:
+            self._now = t
+
+
+class EventScheduler:
+    """
+    Heap-ordered timer queue for the emulator's delayed state transitions.
+
+    One worker thread replaces the threading.Timer per transition. Events
+    can carry a key (e.g. "vacuum_status"); scheduling a new event under a
+    key supersedes the pending one, and cancel(key) drops it, so a vent
+    issued mid-evac no longer lets the old evac timer fire afterwards.
+
+    If `lock` is given the worker holds it while running callbacks, and
+    re-checks that an event is still current under that lock, so a client
+    thread holding the same lock can never race a transition that is
+    about to fire.
+
+    With a SimulatedClock there is no worker thread: time only moves when
+    advance() / advance_to_next() / run_until_idle() is called, which lets
+    minutes of simulated pump-down run in milliseconds.
+    """
+
+    def __init__(self, lock=None, clock=None):
+        self.clock = clock or MonotonicClock()
+        self.virtual = self.clock.simulated
+        self._lock = lock
+        self._cond = threading.Condition()
+        self._heap = []  # (due, seq, key, fn)
+        self._pending = {}  # key -> seq of the event that is still current
+        self._seq = itertools.count()
+        self._thread = None
+        self._running = False
+
+    def now(self):
+        return self.clock.now()
+
+    # --- Queue ---
+
+    def schedule(self, delay_s, fn, key=None):
+        """Run fn() after delay_s seconds. Returns the event's sequence id."""
+        with self._cond:
+            seq = next(self._seq)
+            heapq.heappush(self._heap, (self.now() + delay_s, seq, key, fn))
+            if key is not None:
+                self._pending[key] = seq
+            self._cond.notify()
+        return seq
+
+    def cancel(self, key):
+        """Drop the pending event for key, if any. Returns True if one was pending."""
+        with self._cond:
+            # Lazy deletion: the heap entry stays and is skipped when popped.
+            return self._pending.pop(key, None) is not None
+
+    def pending(self):
+        with self._cond:
+            return sum(1 for _, seq, key, _ in self._heap if self._is_current(seq, key))
+
+    def pending_keys(self):
+        """{key: due} for every keyed event that is still current."""
+        with self._cond:
+            return {
+                key: due
+                for due, seq, key, _ in self._heap
+                if key is not None and self._pending.get(key) == seq
+            }
+
+    def next_due(self):
+        """Due time of the earliest live event, or None if the queue is empty."""
+        with self._cond:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _is_current(self, seq, key):
+        return key is None or self._pending.get(key) == seq
+
+    def _drop_stale(self):
+        while self._heap and not self._is_current(self._heap[0][1], self._heap[0][2]):
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now):
+        due = []
+        self._drop_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, key, fn = heapq.heappop(self._heap)
+            if not self._is_current(seq, key):
+                continue
+            if key is not None:
+                del self._pending[key]
+            due.append(fn)
+            self._drop_stale()
+        return due
+
+    def _run_due(self, now):
+        if self._lock is not None:
+            with self._lock:
+                with self._cond:
+                    due = self._pop_due(now)
+                self._call(due)
+        else:
+            with self._cond:
+                due = self._pop_due(now)
+            self._call(due)
+        return len(due)
+
+    def _call(self, callbacks):
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                logger.error(f"Scheduler: event failed: {e}")
+
+    # --- Worker thread (real time) ---
+
+    def start(self):
+        if self.virtual or self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="vsem-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    self._drop_stale()
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    timeout = self._heap[0][0] - self.clock.now()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+            self._run_due(self.clock.now())
+
+    # --- Virtual time ---
+
+    def advance(self, seconds):
+        """Move virtual time forward, firing events in order. Returns events run."""
+        if not self.virtual:
+            raise RuntimeError("advance() is only available in virtual mode")
+        target = self.clock.now() + seconds
+        fired = 0
+        while True:
+            due = self.next_due()
+            if due is None or due > target:
+                break
+            # Events scheduled by callbacks are relative to their parent's
+            # due time, exactly as they would be in real time.
+            self.clock.advance_to(due)
+            fired += self._run_due(self.clock.now())
+        self.clock.advance_to(target)
+        return fired
+
+    def advance_to_next(self):
+        """Jump straight to the earliest pending event and fire it. Returns events run."""
+        if not self.virtual:
+            raise RuntimeError("advance_to_next() is only available in virtual mode")
+        due = self.next_due()
+        if due is None:
+            return 0
+        self.clock.advance_to(due)
+        return self._run_due(self.clock.now())
+
+    def run_until_idle(self, limit_s=3600.0):
+        """Fire every pending event (up to limit_s of virtual time). Returns elapsed."""
+        start = self.clock.now()
+        while True:
+            due = self.next_due()
+            if due is None or due - start > limit_s:
+                break
+            self.advance_to_next()
+        return self.clock.now() - start
@@ -0,0 +1,202 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("VirtualSEM")
+
+SNAPSHOT_VERSION = 1
+
+# --- Journal ---
+# Append-only JSON lines, one per state change:
+#   {"seq": 12, "t": 1769954604.123, "k": "vacuum_status", "v": 3}
+# and one per restore, carrying the whole restored state, so a journal
+# always replays to the live state (see replay_journal):
+#   {"seq": 13, "t": ..., "restore": "ready_ht_on.json", "state": {...}}
+
+
+class StateJournal:
+    def __init__(self, path, clock=None):
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.seq = 0
+        if os.path.exists(path):
+            for rec in read_journal(path):
+                self.seq = rec["seq"]
+        # Line-buffered: every change is on disk before the next SRB.
+        self.file = open(path, "a", buffering=1)
+
+    def _now(self):
+        return self.clock.time() if self.clock else time.time()
+
+    def _write(self, rec):
+        with self.lock:
+            self.seq += 1
+            rec["seq"] = self.seq
+            rec["t"] = round(self._now(), 6)
+            self.file.write(json.dumps(rec, separators=(",", ":")) + "\n")
+
+    def record(self, key, value):
+        self._write({"k": key, "v": value})
+
+    def mark_restore(self, source, state):
+        self._write({"restore": source, "state": dict(state)})
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_journal(path):
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn last line after a crash; everything before it holds.
+                logger.warning(f"Journal: skipping unreadable line in {path}")
+
+
+def replay_journal(path, initial=None):
+    """The state a journal leaves behind, starting from `initial`."""
+    state = dict(initial or {})
+    for rec in read_journal(path):
+        if "restore" in rec:
+            # Journals written before restores carried the state only
+            # name their source; nothing to apply then.
+            if "state" in rec:
+                state = dict(rec["state"])
+        else:
+            state[rec["k"]] = rec["v"]
+    return state
+
+
+class JournaledState(dict):
+    """
+    The emulator's state dict, reporting every changed value to a journal.
+
+    Only writes are intercepted; reads stay plain dict lookups. Handlers
+    keep assigning self.state[key] as before. Used only when a journal is
+    configured, so the default emulator pays nothing for it.
+    """
+
+    def __init__(self, initial, journal):
+        super().__init__(initial)
+        self.journal = journal
+
+    def __setitem__(self, key, value):
+        if self.get(key, self) != value:
+            self.journal.record(key, value)
+        dict.__setitem__(self, key, value)
+
+
+# --- Snapshots ---
+
+
+def save_snapshot(snap, path):
+    """Write atomically, so a crash never leaves a half-written checkpoint."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(snap, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    with open(path, "r") as f:
+        snap = json.load(f)
+    if snap.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version in {path}: {snap.get('version')}")
+    return snap
+
+
+def build_checkpoint(log_path, out_path, limit=None):
+    """
+    Run a captured session's commands (e.g. INQUIRY, CC 80/81, vacuum init,
+    HT on) through a VirtualSEM on a simulated clock, let every pending
+    transition finish, and snapshot the result.
+    """
+    from virtual_sem import VirtualSEM
+    from sim_scheduler import SimulatedClock
+    from session_log import read_session, transactions
+
+    emu = VirtualSEM(port=0, clock=SimulatedClock(), ipc_endpoint=None)
+    prev_level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        n = 0
+        for cmd, res in transactions(read_session(log_path)):
+            if limit and n >= limit:
+                break
+            data_out = cmd.payload
+            direction = 2 if data_out else 1
+            xfer_len = len(data_out) if data_out else max(len(res.data or b"") if res else 0, 4)
+            emu.process_scsi_command(
+                cmd.cdb, direction=direction, data_out=data_out, xfer_len=xfer_len
+            )
+            n += 1
+        emu.scheduler.run_until_idle()
+        snap = emu.snapshot()
+        save_snapshot(snap, out_path)
+    finally:
+        logger.setLevel(prev_level)
+        emu.stop()
+    print(f"Checkpoint: {n} commands from {log_path} -> {out_path}")
+    print("  " + ", ".join(f"{k}={v}" for k, v in sorted(snap["state"].items())))
+    return snap
+
+
+def bench_restore(path, iterations=1000):
+    """Time restore() of a snapshot into a live emulator."""
+    from virtual_sem import VirtualSEM
+    from sim_scheduler import SimulatedClock
+
+    emu = VirtualSEM(port=0, clock=SimulatedClock(), ipc_endpoint=None)
+    prev_level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            emu.restore(load_snapshot(path))
+        elapsed = time.perf_counter() - t0
+    finally:
+        logger.setLevel(prev_level)
+        emu.stop()
+    print(f"Restore: {elapsed / iterations * 1e3:.3f} ms per load+restore of {path}")
+    return elapsed / iterations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VirtualSEM state checkpoints")
+    parser.add_argument(
+        "--from-session",
+        metavar="LOG",
+        help="build a checkpoint from the state a captured session leaves behind",
+    )
+    parser.add_argument("--limit", type=int, help="only the first N commands")
+    parser.add_argument("-o", "--output", default="checkpoint.json")
+    parser.add_argument(
+        "--bench", metavar="SNAPSHOT", help="time loading and restoring a snapshot"
+    )
+    parser.add_argument("--dump", metavar="JOURNAL", help="print a state journal")
+    args = parser.parse_args()
+
+    if args.from_session:
+        build_checkpoint(args.from_session, args.output, args.limit)
+    elif args.bench:
+        bench_restore(args.bench)
+    elif args.dump:
+        for rec in read_journal(args.dump):
+            if "restore" in rec:
+                keys = f" ({len(rec['state'])} keys)" if "state" in rec else ""
+                print(f"{rec['seq']:>6} {rec['t']:.3f} RESTORE {rec['restore']}{keys}")
+            else:
+                print(f"{rec['seq']:>6} {rec['t']:.3f} {rec['k']}={rec['v']}")
+    else:
+        parser.print_help()
@@ -1,5 +1,10 @@
+import argparse
+import itertools
+import select
+import signal
 import socket
 import struct
+import sys
 import threading
 import logging
 import time
@@ -7,6 +12,18 @@ import json
 import os
 from datetime import datetime
 
+from sim_scheduler import EventScheduler, MonotonicClock, SimulatedClock
+from session_log import LogEntry, read_session
+from session_replay import SessionReplay
+from fault_injection import CHECK_CONDITION, SS_ERR, FaultInjector
+from state_journal import (
+    SNAPSHOT_VERSION,
+    JournaledState,
+    StateJournal,
+    load_snapshot,
+    save_snapshot,
+)
+
 try:
     import zmq
 
@@ -14,6 +31,14 @@ try:
 except ImportError:
     HAS_ZMQ = False
 
+try:
+    from sem_physics import CH_HT, SemPhysics, STAGE_AXES
+    from sem_image import SemImageSynth
+
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - [VSEM_EMU] - %(message)s")
 logger = logging.getLogger("VirtualSEM")
@@ -74,16 +99,53 @@ class ProtocolDecoder:
 
         return cmd_name, cmd_level
 
+    def subop_offsets(self):
+        """
+        Map opcode -> CDB offset of its sub-opcode byte.
+
+        For each group, the sub-opcode is the offset present in every match
+        rule that takes the most distinct values (e.g. CDB[1] for the C*
+        reads, CDB[4] for scan/vacuum control). Groups whose rules do not
+        share such a byte map to None.
+        """
+        offsets = {}
+        for opcode_hex, group in self.definitions.get("groups", {}).items():
+            rules = [rule.get("match", {}) for rule in group.get("matches", [])]
+            common = None
+            for match_map in rules:
+                keys = {int(k) for k in match_map} - {0}
+                common = keys if common is None else common & keys
+            best, best_distinct = None, 1
+            for offset in sorted(common or ()):
+                distinct = len({match_map[str(offset)] for match_map in rules})
+                if distinct > best_distinct:
+                    best, best_distinct = offset, distinct
+            offsets[int(opcode_hex, 16)] = best
+        return offsets
+
 
 class SCSILogger:
-    def __init__(self, log_dir="logs"):
+    def __init__(self, log_dir="logs", clock=None, tag=None):
         self.log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), log_dir)
         if not os.path.exists(self.log_dir):
             os.makedirs(self.log_dir)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.filename = os.path.join(self.log_dir, f"vsem_session_{timestamp}.log")
-        self.file = open(self.filename, "w", buffering=1)
+        # Timestamps follow the emulator clock, so simulated sessions log
+        # simulated time.
+        self.clock = clock or MonotonicClock()
+
+        timestamp = self._now().strftime("%Y%m%d_%H%M%S")
+        base = f"vsem_session_{timestamp}" + (f"_{tag}" if tag else "")
+        # Several instances/clients can start a session in the same second;
+        # never truncate another session's log.
+        self.filename = os.path.join(self.log_dir, f"{base}.log")
+        n = 1
+        while True:
+            try:
+                self.file = open(self.filename, "x", buffering=1)
+                break
+            except FileExistsError:
+                n += 1
+                self.filename = os.path.join(self.log_dir, f"{base}_{n}.log")
         self.write_meta("Session Started", level="INFO")
 
     def close(self):
@@ -92,8 +154,11 @@ class SCSILogger:
             self.file.close()
             self.file = None
 
+    def _now(self):
+        return datetime.fromtimestamp(self.clock.time())
+
     def write_meta(self, msg, level="INFO"):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        ts = self._now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
         self.file.write(f"{ts} [{level:<4}] [EVT] {msg}\n")
 
     def log_transaction(
@@ -105,8 +170,11 @@ class SCSILogger:
         cmd_name,
         defined_level="INFO",
         extra_info="",
+        txn=None,
+        start_ns=None,
+        end_ns=None,
     ):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        ts = self._now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
 
         level = defined_level
         if status != 0 and status != 1:
@@ -126,6 +194,10 @@ class SCSILogger:
             data_str = "| DATA: [Empty] "
 
         extra = f" {extra_info}" if extra_info else ""
+        if txn is not None:
+            extra += f" | TXN: {txn} start_ns={start_ns}"
+            if end_ns is not None:
+                extra += f" end_ns={end_ns}"
         line = (
             f"{ts} [{level:<4}] [{direction}] {cmd_name:<20} | CDB: {cdb_str:<20} "
             f"{data_str}-> Status={status}{extra}\n"
@@ -134,23 +206,66 @@ class SCSILogger:
 
 
 class VirtualSEM:
-    def __init__(self, host="127.0.0.1", port=9999):
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=9999,
+        clock=None,
+        ipc_endpoint="tcp://127.0.0.1:5556",
+        name=None,
+        log_dir="logs",
+        physics=None,
+        image_size=(640, 480),
+        replay=None,
+        faults=None,
+        journal=None,
+    ):
+        # port=0 and an ipc_endpoint ending in ":*" bind to free ports; the
+        # actual values are in self.port / self.ipc_endpoint after bind().
         self.host = host
         self.port = port
+        self.name = name
+        self.log_dir = log_dir
         self.running = False
         self.server_socket = None
         self.decoder = ProtocolDecoder()
-        self.session_logger = None
         self.last_status_block = None
 
+        # One SCSILogger per connected client; state-change events are
+        # written to every open session of this instance.
+        self.session_loggers = set()
+        self.session_lock = threading.Lock()
+
+        # --- Timed Transitions ---
+        # Client threads and the scheduler worker both mutate self.state;
+        # all of it happens under state_lock (re-entrant for FA wrappers).
+        # With a SimulatedClock, transitions fire when the client goes idle
+        # instead of after the real delay (see _idle_advance; repeatable
+        # only when driven in-process, not over TCP).
+        self.clock = clock or MonotonicClock()
+        self.state_lock = threading.RLock()
+        self.scheduler = EventScheduler(lock=self.state_lock, clock=self.clock)
+        self.scheduler.start()
+
+        # --- Transactions ---
+        # Ids count up across all clients of this instance; the SRB a
+        # client thread is handling tags the IPC events it publishes
+        # (scheduler transitions carry none). Times are self.clock's.
+        self._txn_ids = itertools.count(1)
+        self._txn = threading.local()
+
         # --- IPC (ZeroMQ) ---
         self.zmq_pub = None
-        if HAS_ZMQ:
+        self.ipc_endpoint = None
+        if not ipc_endpoint:
+            logger.debug("IPC: disabled")
+        elif HAS_ZMQ:
             try:
                 self.zmq_ctx = zmq.Context()
                 self.zmq_pub = self.zmq_ctx.socket(zmq.PUB)
-                self.zmq_pub.bind("tcp://127.0.0.1:5556")
-                logger.info("IPC: ZeroMQ Publisher bound to tcp://127.0.0.1:5556")
+                self.zmq_pub.bind(ipc_endpoint)
+                self.ipc_endpoint = self.zmq_pub.getsockopt_string(zmq.LAST_ENDPOINT)
+                logger.info(f"IPC: ZeroMQ Publisher bound to {self.ipc_endpoint}")
             except Exception as e:
                 logger.error(f"IPC: Failed to bind ZeroMQ: {e}")
                 self.zmq_pub = None
@@ -180,43 +295,130 @@ class VirtualSEM:
             "emission_current": 50,
             "hardware_id": 0x170C,  # Mode 1 ID (6330?)
         }
-
-    def start(self):
+        # Values of the transitions queued by _schedule_state_update, so
+        # pending events can be written into snapshots.
+        self._transitions = {}
+
+        # --- Journal ---
+        # Optional append-only record of every state change (state_journal).
+        # Without one, state stays a plain dict.
+        self.journal = None
+        if journal:
+            self.journal = StateJournal(journal, self.clock)
+            self.state = JournaledState(self.state, self.journal)
+
+        # --- Physics ---
+        # Stage motion, HT ramp and pressure curves (NumPy). Without it the
+        # emulator falls back to instant moves and fixed transition delays.
+        if physics is None:
+            physics = HAS_NUMPY
+        elif physics and not HAS_NUMPY:
+            logger.warning("Physics: NumPy not installed, using fixed delays.")
+            physics = False
+        self.physics = SemPhysics(self.state, self.clock.now()) if physics else None
+        self._stage_moving = False
+        # Set while an HT-on ramp is in progress: only that promotes
+        # ht_status 2 -> 5 when the model reaches the target voltage.
+        self._ht_ramping = False
+        self._status_block_key = None
+        self._status_block = None
+
+        # --- Image Data (ED 82) ---
+        # Frames are synthesised on demand and streamed through successive
+        # ReadSemData transfers; ReqVideoAD restarts at a fresh frame. The
+        # texture is only built on first use.
+        self.image_size = image_size
+        self.image_synth = None
+        self._image_frame = b""
+        self._image_pos = 0
+
+        # --- Replay ---
+        # Optional SessionReplay: recorded responses take precedence, the
+        # synthetic handlers answer anything the session never saw.
+        self.replay = replay
+
+        # --- Fault Injection ---
+        # Optional FaultInjector: per-opcode latency, CHECK CONDITION,
+        # dropped connections and truncated responses (see handle_client).
+        self.faults = faults
+
+        self._subop_offsets = self.decoder.subop_offsets()
+        self._handlers = self._register_handlers()
+
+    def bind(self):
+        """Open the listening socket. Returns the bound (host, port)."""
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(1)
+        self.host, self.port = self.server_socket.getsockname()[:2]
+        self.running = True
+        tag = f" [{self.name}]" if self.name else ""
+        logger.info(f"Virtual SEM{tag} started on {self.host}:{self.port}")
+        if self.clock.simulated:
+            logger.info("Clock: simulated (transitions fire when the client is idle)")
+        logger.info(f"Emulating Hardware ID: 0x{self.state['hardware_id']:04X}")
+        return self.host, self.port
+
+    def start(self):
         try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(1)
-            self.running = True
-            logger.info(f"Virtual SEM started on {self.host}:{self.port}")
-            logger.info(f"Emulating Hardware ID: 0x{self.state['hardware_id']:04X}")
+            if self.server_socket is None:
+                self.bind()
 
             while self.running:
                 conn, addr = self.server_socket.accept()
                 logger.info(f"Client connected: {addr}")
                 client_thread = threading.Thread(
-                    target=self.handle_client, args=(conn,)
+                    target=self.handle_client, args=(conn,), daemon=True
                 )
                 client_thread.start()
 
         except Exception as e:
-            logger.error(f"Server error: {e}")
+            if self.running:
+                logger.error(f"Server error: {e}")
         finally:
             if self.server_socket:
                 self.server_socket.close()
+                self.server_socket = None
+            self.scheduler.stop()
+
+    def stop(self):
+        """Stop accepting clients and release the sockets (from any thread)."""
+        self.running = False
+        if self.server_socket:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.scheduler.stop()
+        if self.faults:
+            logger.info(f"Faults injected: {self.faults.summary()}")
+        if self.journal:
+            self.journal.close()
+        if self.zmq_pub:
+            self.zmq_pub.close(linger=0)
+            self.zmq_pub = None
 
     def handle_client(self, conn):
         session_logger = None
         try:
-            session_logger = SCSILogger()
-            self.session_logger = session_logger
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            session_logger = SCSILogger(self.log_dir, clock=self.clock, tag=self.name)
+            with self.session_lock:
+                self.session_loggers.add(session_logger)
             session_logger.write_meta(f"Client Connected: {conn.getpeername()}")
             while True:
+                if self.clock.simulated:
+                    self._idle_advance(conn)
                 header = self._recvall(conn, 9)
                 if not header or len(header) < 9:
                     break
 
                 cdb_len, direction, xfer_len = struct.unpack("<IBI", header)
+                txn = self._txn.id = next(self._txn_ids)
+                start_ns = self._txn.start_ns = self.clock.time_ns()
+                # Events fire from inside the handlers, before the reply exists.
+                self._txn.end_ns = None
 
                 cdb = self._recvall(conn, cdb_len)
                 if not cdb or len(cdb) != cdb_len:
@@ -249,13 +451,31 @@ class VirtualSEM:
                         cmd_name,
                         defined_level=cmd_level,
                         extra_info=cmd_extra_info,
+                        txn=txn,
+                        start_ns=start_ns,
                     )
 
-                response_data, status = self.process_scsi_command(
-                    cdb, direction=direction, data_out=data_out, xfer_len=xfer_len
-                )
-                scsi_status = 0
-                sense_bytes = b""
+                fault = self.faults.decide(cdb) if self.faults else None
+                if fault:
+                    if fault.delay and not self.clock.simulated:
+                        time.sleep(fault.delay)
+                    if fault.drop:
+                        session_logger.write_meta(
+                            f"FAULT: dropping connection on {cdb[0]:02X}", "WARN"
+                        )
+                        break
+
+                if fault and fault.sense:
+                    response_data = b""
+                    status = SS_ERR
+                    scsi_status = CHECK_CONDITION
+                    sense_bytes = fault.sense
+                else:
+                    response_data, status = self.process_scsi_command(
+                        cdb, direction=direction, data_out=data_out, xfer_len=xfer_len
+                    )
+                    scsi_status = 0
+                    sense_bytes = b""
 
                 res_extra_info = ""
                 if cdb and cdb[0] == 0xD0:
@@ -273,60 +493,233 @@ class VirtualSEM:
                         res_name,
                         defined_level=res_level,
                         extra_info=res_extra_info,
+                        txn=txn,
+                        start_ns=start_ns,
+                        end_ns=self.clock.time_ns(),
                     )
 
                 # Extended response protocol expected by fake_wnaspi32:
                 # status(1), scsi_tgt_status(1), sense_len(1), sense, data_len(4), data
-                resp_header = struct.pack("<BBB", status, scsi_status, len(sense_bytes))
-                conn.sendall(resp_header)
-
-                if len(sense_bytes) > 0:
-                    conn.sendall(sense_bytes)
-
-                conn.sendall(struct.pack("<I", len(response_data)))
-
-                if len(response_data) > 0:
-                    conn.sendall(response_data)
+                # Sent as one write: separate small writes stall on Nagle +
+                # delayed ACK (~40 ms per command).
+                response = (
+                    struct.pack("<BBB", status, scsi_status, len(sense_bytes))
+                    + sense_bytes
+                    + struct.pack("<I", len(response_data))
+                    + response_data
+                )
+                if fault and fault.partial:
+                    cut = int(len(response) * fault.partial)
+                    session_logger.write_meta(
+                        f"FAULT: partial response on {cdb[0]:02X} "
+                        f"({cut}/{len(response)} bytes)",
+                        "WARN",
+                    )
+                    conn.sendall(response[:cut])
+                    break
+                conn.sendall(response)
+                self._txn.id = None
 
         except ConnectionResetError:
             logger.info("Client disconnected")
         except Exception as e:
             logger.error(f"Handler error: {e}")
         finally:
+            self._txn.id = None
             if session_logger:
+                with self.session_lock:
+                    self.session_loggers.discard(session_logger)
                 session_logger.close()
-            self.session_logger = None
             conn.close()
 
     def _publish_state(self, event_type, value):
         """Publish state change to Video Shim via ZMQ"""
         if self.zmq_pub:
             try:
-                msg = json.dumps({"event": event_type, "value": value})
-                self.zmq_pub.send_string(msg)
+                event = {"event": event_type, "value": value}
+                ctx = self._txn
+                txn = getattr(ctx, "id", None)
+                if txn is not None:
+                    event["txn"] = txn
+                    event["start_ns"] = ctx.start_ns
+                    if ctx.end_ns is not None:
+                        event["end_ns"] = ctx.end_ns
+                self.zmq_pub.send_string(json.dumps(event))
             except Exception as e:
                 logger.error(f"IPC: Publish failed: {e}")
 
     def _log_state_change(self, key, value):
         logger.info(f"STATE: {key}={value}")
-        if self.session_logger:
-            self.session_logger.write_meta(f"STATE {key}={value}")
+        with self.session_lock:
+            for session_logger in self.session_loggers:
+                session_logger.write_meta(f"STATE {key}={value}")
 
     def _set_state(self, key, value, publish=False, event_name=None):
-        if self.state.get(key) == value:
-            return
-        self.state[key] = value
-        self._log_state_change(key, value)
-        if publish:
-            self._publish_state(event_name or key.upper(), value)
+        with self.state_lock:
+            # A direct write supersedes any transition still pending for key
+            # (e.g. HT switched off while the 2 s ramp to ready is queued).
+            self.scheduler.cancel(key)
+            if self.state.get(key) == value:
+                return
+            self.state[key] = value
+            self._log_state_change(key, value)
+            if publish:
+                self._publish_state(event_name or key.upper(), value)
 
     def _schedule_state_update(self, key, value, delay_s):
+        # Runs on the scheduler thread with state_lock held.
         def _apply():
             self._set_state(key, value, publish=True)
 
-        timer = threading.Timer(delay_s, _apply)
-        timer.daemon = True
-        timer.start()
+        self._transitions[key] = value
+        self.scheduler.schedule(delay_s, _apply, key=key)
+
+    # --- Checkpoints ---
+    # A snapshot is the state dict, the physics model, the last status block
+    # and every transition still queued (with its remaining delay), so a
+    # restored emulator carries on mid-evac exactly where it was saved.
+
+    def snapshot(self):
+        with self.state_lock:
+            now = self.clock.now()
+            if self.physics:
+                self._physics_sync()
+            pending = [
+                [key, self._transitions[key], max(due - now, 0.0)]
+                for key, due in sorted(self.scheduler.pending_keys().items())
+                if key in self._transitions
+            ]
+            block = self.last_status_block
+            return {
+                "version": SNAPSHOT_VERSION,
+                "time": self.clock.time(),
+                "state": dict(self.state),
+                "pending": pending,
+                "physics": self.physics.snapshot() if self.physics else None,
+                "stage_moving": self._stage_moving,
+                "ht_ramping": self._ht_ramping,
+                "last_status_block": block.hex() if block else None,
+                "journal_seq": self.journal.seq if self.journal else None,
+            }
+
+    def save_snapshot(self, path):
+        save_snapshot(self.snapshot(), path)
+        logger.info(f"Snapshot written to {path}")
+
+    def restore(self, snap, source=None):
+        """Replace the emulator state with a snapshot (dict or file path)."""
+        if isinstance(snap, str):
+            source = source or snap
+            snap = load_snapshot(snap)
+        with self.state_lock:
+            for key in list(self._transitions):
+                self.scheduler.cancel(key)
+            self._transitions.clear()
+            self.scheduler.cancel("physics_tick")
+
+            # In place, so a JournaledState stays one; cleared first so keys
+            # the snapshot does not have don't survive from before.
+            dict.clear(self.state)
+            dict.update(self.state, snap["state"])
+            if self.journal:
+                self.journal.mark_restore(source or "snapshot", self.state)
+            now = self.clock.now()
+            if self.physics:
+                if snap["physics"]:
+                    self.physics.restore(snap["physics"], now)
+                else:
+                    self.physics = SemPhysics(self.state, now)
+                self._stage_moving = snap["stage_moving"]
+                self._ht_ramping = snap.get("ht_ramping", False)
+            block = snap["last_status_block"]
+            self.last_status_block = bytes.fromhex(block) if block else None
+            self._status_block_key = None
+
+            for key, value, remaining in snap["pending"]:
+                self._schedule_state_update(key, value, remaining)
+            if self.physics:
+                self._physics_kick()
+        logger.info(f"Restored state from {source or 'snapshot'}")
+
+    # Real time a client must stay silent before simulated time jumps. Back-
+    # to-back SRBs arrive well inside this; a polling loop's sleep does not.
+    IDLE_WINDOW_S = 0.002
+
+    def _idle_advance(self, conn):
+        """
+        Simulated clock: the client has its last response and has gone quiet
+        (i.e. it is sleeping in a poll loop), so jump straight to the next
+        scheduled transition rather than letting it poll through the delay in
+        real time, so every wait collapses to one poll.
+
+        Over TCP this is a heuristic: "quiet" means IDLE_WINDOW_S of real
+        time, so a client that stalls mid-sequence (a loaded host, a GC
+        pause) can see a transition one command earlier than on another
+        run. Only the in-process path is deterministic: call
+        process_scsi_command() and drive scheduler.advance() /
+        advance_to_next() yourself (as state_journal.build_checkpoint does).
+        """
+        readable, _, _ = select.select([conn], [], [], self.IDLE_WINDOW_S)
+        if not readable:
+            self.scheduler.advance_to_next()
+
+    # --- Physics Ticks ---
+    # Ticks run on the scheduler (state_lock held) only while something is
+    # moving. Each tick is scheduled for the next milestone or TICK_S,
+    # whichever is sooner; a simulated clock goes straight to the
+    # milestone.
+
+    PHYSICS_TICK_S = 0.02
+
+    def _physics_sync(self):
+        """Integrate the model up to now before changing a setpoint."""
+        if self.physics.advance(self.clock.now()):
+            self._apply_stage()
+
+    def _physics_kick(self):
+        eta = self.physics.next_milestone()
+        if eta is None:
+            self.scheduler.cancel("physics_tick")
+            return
+        if not self.clock.simulated:
+            eta = min(eta, self.PHYSICS_TICK_S)
+        self.scheduler.schedule(eta, self._physics_tick, key="physics_tick")
+
+    def _physics_tick(self):
+        # Also called right after a setpoint change, so a target that is
+        # already reached (e.g. HT on at the current voltage) resolves now.
+        self._physics_sync()
+        phys = self.physics
+        if self.state["vacuum_status"] == 2:
+            if phys.vacuum_ready():
+                self._set_state("vacuum_status", 3, publish=True)
+                self._set_state("alc_seq", 2, publish=True)
+            elif phys.vented():
+                self._set_state("vacuum_status", 0, publish=True)
+                self._set_state("alc_seq", 0, publish=True)
+        if self._ht_ramping and self.state["ht_status"] == 2 and phys.ht_ready():
+            self._ht_ramping = False
+            self._set_state("ht_status", 5, publish=True)
+        if phys.stage_settled() and self._stage_moving:
+            self._stage_moving = False
+            self._log_state_change("stage", phys.stage_position())
+        self._physics_kick()
+
+    def _physics_catch_up(self):
+        """Bring the model (and the state it drives) up to now for a read."""
+        if self.physics and not self.physics.settled():
+            self._physics_tick()
+
+    def _accv_readback(self):
+        # While HT is on the gun reports the actual, ramping voltage; with
+        # it off (or no model) the setpoint, as before.
+        if self.physics and self.state["ht_status"]:
+            return int(round(self.physics.pos[CH_HT]))
+        return self.state["accv"]
+
+    def _apply_stage(self):
+        for axis, value in zip(STAGE_AXES, self.physics.stage_position()):
+            self.state[axis] = value
 
     def _recvall(self, conn, length):
         data = bytearray()
@@ -389,14 +782,28 @@ class VirtualSEM:
             self._publish_state("MAG", val)
 
     def _build_status_block(self):
+        self._physics_catch_up()
+        accv = self._accv_readback()
+        key = (
+            self.state.get("ht_mode", 0),
+            self.state.get("ht_status", 0),
+            accv,
+            self.state.get("vacuum_status", 0),
+            self.state.get("vacuum_mode", 0),
+            self.state.get("filament", 0),
+        )
+        if key == self._status_block_key:
+            return self._status_block
         resp = bytearray(128)
         resp[4] = self.state.get("ht_mode", 0)
         resp[6] = self.state.get("ht_status", 0)
-        struct.pack_into("<H", resp, 8, self.state.get("accv", 0))
+        struct.pack_into("<H", resp, 8, accv)
         resp[12] = self.state.get("vacuum_status", 0)
         resp[13] = self.state.get("vacuum_mode", 0)
         struct.pack_into("<H", resp, 14, self.state.get("filament", 0))
-        return bytes(resp)
+        self._status_block_key = key
+        self._status_block = bytes(resp)
+        return self._status_block
 
     def _log_status_diff(self, data):
         if not data:
@@ -413,6 +820,80 @@ class VirtualSEM:
             return f"StatusBlock diff: {' '.join(diffs)}"
         return ""
 
+    # --- Command Dispatch ---
+    # Handlers are keyed by (opcode, sub-opcode). The byte that carries the
+    # sub-opcode is derived per opcode from protocol_definitions.json (see
+    # ProtocolDecoder.subop_offsets); (opcode, None) is the opcode-wide
+    # handler used when there is no more specific entry.
+
+    def _register_handlers(self):
+        return {
+            # Standard SCSI
+            (0x12, None): self._cmd_inquiry,
+            # [0xCC] Identification
+            (0xCC, 0x81): self._cmd_get_hardware_id,
+            (0xCC, 0x80): self._cmd_get_status_size,
+            # [0xC4] Vacuum Status
+            (0xC4, 0x01): self._cmd_get_vacuum_status,
+            (0xC4, 0x00): self._cmd_get_vacuum_mode,
+            (0xC4, 0x03): self._cmd_get_als,
+            (0xC4, 0x04): self._cmd_get_alc_seq,
+            # [0xC5] Pressure
+            (0xC5, 0x09): self._cmd_get_valve_pos,
+            # [0xC6] Gun Status
+            (0xC6, 0x10): self._cmd_get_ht_status,
+            (0xC6, 0x11): self._cmd_get_accv,
+            (0xC6, 0x12): self._cmd_get_filament,
+            (0xC6, 0x15): self._cmd_get_emission,
+            # [0xC7] Gun Detail (LaB6)
+            (0xC7, None): self._cmd_get_lbg_status,
+            # [0xCE] Extended Status
+            (0xCE, None): self._cmd_get_ext_status,
+            # [0x01] Vacuum Control (sub-opcode = CDB[4])
+            (0x01, 0x40): self._cmd_start_evac_m0,
+            (0x01, 0x42): self._cmd_start_evac_m0,
+            (0x01, 0x43): self._cmd_start_evac_m0,
+            (0x01, 0x45): self._cmd_start_alc_evac_m0,
+            (0x01, 0x41): self._cmd_start_vent_m0,
+            (0x01, 0x46): self._cmd_start_alc_vent_m0,
+            (0x01, 0x06): self._cmd_vacuum_m1,
+            # [0x02] Gun Control (sub-opcode = CDB[1])
+            (0x02, 0x01): self._cmd_gun_set,
+            (0x02, None): self._cmd_gun_query,
+            # [0x03] Lens Control (Mag)
+            (0x03, None): self._cmd_lens_set,
+            # [0x00] Scan Control (sub-opcode = CDB[4])
+            (0x00, 0x00): self._cmd_set_scan_speed,
+            (0x00, 0x09): self._cmd_scan_start_stop,
+            # [0x04] Video Request
+            (0x04, 0x1E): self._cmd_req_video,
+            # [0xC2] Legacy Set
+            (0xC2, 0x00): self._cmd_legacy_set,
+            (0xC2, 0x01): self._cmd_legacy_set,
+            (0xC2, 0x02): self._cmd_legacy_set,
+            (0xC2, None): self._cmd_ack,
+            # [0xC3] Legacy Read
+            (0xC3, None): self._cmd_get_legacy_status,
+            # [0xC8] Lens Read
+            (0xC8, 0x50): self._cmd_get_mag,
+            (0xC8, 0x38): self._cmd_get_wd,
+            (0xC8, None): self._cmd_get_lens_value,
+            # [0xCB] Stage Read
+            (0xCB, None): self._cmd_get_stage_pos,
+            # [0x09] Stage Control (sub-opcode = CDB[5])
+            (0x09, 0x06): self._cmd_stage_move_abs,
+            # [0xD0] Status Block
+            (0xD0, None): self._cmd_get_status_block,
+            # [0xDE] FIS Read
+            (0xDE, None): self._cmd_get_fis,
+            # [0xFA] Wrapper
+            (0xFA, None): self._cmd_fa_wrapper,
+            # [0xE0] Write LUT
+            (0xE0, None): self._cmd_write_lut,
+            # [0xED] Large Data Read
+            (0xED, None): self._cmd_read_sem_data,
+        }
+
     def process_scsi_command(self, cdb, direction=0, data_out=None, xfer_len=0):
         """
         Parses the raw CDB bytes and returns (response_bytes, status_code).
@@ -422,419 +903,652 @@ class VirtualSEM:
             return b"", 0
 
         opcode = cdb[0]
-        cdb_len = len(cdb)
-        group = opcode  # In standard SCSI, opcode defines group, but here it's custom.
-
-        hex_cdb = " ".join([f"{b:02X}" for b in cdb])
-        # logger.info(f"CDB: [{hex_cdb}]")
+        hit = self.replay.lookup(cdb, data_out, self.clock.now()) if self.replay else None
+        response, status = self._dispatch(cdb, direction, data_out, xfer_len)
+        if hit is not None:
+            # The handler still ran for its state changes and IPC events, so
+            # status reads and later misses agree with what was replayed; only
+            # its reply is swapped for the recorded one (and any delay slept
+            # here, outside the state lock).
+            response, status = self._serve_replay(hit, xfer_len)
 
-        response = b""
-        status = 1  # SS_COMP
-
-        # --- Standard SCSI Commands ---
-        if opcode == 0x00:  # SC_HA_INQUIRY / TEST UNIT READY
-            # sem_InitCom (FUN_10022bb9) sends opcode 0x00?
-            # Actually, standard SCSI Inquiry is 0x12.
-            # But the protocol analysis showed [00 01 00 04 ...] for Scan Speed.
-            # Let's check the Group ID.
-            # sem_InitCom sets CDB[0] = 0x12 (Standard SCSI INQUIRY)?
-            pass
-
-        if opcode == 0x12:  # INQUIRY
-            # Standard SCSI Inquiry response
-            # Format:
-            # Byte 0: Peripheral Device Type (0x03 = Processor)
-            # Byte 1: RMB (Removable)
-            # Byte 2: Version
-            # Byte 3: Response Data Format
-            # Byte 4: Additional Length (n-4)
-            # Byte 8-15: Vendor ID (ASCII) -> "JEOL    "
-            # Byte 16-31: Product ID (ASCII)
-
-            # sem_InitCom checks memcmp(buffer, "JEOL", 4) at offset 8 (Standard Vendor ID location)
-
-            # Construct standard Inquiry data (36 bytes minimum)
-            # Type 0x03 (Processor), Removable 0
-            resp = bytearray(36)
-            resp[0] = 0x03
-            resp[4] = 31  # Additional length
-
-            # Vendor ID "JEOL    " (8 bytes)
-            vendor = b"JEOL    "
-            resp[8:16] = vendor
-
-            # Product ID "SEM             " (16 bytes)
-            product = b"SEM             "
-            resp[16:32] = product
-
-            # Revision
-            rev = b"1.0 "
-            resp[32:36] = rev
-
-            response = self._build_response(bytes(resp), xfer_len, fallback_len=36)
-            logger.info(f"CMD: INQUIRY -> {response}")
-            return response, 1
+        # For known pure write commands, do not return payload bytes.
+        # Some legacy opcodes (e.g. C0/C3 variants) behave like write+read,
+        # so keep their synthesized response paths intact.
+        if direction == 2 and opcode in {0xC2, 0xE0, 0xFA}:
+            return b"", status
 
-        # --- [0xCC] Identification ---
-        if opcode == 0xCC and cdb_len > 1:
-            if cdb[1] == 0x81:  # Get Hardware ID
-                response = struct.pack("<Hxx", self.state["hardware_id"])
-                logger.info(f"CMD: GetHardwareID -> {self.state['hardware_id']:04X}")
-            elif cdb[1] == 0x80:  # Get Status Size
-                response = struct.pack("<HH", 0x0002, 0x8000)
-                logger.info("CMD: GetStatusSize -> 0x0002 0x8000")
-            response = self._build_response(response, xfer_len, fallback_len=4)
-
-        # --- [0xC4] Vacuum Status ---
-        elif opcode == 0xC4 and cdb_len > 1:
-            if cdb[1] == 0x01:  # Get Vacuum Status
-                response = bytes([0x00, 0x01, 0x00, self.state["vacuum_status"] & 0xFF])
-                logger.info(f"CMD: GetVacuumStatus -> {self.state['vacuum_status']}")
-            elif cdb[1] == 0x00:  # Get Vacuum Mode
-                response = struct.pack("<Hxx", self.state["vacuum_mode"])
-                logger.info(f"CMD: GetVacuumMode -> {self.state['vacuum_mode']}")
-            elif cdb[1] == 0x03:  # Get ALS
-                response = b"\x00\x00\x00\x00"
-                logger.info("CMD: GetALS -> 0")
-            elif cdb[1] == 0x04:  # Get ALC Seq
-                response = struct.pack("<Hxx", self.state["alc_seq"])
-                logger.info(f"CMD: GetAlcSeq -> {self.state['alc_seq']}")
-            response = self._build_response(response, xfer_len, fallback_len=4)
-
-        # --- [0xC6] Gun Status ---
-        elif opcode == 0xC6 and cdb_len > 1:
-            if cdb[1] == 0x10:  # Get HT Status
-                response = struct.pack("<Hxx", self.state["ht_status"])
-                logger.info(f"CMD: GetHTStatus -> {self.state['ht_status']}")
-            elif cdb[1] == 0x11:  # Get Accv
-                response = struct.pack("<Hxx", self.state["accv"])
-                logger.info(f"CMD: GetAccv -> {self.state['accv']}")
-            elif cdb[1] == 0x12:  # Get Filament
-                response = struct.pack("<Hxx", self.state["filament"])
-                logger.info("CMD: GetFilament")
-            elif cdb[1] == 0x15:  # Get Emission
-                response = struct.pack("<Hxx", self.state["emission_current"])
-                logger.info("CMD: GetEmission")
-            response = self._build_response(response, xfer_len, fallback_len=4)
-
-        # --- [0xC7] Gun Detail (LaB6) ---
-        elif opcode == 0xC7 and cdb_len > 1:
-            if cdb[1] == 0x00:  # Get Lbg Status
-                payload = bytearray(18)
-                struct.pack_into("<H", payload, 0, self.state["lbg_status"])
-                response = bytes(payload)
-                logger.info("CMD: GetLbgStatus (18b)")
-            response = self._build_response(response, xfer_len, fallback_len=18)
-
-        # --- [0xCE] Extended Status ---
-        elif opcode == 0xCE and cdb_len > 1:
-            # Most seem to ask for 4 bytes based on log
-            response = b"\x00\x00\x00\x00"
-            name = "UnknownExt"
-            if cdb[1] == 0x02:
-                name = "GetEsitfStatus"
-            elif cdb[1] == 0x08:
-                name = "GetPcdStatus"
-            elif cdb[1] == 0x0B:
-                name = "GetBcxStatus"
-            logger.info(f"CMD: {name} -> 0")
-            response = self._build_response(response, xfer_len, fallback_len=4)
-
-        # --- [0xC5] Pressure ---
-        elif opcode == 0xC5 and cdb_len > 1:
-            if cdb[1] == 0x09:  # Get Valve Pos
-                response = struct.pack("<Hxx", 1)  # Open?
-                logger.info("CMD: GetValvePos")
-            response = self._build_response(response, xfer_len, fallback_len=4)
-
-        # --- [0x01] Vacuum Control ---
-        elif opcode == 0x01:
-            if cdb_len > 5 and cdb[1] == 0x01 and cdb[4] in {0x40, 0x42, 0x43}:
-                logger.info("CMD: StartEvac (Mode0)")
-                self._set_state(
-                    "vacuum_status", 2, publish=True, event_name="VAC_STATUS"
-                )
-                self._set_state("alc_seq", 1, publish=False)
-                self._schedule_state_update("vacuum_status", 3, 5.0)
-                self._schedule_state_update("alc_seq", 2, 5.0)
-                return b"", status
-            if cdb_len > 5 and cdb[1] == 0x01 and cdb[4] == 0x45:
-                logger.info("CMD: StartAlcEvac (Mode0)")
-                self._set_state("alc_seq", 1, publish=False)
-                self._schedule_state_update("alc_seq", 2, 5.0)
-                return b"", status
-            if cdb_len > 5 and cdb[1] == 0x01 and cdb[4] in {0x41, 0x46}:
-                if cdb[4] == 0x46:
-                    logger.info("CMD: StartAlcVent (Mode0)")
-                    self._set_state("alc_seq", 1, publish=False)
-                    self._schedule_state_update("alc_seq", 0, 3.0)
-                    return b"", status
-                logger.info("CMD: StartVent (Mode0)")
-                self._set_state(
-                    "vacuum_status", 2, publish=True, event_name="VAC_STATUS"
-                )
-                self._set_state("alc_seq", 1, publish=False)
-                self._schedule_state_update("vacuum_status", 0, 3.0)
-                self._schedule_state_update("alc_seq", 0, 3.0)
-                return b"", status
-            # Mode 1: [01 01 00 06 40 44 04 01 00 val] (Set Vacuum Mode)
-            if (
-                cdb_len > 9
-                and cdb[1] == 0x01
-                and cdb[4] == 0x06
-                and cdb[5] == 0x40
-                and cdb[6] == 0x44
-            ):
-                val = cdb[9]
-                self.state["vacuum_mode"] = val
-                logger.info(f"CMD: SetVacuumMode -> {val}")
-                self._publish_state("VAC_MODE", val)
-                return b"", status
-
-            # Mode 1: [01 01 00 06 40 38 00 01 00 01] (Evac)
-            # Mode 1: [01 01 00 06 40 38 00 01 00 00] (Vent)
-            if (
-                cdb_len > 9
-                and cdb[1] == 0x01
-                and cdb[4] == 0x06
-                and cdb[5] == 0x40
-                and cdb[6] == 0x38
-            ):
-                action = cdb[9]
-                if action == 1:
-                    logger.info("CMD: StartEvac")
-                    self._set_state(
-                        "vacuum_status", 2, publish=True, event_name="VAC_STATUS"
-                    )
-                    self._set_state("alc_seq", 1, publish=False)
-                    self._schedule_state_update("vacuum_status", 3, 5.0)
-                    self._schedule_state_update("alc_seq", 2, 5.0)
-                elif action == 2:
-                    logger.info("CMD: StartAlcEvac")
-                    self._set_state("alc_seq", 1, publish=False)
-                    self._schedule_state_update("alc_seq", 2, 5.0)
-                    return b"", status
-                elif action == 3:
-                    logger.info("CMD: StartAlcVent")
-                    self._set_state("alc_seq", 1, publish=False)
-                    self._schedule_state_update("alc_seq", 0, 3.0)
-                    return b"", status
-                else:
-                    logger.info("CMD: StartVent")
-                    self._set_state(
-                        "vacuum_status", 2, publish=True, event_name="VAC_STATUS"
-                    )
-                    self._set_state("alc_seq", 1, publish=False)
-                    self._schedule_state_update("vacuum_status", 0, 3.0)
-                    self._schedule_state_update("alc_seq", 0, 3.0)
-                return b"", status
-
-        # --- [0x02] Gun Control ---
-        elif opcode == 0x02:
-            # Mode 1: [02 01 00 07 40 02 00 02 00 30 state]
-            if cdb_len > 9 and cdb[1] == 0x01 and cdb[4] == 0x07:  # HT Set
-                new_state = cdb[9]
-                if new_state == 1 and self.state["vacuum_status"] != 3:
-                    logger.warning("INTERLOCK: HT denied, vacuum not ready")
-                    return b"", 0
-                self._set_state(
-                    "ht_status", new_state, publish=True, event_name="HT_STATUS"
-                )
-                self._set_state("ht_mode", 1 if new_state else 0)
-                logger.info(f"CMD: SetHT -> {new_state}")
-                if new_state:
-                    self._set_state(
-                        "ht_status", 2, publish=True, event_name="HT_STATUS"
-                    )
-                    self._schedule_state_update("ht_status", 5, 2.0)
-
-            # Mode 1: [02 01 00 08 40 02 01 03 00 00 val 00] (Accv)
-            elif cdb_len > 10 and cdb[1] == 0x01 and cdb[4] == 0x08:
-                sub_cmd = cdb[8]
-                val = struct.unpack("<H", cdb[9:11])[0]
-                if sub_cmd == 0x00:
-                    self._set_state("accv", val, publish=True, event_name="ACCV")
-                    logger.info(f"CMD: SetAccv -> {val}")
-                elif sub_cmd == 0x14:  # Filament
-                    self._set_state(
-                        "filament", val, publish=True, event_name="FILAMENT"
-                    )
-                    logger.info(f"CMD: SetFilament -> {val}")
+        return response, status
 
-            # Query / short command: [02 00 00 00 xx 00]
+    def _dispatch(self, cdb, direction, data_out, xfer_len):
+        opcode = cdb[0]
+        handler = None
+        sub_offset = self._subop_offsets.get(opcode)
+        if sub_offset is not None and sub_offset < len(cdb):
+            handler = self._handlers.get((opcode, cdb[sub_offset]))
+        if handler is None:
+            handler = self._handlers.get((opcode, None), self._cmd_default)
+
+        with self.state_lock:
+            return handler(cdb, direction, data_out, xfer_len)
+
+    def _serve_replay(self, hit, xfer_len):
+        data, status, delay = hit
+        if delay and not self.clock.simulated:
+            time.sleep(delay)
+        # Logged data is capped at 16 bytes; pad out to the transfer length.
+        return self._build_response(data, xfer_len, fallback_len=len(data)), status
+
+    # --- Standard SCSI Commands ---
+
+    def _cmd_inquiry(self, cdb, direction, data_out, xfer_len):
+        # Standard SCSI Inquiry response
+        # Format:
+        # Byte 0: Peripheral Device Type (0x03 = Processor)
+        # Byte 1: RMB (Removable)
+        # Byte 2: Version
+        # Byte 3: Response Data Format
+        # Byte 4: Additional Length (n-4)
+        # Byte 8-15: Vendor ID (ASCII) -> "JEOL    "
+        # Byte 16-31: Product ID (ASCII)
+
+        # sem_InitCom checks memcmp(buffer, "JEOL", 4) at offset 8 (Standard Vendor ID location)
+
+        # Construct standard Inquiry data (36 bytes minimum)
+        # Type 0x03 (Processor), Removable 0
+        resp = bytearray(36)
+        resp[0] = 0x03
+        resp[4] = 31  # Additional length
+
+        # Vendor ID "JEOL    " (8 bytes)
+        vendor = b"JEOL    "
+        resp[8:16] = vendor
+
+        # Product ID "SEM             " (16 bytes)
+        product = b"SEM             "
+        resp[16:32] = product
+
+        # Revision
+        rev = b"1.0 "
+        resp[32:36] = rev
+
+        response = self._build_response(bytes(resp), xfer_len, fallback_len=36)
+        logger.info(f"CMD: INQUIRY -> {response}")
+        return response, 1
+
+    # --- [0xCC] Identification ---
+
+    def _cmd_get_hardware_id(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", self.state["hardware_id"])
+        logger.info(f"CMD: GetHardwareID -> {self.state['hardware_id']:04X}")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_status_size(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<HH", 0x0002, 0x8000)
+        logger.info("CMD: GetStatusSize -> 0x0002 0x8000")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    # --- [0xC4] Vacuum Status ---
+
+    def _cmd_get_vacuum_status(self, cdb, direction, data_out, xfer_len):
+        self._physics_catch_up()
+        response = bytes([0x00, 0x01, 0x00, self.state["vacuum_status"] & 0xFF])
+        logger.info(f"CMD: GetVacuumStatus -> {self.state['vacuum_status']}")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_vacuum_mode(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", self.state["vacuum_mode"])
+        logger.info(f"CMD: GetVacuumMode -> {self.state['vacuum_mode']}")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_als(self, cdb, direction, data_out, xfer_len):
+        logger.info("CMD: GetALS -> 0")
+        return self._build_response(b"\x00\x00\x00\x00", xfer_len, fallback_len=4), 1
+
+    def _cmd_get_alc_seq(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", self.state["alc_seq"])
+        logger.info(f"CMD: GetAlcSeq -> {self.state['alc_seq']}")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    # --- [0xC5] Pressure ---
+
+    def _cmd_get_valve_pos(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", 1)  # Open?
+        logger.info("CMD: GetValvePos")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    # --- [0xC6] Gun Status ---
+
+    def _cmd_get_ht_status(self, cdb, direction, data_out, xfer_len):
+        self._physics_catch_up()
+        response = struct.pack("<Hxx", self.state["ht_status"])
+        logger.info(f"CMD: GetHTStatus -> {self.state['ht_status']}")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_accv(self, cdb, direction, data_out, xfer_len):
+        self._physics_catch_up()
+        accv = self._accv_readback()
+        response = struct.pack("<Hxx", accv)
+        logger.info(f"CMD: GetAccv -> {accv}")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_filament(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", self.state["filament"])
+        logger.info("CMD: GetFilament")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_emission(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", self.state["emission_current"])
+        logger.info("CMD: GetEmission")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    # --- [0xC7] Gun Detail (LaB6) ---
+
+    def _cmd_get_lbg_status(self, cdb, direction, data_out, xfer_len):
+        response = b""
+        if len(cdb) > 1 and cdb[1] == 0x00:  # Get Lbg Status
+            payload = bytearray(18)
+            struct.pack_into("<H", payload, 0, self.state["lbg_status"])
+            response = bytes(payload)
+            logger.info("CMD: GetLbgStatus (18b)")
+        return self._build_response(response, xfer_len, fallback_len=18), 1
+
+    # --- [0xCE] Extended Status ---
+
+    def _cmd_get_ext_status(self, cdb, direction, data_out, xfer_len):
+        # Most seem to ask for 4 bytes based on log
+        sub = cdb[1] if len(cdb) > 1 else None
+        name = "UnknownExt"
+        if sub == 0x02:
+            name = "GetEsitfStatus"
+        elif sub == 0x08:
+            name = "GetPcdStatus"
+        elif sub == 0x0B:
+            name = "GetBcxStatus"
+        logger.info(f"CMD: {name} -> 0")
+        return self._build_response(b"\x00\x00\x00\x00", xfer_len, fallback_len=4), 1
+
+    # --- [0x01] Vacuum Control ---
+
+    def _start_evac(self):
+        self._set_state("vacuum_status", 2, publish=True, event_name="VAC_STATUS")
+        self._set_state("alc_seq", 1, publish=False)
+        if self.physics:
+            self._physics_sync()
+            self.physics.evacuate()
+            self._physics_tick()
+            return
+        self._schedule_state_update("vacuum_status", 3, 5.0)
+        self._schedule_state_update("alc_seq", 2, 5.0)
+
+    def _start_vent(self):
+        self._set_state("vacuum_status", 2, publish=True, event_name="VAC_STATUS")
+        self._set_state("alc_seq", 1, publish=False)
+        if self.physics:
+            self._physics_sync()
+            self.physics.vent()
+            self._physics_tick()
+            return
+        self._schedule_state_update("vacuum_status", 0, 3.0)
+        self._schedule_state_update("alc_seq", 0, 3.0)
+
+    def _start_alc_evac(self):
+        self._set_state("alc_seq", 1, publish=False)
+        self._schedule_state_update("alc_seq", 2, 5.0)
+
+    def _start_alc_vent(self):
+        self._set_state("alc_seq", 1, publish=False)
+        self._schedule_state_update("alc_seq", 0, 3.0)
+
+    def _cmd_start_evac_m0(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) > 5 and cdb[1] == 0x01:
+            logger.info("CMD: StartEvac (Mode0)")
+            self._start_evac()
+        return b"", 1
+
+    def _cmd_start_alc_evac_m0(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) > 5 and cdb[1] == 0x01:
+            logger.info("CMD: StartAlcEvac (Mode0)")
+            self._start_alc_evac()
+        return b"", 1
+
+    def _cmd_start_vent_m0(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) > 5 and cdb[1] == 0x01:
+            logger.info("CMD: StartVent (Mode0)")
+            self._start_vent()
+        return b"", 1
+
+    def _cmd_start_alc_vent_m0(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) > 5 and cdb[1] == 0x01:
+            logger.info("CMD: StartAlcVent (Mode0)")
+            self._start_alc_vent()
+        return b"", 1
+
+    def _cmd_vacuum_m1(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) <= 9 or cdb[1] != 0x01 or cdb[5] != 0x40:
+            return b"", 1
+
+        # Mode 1: [01 01 00 06 40 44 04 01 00 val] (Set Vacuum Mode)
+        if cdb[6] == 0x44:
+            val = cdb[9]
+            self.state["vacuum_mode"] = val
+            logger.info(f"CMD: SetVacuumMode -> {val}")
+            self._publish_state("VAC_MODE", val)
+
+        # Mode 1: [01 01 00 06 40 38 00 01 00 01] (Evac)
+        # Mode 1: [01 01 00 06 40 38 00 01 00 00] (Vent)
+        elif cdb[6] == 0x38:
+            action = cdb[9]
+            if action == 1:
+                logger.info("CMD: StartEvac")
+                self._start_evac()
+            elif action == 2:
+                logger.info("CMD: StartAlcEvac")
+                self._start_alc_evac()
+            elif action == 3:
+                logger.info("CMD: StartAlcVent")
+                self._start_alc_vent()
             else:
-                # Return current gun/HT status as acknowledgement
-                # Return 4 bytes to be safe, value=ht
-                ht = self.state.get("ht_status", 0)
-                # Maybe it expects 2 bytes? Or 4?
-                # Using 4 bytes (int32) or 2 bytes + padding
-                response = self._build_response(
-                    struct.pack("<I", ht), xfer_len, fallback_len=4
-                )
-                logger.info(f"CMD: GunQuery (cdb1={cdb[1]:02x}) -> ht={ht} (4 bytes)")
-
-        # --- [0x03] Lens Control (Mag) ---
-        elif opcode == 0x03:
-            # SetMag: { "0": "0x03", "1": "0x01", "8": "0x10" }
-            if cdb_len > 10 and cdb[1] == 0x01 and cdb[8] == 0x10:
-                # Mag value location guess: bytes 9-10
-                if len(cdb) >= 11:
-                    mag = struct.unpack("<H", cdb[9:11])[0]
-                    self._set_state("mag_index", mag, publish=True, event_name="MAG")
-                    logger.info(f"CMD: SetMag -> {mag}")
-
-        # --- [0x00] Scan Control ---
-        elif opcode == 0x00:
-            if cdb_len > 7 and cdb[1] == 0x01 and cdb[4] == 0x00:  # Set Speed
-                # [00 01 00 04 00 00 high low]
-                speed = struct.unpack(">H", cdb[6:8])[
-                    0
-                ]  # Big Endian in CDB? Need to check protocol.
-                # Protocol doc says: [00 01 00 04 00 00 high low].
-                # Let's assume input is Big Endian for 16-bit values in CDBs usually?
-                # Actually earlier analysis: "speed 0 -> 0x0000".
-                self.state["scan_speed"] = speed
-                logger.info(f"CMD: SetScanSpeed -> {speed}")
-                self._set_state("scan_speed", speed, publish=True, event_name="SPEED")
-            elif cdb_len > 5 and cdb[4] == 0x09:  # Start/Stop
-                is_start = cdb[5]
-                logger.info(f"CMD: Scan {'Start' if is_start else 'Stop'}")
-                self._set_state(
-                    "scan_status",
-                    1 if is_start else 0,
-                    publish=True,
-                    event_name="SCAN_STATUS",
-                )
+                logger.info("CMD: StartVent")
+                self._start_vent()
+        return b"", 1
 
-        # --- [0x04] Video Request ---
-        elif opcode == 0x04:
-            if cdb_len > 5 and cdb[4] == 0x1E and cdb[5] == 0x07:  # Req Video
-                # Logic: In real hardware, this triggers DMA.
-                # For Emulator, we might just acknowledge.
-                # The DLL expects data later via ReadData? Or via a specific "Get Image" command?
-                # Actually, video usually comes via a separate high-speed path or specific READ commands.
-                # We will just say OK for now.
-                logger.info("CMD: ReqVideoAD")
-
-        # --- [0xC2] Legacy Set ---
-        elif opcode == 0xC2:
-            if cdb_len > 1 and cdb[1] == 0x00:  # SetScanSpeed (Legacy)
-                logger.info("CMD: SetScanSpeed (Legacy)")
-            elif cdb_len > 1 and cdb[1] == 0x01:  # SetFreeze (Legacy)
-                logger.info("CMD: SetFreeze (Legacy)")
-            elif cdb_len > 1 and cdb[1] == 0x02:  # SetArea (Legacy)
-                logger.info("CMD: SetArea (Legacy)")
-
-        # --- [0xC3] Legacy Read ---
-        elif opcode == 0xC3:
-            alloc_len = self._alloc_len_from_cdb(cdb)
-            # Revert 0x01 forcing.
-            # Try mapping Vacuum Status to byte 3?
-            sim_status = bytearray(max(alloc_len, 4))
-            # sim_status[0] = 0x00
-            
-            # Map states to see if any triggers "Connected"
-            if self.state.get("ht_status", 0):
-                sim_status[1] |= 0x01
-            if self.state.get("vacuum_status", 0) == 3: # Ready
-                sim_status[2] |= 0x01 # Guessing byte 2? or 3?
-                # Let's try reflecting it in byte 3 (which aligns with 0xC4 01 return?)
-                sim_status[3] = self.state["vacuum_status"]
-            
-            response = self._build_response(sim_status, xfer_len, fallback_len=alloc_len)
-            logger.info(f"CMD: GetLegacyStatus -> {response.hex()}")
-
-        # --- [0xC8] Lens Read ---
-        elif opcode == 0xC8 and cdb_len > 1:
-            if cdb[1] == 0x50:  # Get Mag
-                response = struct.pack("<Hxx", self.state["mag_index"])
-                logger.info("CMD: GetMag")
-            elif cdb[1] == 0x38:  # Get WD
-                response = struct.pack("<Hxx", 0)
-                logger.info("CMD: GetWD")
-            else:
-                response = b"\x00\x00\x00\x00"
-                logger.info("CMD: GetLensValue")
-            response = self._build_response(response, xfer_len, fallback_len=4)
-
-        # --- [0xCB] Stage Read ---
-        elif opcode == 0xCB:
-            payload = struct.pack(
-                "<5i",
-                self.state["stage_x"],
-                self.state["stage_y"],
-                self.state["stage_z"],
-                self.state["stage_r"],
-                self.state["stage_t"],
+    # --- [0x02] Gun Control ---
+
+    def _cmd_gun_set(self, cdb, direction, data_out, xfer_len):
+        cdb_len = len(cdb)
+        # Mode 1: [02 01 00 07 40 02 00 02 00 30 state]
+        if cdb_len > 9 and cdb[4] == 0x07:  # HT Set
+            new_state = cdb[9]
+            if new_state == 1 and self.state["vacuum_status"] != 3:
+                logger.warning("INTERLOCK: HT denied, vacuum not ready")
+                return b"", 0
+            self._set_state("ht_status", new_state, publish=True, event_name="HT_STATUS")
+            self._set_state("ht_mode", 1 if new_state else 0)
+            logger.info(f"CMD: SetHT -> {new_state}")
+            if new_state:
+                self._set_state("ht_status", 2, publish=True, event_name="HT_STATUS")
+            if self.physics:
+                self._physics_sync()
+                self.physics.ramp_ht(self.state["accv"] if new_state else 0)
+                self._ht_ramping = bool(new_state)
+                self._physics_tick()
+            elif new_state:
+                self._schedule_state_update("ht_status", 5, 2.0)
+            return b"", 1
+
+        # Mode 1: [02 01 00 08 40 02 01 03 00 00 val 00] (Accv)
+        if cdb_len > 10 and cdb[4] == 0x08:
+            sub_cmd = cdb[8]
+            val = struct.unpack("<H", cdb[9:11])[0]
+            if sub_cmd == 0x00:
+                self._set_state("accv", val, publish=True, event_name="ACCV")
+                logger.info(f"CMD: SetAccv -> {val}")
+                if self.physics and self.state["ht_status"]:
+                    self._physics_sync()
+                    self.physics.ramp_ht(val)
+                    self._physics_tick()
+            elif sub_cmd == 0x14:  # Filament
+                self._set_state("filament", val, publish=True, event_name="FILAMENT")
+                logger.info(f"CMD: SetFilament -> {val}")
+            return b"", 1
+
+        return self._cmd_gun_query(cdb, direction, data_out, xfer_len)
+
+    def _cmd_gun_query(self, cdb, direction, data_out, xfer_len):
+        # Query / short command: [02 00 00 00 xx 00]
+        # Return current gun/HT status as acknowledgement
+        # Return 4 bytes to be safe, value=ht
+        ht = self.state.get("ht_status", 0)
+        # Maybe it expects 2 bytes? Or 4?
+        # Using 4 bytes (int32) or 2 bytes + padding
+        response = self._build_response(struct.pack("<I", ht), xfer_len, fallback_len=4)
+        sub = cdb[1] if len(cdb) > 1 else 0
+        logger.info(f"CMD: GunQuery (cdb1={sub:02x}) -> ht={ht} (4 bytes)")
+        return response, 1
+
+    # --- [0x03] Lens Control (Mag) ---
+
+    def _cmd_lens_set(self, cdb, direction, data_out, xfer_len):
+        # SetMag: { "0": "0x03", "1": "0x01", "8": "0x10" }
+        if len(cdb) > 10 and cdb[1] == 0x01 and cdb[8] == 0x10:
+            # Mag value location guess: bytes 9-10
+            mag = struct.unpack("<H", cdb[9:11])[0]
+            self._set_state("mag_index", mag, publish=True, event_name="MAG")
+            logger.info(f"CMD: SetMag -> {mag}")
+        return b"", 1
+
+    # --- [0x00] Scan Control ---
+
+    def _cmd_set_scan_speed(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) > 7 and cdb[1] == 0x01:
+            # [00 01 00 04 00 00 high low]
+            # Protocol doc says: [00 01 00 04 00 00 high low].
+            # Let's assume input is Big Endian for 16-bit values in CDBs usually?
+            # Actually earlier analysis: "speed 0 -> 0x0000".
+            speed = struct.unpack(">H", cdb[6:8])[0]
+            self.state["scan_speed"] = speed
+            logger.info(f"CMD: SetScanSpeed -> {speed}")
+            self._set_state("scan_speed", speed, publish=True, event_name="SPEED")
+        return b"", 1
+
+    def _cmd_scan_start_stop(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) > 5:
+            is_start = cdb[5]
+            logger.info(f"CMD: Scan {'Start' if is_start else 'Stop'}")
+            self._set_state(
+                "scan_status",
+                1 if is_start else 0,
+                publish=True,
+                event_name="SCAN_STATUS",
             )
+        return b"", 1
+
+    # --- [0x04] Video Request ---
+
+    def _cmd_req_video(self, cdb, direction, data_out, xfer_len):
+        if len(cdb) > 5 and cdb[5] == 0x07:  # Req Video
+            # In real hardware ReqVideo arms the A/D for a frame that the DLL
+            # then pulls with ED 82 ReadSemData; restart the stream on a new
+            # frame. StopVideo (CDB[6] == 0x01) shares the sub-opcode.
+            if cdb[1] == 0x01 and (len(cdb) <= 6 or cdb[6] != 0x01):
+                self._image_frame = b""
+                self._image_pos = 0
+            logger.info("CMD: ReqVideoAD")
+        return b"", 1
+
+    # --- [0xC2] Legacy Set ---
+
+    def _cmd_legacy_set(self, cdb, direction, data_out, xfer_len):
+        name = {0x00: "SetScanSpeed", 0x01: "SetFreeze", 0x02: "SetArea"}[cdb[1]]
+        logger.info(f"CMD: {name} (Legacy)")
+        return b"", 1
+
+    def _cmd_ack(self, cdb, direction, data_out, xfer_len):
+        return b"", 1
+
+    # --- [0xC3] Legacy Read ---
+
+    def _cmd_get_legacy_status(self, cdb, direction, data_out, xfer_len):
+        self._physics_catch_up()
+        alloc_len = self._alloc_len_from_cdb(cdb)
+        # Revert 0x01 forcing.
+        # Try mapping Vacuum Status to byte 3?
+        sim_status = bytearray(max(alloc_len, 4))
+        # sim_status[0] = 0x00
+
+        # Map states to see if any triggers "Connected"
+        if self.state.get("ht_status", 0):
+            sim_status[1] |= 0x01
+        if self.state.get("vacuum_status", 0) == 3:  # Ready
+            sim_status[2] |= 0x01  # Guessing byte 2? or 3?
+            # Let's try reflecting it in byte 3 (which aligns with 0xC4 01 return?)
+            sim_status[3] = self.state["vacuum_status"]
+
+        response = self._build_response(sim_status, xfer_len, fallback_len=alloc_len)
+        logger.info(f"CMD: GetLegacyStatus -> {response.hex()}")
+        return response, 1
+
+    # --- [0xC8] Lens Read ---
+
+    def _cmd_get_mag(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", self.state["mag_index"])
+        logger.info("CMD: GetMag")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_wd(self, cdb, direction, data_out, xfer_len):
+        response = struct.pack("<Hxx", 0)
+        logger.info("CMD: GetWD")
+        return self._build_response(response, xfer_len, fallback_len=4), 1
+
+    def _cmd_get_lens_value(self, cdb, direction, data_out, xfer_len):
+        logger.info("CMD: GetLensValue")
+        return self._build_response(b"\x00\x00\x00\x00", xfer_len, fallback_len=4), 1
+
+    # --- [0xCB] Stage Read ---
+
+    def _cmd_get_stage_pos(self, cdb, direction, data_out, xfer_len):
+        if self.physics:
+            # Packed by the last physics tick (run now if the stage moves).
+            self._physics_catch_up()
             response = self._build_response(
-                payload, xfer_len, fallback_len=len(payload)
+                self.physics.stage_bytes, xfer_len, fallback_len=20
             )
             logger.info("CMD: GetStagePosAll")
+            return response, 1
+        payload = struct.pack(
+            "<5i",
+            self.state["stage_x"],
+            self.state["stage_y"],
+            self.state["stage_z"],
+            self.state["stage_r"],
+            self.state["stage_t"],
+        )
+        response = self._build_response(payload, xfer_len, fallback_len=len(payload))
+        logger.info("CMD: GetStagePosAll")
+        return response, 1
+
+    # --- [0x09] Stage Control ---
+
+    def _cmd_stage_move_abs(self, cdb, direction, data_out, xfer_len):
+        if not self.physics:
+            return self._cmd_default(cdb, direction, data_out, xfer_len)
+        # Target layout assumed to mirror the CB read: <5i x, y, z, r, t,
+        # either as the data-out payload or trailing the CDB when the move
+        # arrives FA-wrapped. Only the stage model acts on it.
+        payload = data_out if data_out and len(data_out) >= 20 else cdb[6:]
+        if len(payload) < 20:
+            logger.info("CMD: StageMoveAbs (no target)")
+            return b"", 1
+        target = struct.unpack_from("<5i", payload)
+        logger.info(f"CMD: StageMoveAbs -> {target}")
+        self._physics_sync()
+        self.physics.move_stage(target)
+        self._stage_moving = True
+        self._physics_tick()
+        return b"", 1
+
+    # --- [0xD0] Status Block ---
+
+    def _cmd_get_status_block(self, cdb, direction, data_out, xfer_len):
+        response = self._build_response(
+            self._build_status_block(), xfer_len, fallback_len=128
+        )
+        logger.info("CMD: GetStatusBlock")
+        return response, 1
 
-        # --- [0xD0] Status Block ---
-        elif opcode == 0xD0:
-            response = self._build_response(
-                self._build_status_block(), xfer_len, fallback_len=128
-            )
-            logger.info("CMD: GetStatusBlock")
-
-        # --- [0xDE] FIS Read ---
-        elif opcode == 0xDE:
-            response = self._build_response(b"", xfer_len, fallback_len=4)
-            logger.info("CMD: GetFis")
-
-        # --- [0xFA] Wrapper ---
-        elif opcode == 0xFA:
-            if data_out:
-                if data_out[0] != 0xFA:
-                    self.process_scsi_command(
-                        data_out, direction=0, data_out=None, xfer_len=0
-                    )
-                self._publish_from_cdb(data_out)
-            response = self._build_response(b"", xfer_len, fallback_len=0)
-            logger.info("CMD: Generic10_Wrapper")
+    # --- [0xDE] FIS Read ---
+
+    def _cmd_get_fis(self, cdb, direction, data_out, xfer_len):
+        logger.info("CMD: GetFis")
+        return self._build_response(b"", xfer_len, fallback_len=4), 1
+
+    # --- [0xFA] Wrapper ---
+
+    def _cmd_fa_wrapper(self, cdb, direction, data_out, xfer_len):
+        if data_out:
+            if data_out[0] != 0xFA:
+                # Straight to the handler: the wrapped command has no reply of
+                # its own to replay, and this runs under the state lock.
+                self._dispatch(data_out, 0, None, 0)
+            self._publish_from_cdb(data_out)
+        logger.info("CMD: Generic10_Wrapper")
+        return self._build_response(b"", xfer_len, fallback_len=0), 1
+
+    # --- [0xE0] Write LUT ---
 
-        # --- [0xE0] Write LUT ---
-        elif opcode == 0xE0:
-            logger.info("CMD: WriteLUT")
+    def _cmd_write_lut(self, cdb, direction, data_out, xfer_len):
+        logger.info("CMD: WriteLUT")
+        return b"", 1
 
-        # --- [0xED] Large Data Read ---
-        elif opcode == 0xED:
-            response = self._build_response(b"", xfer_len, fallback_len=0)
+    # --- [0xED] Large Data Read ---
+
+    def _cmd_read_sem_data(self, cdb, direction, data_out, xfer_len):
+        if not HAS_NUMPY or len(cdb) < 2 or cdb[1] != 0x82 or not xfer_len:
             logger.info("CMD: ReadSemData")
+            return self._build_response(b"", xfer_len, fallback_len=0), 1
+        response = self._read_image_stream(xfer_len)
+        logger.info(f"CMD: ReadSemData -> {len(response)} bytes")
+        return response, 1
+
+    def _read_image_stream(self, length):
+        """Next `length` bytes of the synthetic image stream (8-bit, row-major)."""
+        if self.image_synth is None:
+            self.image_synth = SemImageSynth(*self.image_size)
+        out = bytearray()
+        while len(out) < length:
+            if self._image_pos >= len(self._image_frame):
+                self._image_frame = self.image_synth.render(
+                    self.state["mag_index"], self.state["scan_speed"]
+                )
+                self._image_pos = 0
+            take = min(length - len(out), len(self._image_frame) - self._image_pos)
+            out += self._image_frame[self._image_pos : self._image_pos + take]
+            self._image_pos += take
+        return bytes(out)
 
-        # --- Default Fallback ---
-        else:
-            # If it's a read command (checking group C* usually), return dummy zeros
-            if (
-                (opcode & 0xF0) == 0xC0
-                or (opcode & 0xF0) == 0xD0
-                or (opcode & 0xF0) == 0xE0
-            ):
-                if opcode == 0xC0 and data_out and len(data_out) > 0:
-                    response = self._build_response(
-                        data_out, xfer_len, fallback_len=len(data_out)
-                    )
+    # --- Default Fallback ---
+
+    def _cmd_default(self, cdb, direction, data_out, xfer_len):
+        opcode = cdb[0]
+        debug = logger.isEnabledFor(logging.DEBUG)
+        hex_cdb = cdb.hex(" ").upper() if debug else ""
+        # If it's a read command (checking group C* usually), return dummy zeros
+        if (opcode & 0xF0) in (0xC0, 0xD0, 0xE0):
+            if opcode == 0xC0 and data_out and len(data_out) > 0:
+                response = self._build_response(
+                    data_out, xfer_len, fallback_len=len(data_out)
+                )
+                if debug:
                     logger.debug(
                         f"CMD: Unknown WriteAck {hex_cdb} -> echo {len(response)} bytes"
                     )
-                    return response, status
-                alloc_len = self._alloc_len_from_cdb(cdb)
-                response = self._build_response(b"", xfer_len, fallback_len=alloc_len)
+                return response, 1
+            alloc_len = self._alloc_len_from_cdb(cdb)
+            response = self._build_response(b"", xfer_len, fallback_len=alloc_len)
+            if debug:
                 logger.debug(f"CMD: Unknown Read {hex_cdb} -> {alloc_len} bytes")
-            else:
-                logger.debug(f"CMD: Unknown Write {hex_cdb}")
-
-        # For known pure write commands, do not return payload bytes.
-        # Some legacy opcodes (e.g. C0/C3 variants) behave like write+read,
-        # so keep their synthesized response paths intact.
-        if direction == 2 and opcode in {0xC2, 0xE0, 0xFA}:
-            return b"", status
+            return response, 1
 
-        return response, status
+        if debug:
+            logger.debug(f"CMD: Unknown Write {hex_cdb}")
+        return b"", 1
+
+
+def bench_dispatch(iterations=200000, log_file="logs/sem_session_20260201_220324.log"):
+    """
+    Emulated commands/second through process_scsi_command, using the CDB mix
+    from a captured session. Handler INFO logging is silenced so the number
+    reflects dispatch + response building, not the console.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), log_file)
+    cdbs = [
+        rec.cdb
+        for rec in read_session(path)
+        if isinstance(rec, LogEntry) and rec.direction == "CMD" and rec.cdb
+    ]
+    if not cdbs:
+        logger.error(f"No CDBs found in {path}")
+        return 0.0
+
+    # No sockets, no physics, and a clock nothing runs against: only the
+    # dispatcher and the handlers are timed.
+    emu = VirtualSEM(port=0, clock=SimulatedClock(), ipc_endpoint=None, physics=False)
+    # Keep the mix's vacuum/HT commands from spawning transition timers.
+    emu._schedule_state_update = lambda key, value, delay_s: None
+    prev_level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        n = len(cdbs)
+        t0 = time.perf_counter()
+        for i in range(iterations):
+            cdb = cdbs[i % n]
+            emu.process_scsi_command(cdb, direction=1, xfer_len=4)
+        elapsed = time.perf_counter() - t0
+    finally:
+        logger.setLevel(prev_level)
+        emu.stop()
+
+    rate = iterations / elapsed
+    print(
+        f"Dispatch: {iterations} commands ({len(set(cdbs))} distinct CDBs from {log_file}) "
+        f"in {elapsed:.3f}s -> {rate:,.0f} cmds/s"
+    )
+    return rate
 
 
 if __name__ == "__main__":
-    emu = VirtualSEM()
-    emu.start()
+    parser = argparse.ArgumentParser(description="Virtual JEOL SEM (ASPI over TCP)")
+    parser.add_argument(
+        "--bench",
+        type=int,
+        metavar="N",
+        help="benchmark N emulated commands through the dispatcher and exit",
+    )
+    parser.add_argument(
+        "--sim-clock",
+        action="store_true",
+        help="simulated time: skip evac/vent/HT delays whenever the client is idle "
+        "(idle is detected in real time, so TCP sessions are not exactly repeatable)",
+    )
+    parser.add_argument(
+        "--no-physics",
+        action="store_true",
+        help="instant stage moves and fixed evac/vent/HT delays",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="LOG",
+        help="answer from a captured session log, synthetic handlers on a miss",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="scale recorded reply timing (1 = original, 0 = no delay)",
+    )
+    parser.add_argument(
+        "--faults",
+        metavar="CONFIG",
+        help="JSON fault plan: per-opcode latency, CHECK CONDITION, drops",
+    )
+    parser.add_argument(
+        "--fault-seed", type=int, help="override the fault plan's RNG seed"
+    )
+    parser.add_argument(
+        "--journal", metavar="PATH", help="append every state change to PATH (JSONL)"
+    )
+    parser.add_argument(
+        "--restore", metavar="SNAPSHOT", help="start from a saved checkpoint"
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="PATH",
+        help="write a checkpoint to PATH on SIGUSR1 and at shutdown",
+    )
+    args = parser.parse_args()
+
+    if args.bench:
+        bench_dispatch(args.bench)
+        sys.exit(0)
+
+    emu = VirtualSEM(
+        clock=SimulatedClock() if args.sim_clock else None,
+        physics=False if args.no_physics else None,
+        replay=SessionReplay(args.replay, args.replay_speed) if args.replay else None,
+        faults=(
+            FaultInjector.from_file(args.faults, seed=args.fault_seed)
+            if args.faults
+            else None
+        ),
+        journal=args.journal,
+    )
+    if args.restore:
+        emu.restore(args.restore)
+    if args.snapshot:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: emu.save_snapshot(args.snapshot))
+    try:
+        emu.start()
+    finally:
+        if args.snapshot:
+            emu.save_snapshot(args.snapshot)
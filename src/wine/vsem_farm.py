@@ -0,0 +1,182 @@
+import argparse
+import json
+import multiprocessing as mp
+import queue
+import signal
+import sys
+
+
+def _serve(index, name, sim_clock, log_dir, ready, faults=None, restore=None):
+    """Child process: one isolated VirtualSEM on OS-assigned ports."""
+    # Imported here so the parent never builds an emulator (or a ZMQ
+    # context) of its own. Everything up to bind() is inside the try, so a
+    # bad fault config or snapshot is reported instead of a silent timeout.
+    emu = None
+    try:
+        from virtual_sem import VirtualSEM
+        from sim_scheduler import SimulatedClock
+        from fault_injection import FaultInjector
+
+        emu = VirtualSEM(
+            port=0,
+            clock=SimulatedClock() if sim_clock else None,
+            ipc_endpoint="tcp://127.0.0.1:*",
+            name=name,
+            log_dir=log_dir,
+            faults=FaultInjector.from_file(faults) if faults else None,
+        )
+        if restore:
+            emu.restore(restore)
+        host, port = emu.bind()
+    except Exception as e:
+        if emu is not None:
+            emu.stop()
+        ready.put({"index": index, "error": f"{type(e).__name__}: {e}"})
+        return
+    # Ctrl-C reaches the whole process group; shutdown is driven by the
+    # parent's terminate() instead.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: emu.stop())
+    ready.put(
+        {
+            "index": index,
+            "name": name,
+            "host": host,
+            "port": port,
+            "ipc": emu.ipc_endpoint,
+            "pid": mp.current_process().pid,
+        }
+    )
+    emu.start()
+
+
+class VSEMFarm:
+    """
+    N independent VirtualSEM instances, one process each.
+
+    Every instance binds its ASPI port and ZMQ PUB endpoint dynamically and
+    has its own state, scheduler and session logs (tagged with its name),
+    so parallel test workers can each take one without sharing anything.
+    Endpoints are available in self.instances once start() returns.
+    """
+
+    def __init__(
+        self,
+        count,
+        sim_clock=False,
+        log_dir="logs",
+        prefix="farm",
+        faults=None,
+        restore=None,
+    ):
+        self.count = count
+        self.sim_clock = sim_clock
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.faults = faults
+        self.restore = restore
+        self.instances = []
+        self._procs = []
+        # spawn: no fork of parent threads/sockets into the children.
+        self._ctx = mp.get_context("spawn")
+
+    def start(self, timeout=30.0):
+        ready = self._ctx.Queue()
+        for i in range(self.count):
+            proc = self._ctx.Process(
+                target=_serve,
+                args=(
+                    i,
+                    f"{self.prefix}{i}",
+                    self.sim_clock,
+                    self.log_dir,
+                    ready,
+                    self.faults,
+                    self.restore,
+                ),
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+
+        found = {}
+        try:
+            while len(found) < self.count:
+                info = ready.get(timeout=timeout)
+                if "error" in info:
+                    raise RuntimeError(
+                        f"Instance {info['index']} failed to start: {info['error']}"
+                    )
+                found[info["index"]] = info
+        except queue.Empty:
+            self.stop()
+            raise RuntimeError(
+                f"Only {len(found)}/{self.count} instances came up in {timeout:.0f}s"
+            )
+        except Exception:
+            self.stop()
+            raise
+
+        self.instances = [found[i] for i in range(self.count)]
+        return self.instances
+
+    def stop(self, timeout=5.0):
+        for proc in self._procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in self._procs:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.kill()
+        self._procs = []
+        self.instances = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run N isolated Virtual SEM instances on dynamic ports"
+    )
+    parser.add_argument("-n", "--count", type=int, default=mp.cpu_count())
+    parser.add_argument("--sim-clock", action="store_true", help="simulated time")
+    parser.add_argument("--log-dir", default="logs")
+    parser.add_argument("--faults", metavar="CONFIG", help="fault plan for every instance")
+    parser.add_argument(
+        "--restore", metavar="SNAPSHOT", help="start every instance from a checkpoint"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print endpoints as one JSON line"
+    )
+    args = parser.parse_args()
+
+    farm = VSEMFarm(
+        args.count,
+        sim_clock=args.sim_clock,
+        log_dir=args.log_dir,
+        faults=args.faults,
+        restore=args.restore,
+    )
+    farm.start()
+    if args.json:
+        print(json.dumps(farm.instances), flush=True)
+    else:
+        for inst in farm.instances:
+            print(
+                f"{inst['name']}: aspi={inst['host']}:{inst['port']} "
+                f"ipc={inst['ipc']} pid={inst['pid']}",
+                flush=True,
+            )
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        signal.pause()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        farm.stop()
+        sys.exit(0)